@@ -0,0 +1,97 @@
+"""
+Benchmark: bytes on the wire and end-to-end latency of compressed responses.
+
+Requests the structure and the contents of every text file of a real project
+through the Core app, once per content coding, and reports the body size and
+the server-side time. End-to-end latency adds the transfer time over a link
+of the given bandwidth and round-trip time, modelling the ngrok tunnel.
+
+Usage (from the repository root):
+    python core/benchmarks/bench_compression.py [PROJECT_PATH] [--mbps 20] [--rtt-ms 80]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from src.compression import available_encodings  # noqa: E402  pylint: disable=C0413
+
+TEXT_EXTENSIONS = ('.py', '.md', '.txt', '.json', '.yml', '.yaml', '.toml', '.js',
+                   '.ts', '.sh', '.cfg', '.ini', '.env')
+BATCH_SIZE = 50
+
+
+def build_client(project_path):
+    os.environ['PROJECT_PATH'] = project_path
+    os.environ.setdefault('AGENTIGNORE_FILES', '.agentignore,.gitignore')
+    os.environ['FILE_INDEX_ENABLED'] = 'false'
+    from src.app import CodeQueryAPI  # pylint: disable=C0415
+    api = CodeQueryAPI(use_ngrok=False)
+    logging.disable(logging.CRITICAL)  # Per-request logging would dominate the timings
+    return api, api.app.test_client()
+
+
+def text_files(api):
+    paths = []
+    for folder, _, filenames in api.file_service.walk('.'):
+        for name in filenames:
+            if name.endswith(TEXT_EXTENSIONS):
+                paths.append(os.path.normpath(os.path.join(folder, name)))
+    return paths
+
+
+def measure(send, encoding, repeat=5):
+    headers = {"Accept-Encoding": encoding} if encoding != 'identity' else {}
+    best, size = None, 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = send(headers)
+        size = len(response.get_data())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return size, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('project_path', nargs='?', default='.')
+    parser.add_argument('--mbps', type=float, default=20.0,
+                        help='Tunnel bandwidth in megabits per second')
+    parser.add_argument('--rtt-ms', type=float, default=80.0,
+                        help='Tunnel round-trip time in milliseconds')
+    args = parser.parse_args()
+
+    api, client = build_client(args.project_path)
+    paths = text_files(api)
+    batches = [paths[i:i + BATCH_SIZE] for i in range(0, len(paths), BATCH_SIZE)]
+    print(f"Project: {os.path.abspath(args.project_path)} ({len(paths)} text files)")
+    print(f"Link: {args.mbps:g} Mbit/s, {args.rtt_ms:g} ms RTT\n")
+
+    requests_to_run = {
+        "GET /files/structure": [lambda headers: client.get(
+            '/files/structure', headers=headers)],
+        f"POST /files/content x{len(batches)}": [
+            (lambda batch: lambda headers: client.post(
+                '/files/content', json={"file_paths": batch}, headers=headers))(batch)
+            for batch in batches],
+    }
+
+    print(f"{'request':<28}{'encoding':<10}{'bytes':>12}{'server ms':>12}"
+          f"{'end-to-end ms':>16}")
+    for name, sends in requests_to_run.items():
+        for encoding in ['identity'] + available_encodings():
+            total_bytes, total_server = 0, 0.0
+            for send in sends:
+                size, elapsed = measure(send, encoding)
+                total_bytes += size
+                total_server += elapsed
+            transfer = total_bytes * 8 / (args.mbps * 1e6)
+            end_to_end = total_server + transfer + len(sends) * args.rtt_ms / 1000
+            print(f"{name:<28}{encoding:<10}{total_bytes:>12,}"
+                  f"{total_server * 1000:>12.1f}{end_to_end * 1000:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
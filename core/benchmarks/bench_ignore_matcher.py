@@ -0,0 +1,174 @@
+"""
+Micro-benchmark: compiled IgnoreMatcher vs. the previous pathspec lookup.
+
+Usage (from the repository root):
+    python core/benchmarks/bench_ignore_matcher.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import warnings
+
+import pathspec
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from src.ignore_matcher import IgnoreMatcher  # noqa: E402  pylint: disable=C0413
+
+# A realistic .gitignore for a mixed Python/Node monorepo
+GITIGNORE = """
+# Byte-compiled / optimized / DLL files
+__pycache__/
+*.py[cod]
+*$py.class
+*.so
+.Python
+build/
+develop-eggs/
+dist/
+downloads/
+eggs/
+.eggs/
+lib64/
+parts/
+sdist/
+var/
+wheels/
+*.egg-info/
+.installed.cfg
+*.egg
+MANIFEST
+*.manifest
+*.spec
+pip-log.txt
+pip-delete-this-directory.txt
+htmlcov/
+.tox/
+.nox/
+.coverage
+.coverage.*
+.cache
+nosetests.xml
+coverage.xml
+*.cover
+.hypothesis/
+.pytest_cache/
+*.mo
+*.pot
+*.log
+local_settings.py
+db.sqlite3
+instance/
+.webassets-cache
+.scrapy
+docs/_build/
+target/
+.ipynb_checkpoints
+.python-version
+celerybeat-schedule
+*.sage.py
+.env
+.venv
+env/
+venv/
+ENV/
+.spyderproject
+.ropeproject
+/site
+.mypy_cache/
+.dmypy.json
+dmypy.json
+node_modules/
+jspm_packages/
+bower_components/
+.npm
+.eslintcache
+.yarn-integrity
+.next/
+.nuxt/
+.vuepress/dist
+.serverless/
+.fusebox/
+.dynamodb/
+*.tsbuildinfo
+coverage/
+.DS_Store
+Thumbs.db
+*.swp
+*~
+!keep.log
+"""
+
+DIRS = ["src", "services/api", "services/worker", "web/components", "web/pages",
+        "libs/core", "libs/utils", "tests/unit", "tests/integration", "scripts",
+        "web/node_modules/react", "services/api/__pycache__", "venv/lib", "build",
+        "docs/_build/html", "data/fixtures"]
+NAMES = ["main.py", "utils.py", "index.ts", "App.tsx", "README.md", "module.pyc",
+         "server.log", "config.yaml", "keep.log", "styles.css", "Makefile",
+         "package.json", "schema.sql", "notes.txt", "handler.go"]
+
+
+def make_paths(count, seed=42):
+    """Generate `count` (path, is_dir) pairs resembling a real project."""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        base = rng.choice(DIRS)
+        if i % 10 == 0:
+            paths.append((f"{base}/pkg{i % 97}", True))
+        else:
+            paths.append((f"{base}/d{i % 53}/{rng.choice(NAMES)}", False))
+    return paths
+
+
+def bench(label, fn, paths, repeat=3):
+    """Return the best wall time of `repeat` runs of `fn` over `paths`."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path, is_dir in paths:
+            fn(path, is_dir)
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<22} {best * 1000:9.1f} ms  "
+          f"({best / len(paths) * 1e6:.2f} us/path)")
+    return best
+
+
+def main():
+    warnings.simplefilter('ignore', DeprecationWarning)
+    with tempfile.TemporaryDirectory() as tmp:
+        ignore_file = os.path.join(tmp, '.gitignore')
+        with open(ignore_file, 'w', encoding='utf-8') as f:
+            f.write(GITIGNORE)
+
+        # The previous code path: parse the spec, then match pattern by pattern
+        with open(ignore_file, 'r', encoding='utf-8') as f:
+            spec = pathspec.PathSpec.from_lines('gitwildmatch', f)
+
+        def pathspec_match(path, is_dir):
+            return spec.match_file(path + '/' if is_dir else path)
+
+        matcher = IgnoreMatcher([ignore_file])
+        matcher.refresh()
+
+        for count in (10_000, 100_000):
+            paths = make_paths(count)
+            mismatches = sum(1 for path, is_dir in paths
+                             if pathspec_match(path, is_dir) != matcher.match(path, is_dir))
+            print(f"{count:,} paths ({len(spec.patterns)} patterns, "
+                  f"{mismatches} mismatches)")
+            baseline = bench("pathspec", pathspec_match, paths)
+            compiled = bench("IgnoreMatcher", matcher.match, paths)
+            print(f"  speedup                {baseline / compiled:9.1f}x")
+
+        # Per-request cost of checking whether the rules are still fresh
+        start = time.perf_counter()
+        for _ in range(1000):
+            matcher.refresh()
+        print(f"refresh() with unchanged files: "
+              f"{(time.perf_counter() - start) * 1000:.1f} us/call")
+
+
+if __name__ == '__main__':
+    main()
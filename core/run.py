@@ -1,4 +1,5 @@
 import os
+import signal
 import sys
 import logging
 import threading
@@ -35,6 +36,9 @@ def main():
         ngrok_thread.daemon = True
         ngrok_thread.start()
 
+        # Exit cleanly on `docker stop`, so the tree index snapshot gets saved
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
         # Start the Flask application
         logger.info("Starting Flask application...")
         try:
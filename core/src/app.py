@@ -1,11 +1,14 @@
 import os
+import json
 import logging
 import pathspec
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 
 
 from src.ngrok_manager import NgrokManager
+from src.compression import ResponseCompressor
 from src.file_service import FileService
+from src.index_snapshot import default_snapshot_path
 
 
 class CodeQueryAPI:
@@ -15,6 +18,40 @@ class CodeQueryAPI:
         # Initialize environment variables and configurations
         self.project_path = os.getenv('PROJECT_PATH', './')
         self.agentignore_files = os.getenv('AGENTIGNORE_FILES', '[]')
+        self.large_file_threshold = int(
+            os.getenv('LARGE_FILE_THRESHOLD', str(1024 * 1024)))
+        self.content_byte_budget = int(
+            os.getenv('CONTENT_BYTE_BUDGET', str(8 * 1024 * 1024)))
+        self.content_cache_bytes = int(
+            os.getenv('CONTENT_CACHE_BYTES', str(64 * 1024 * 1024)))
+        self.grep_workers = int(os.getenv('GREP_WORKERS') or 0) or None
+        self.file_read_workers = int(os.getenv('FILE_READ_WORKERS', '8'))
+        self.file_index_enabled = os.getenv(
+            'FILE_INDEX_ENABLED', 'true').lower() == 'true'
+        self.file_index_rescan_interval = float(
+            os.getenv('FILE_INDEX_RESCAN_INTERVAL', '30'))
+        self.file_index_snapshot = os.getenv('FILE_INDEX_SNAPSHOT')
+        if self.file_index_snapshot is None:
+            self.file_index_snapshot = default_snapshot_path(self.project_path)
+        elif self.file_index_snapshot and not os.path.isabs(self.file_index_snapshot):
+            # Relative to the project, not to wherever the Core was started from
+            self.file_index_snapshot = os.path.join(
+                self.project_path, self.file_index_snapshot)
+        self.file_index_snapshot_interval = float(
+            os.getenv('FILE_INDEX_SNAPSHOT_INTERVAL', '300'))
+        self.change_journal_size = int(
+            os.getenv('CHANGE_JOURNAL_SIZE', '10000'))
+        self.file_enumeration = os.getenv('FILE_ENUMERATION', 'walk').lower()
+        self.git_untracked_files = os.getenv(
+            'GIT_UNTRACKED_FILES', 'false').lower() == 'true'
+        self.follow_symlinks = os.getenv(
+            'FOLLOW_SYMLINKS', 'false').lower() == 'true'
+        self.structure_page_size = int(
+            os.getenv('STRUCTURE_PAGE_SIZE', '1000'))
+        self.compression_enabled = os.getenv(
+            'COMPRESSION_ENABLED', 'true').lower() == 'true'
+        self.compression_min_size = int(
+            os.getenv('COMPRESSION_MIN_SIZE', '1024'))
 
         # Log project path and ignore files
         self.logger = logging.getLogger('flask_app')
@@ -23,12 +60,27 @@ class CodeQueryAPI:
 
         # Initialize FileService with project configurations
         self.file_service = FileService(
-            self.project_path, self.agentignore_files)
+            self.project_path, self.agentignore_files,
+            rescan_interval=self.file_index_rescan_interval,
+            follow_symlinks=self.follow_symlinks,
+            large_file_threshold=self.large_file_threshold,
+            content_byte_budget=self.content_byte_budget,
+            read_workers=self.file_read_workers,
+            content_cache_bytes=self.content_cache_bytes,
+            grep_workers=self.grep_workers,
+            snapshot_path=self.file_index_snapshot or None,
+            snapshot_interval=self.file_index_snapshot_interval,
+            change_journal_size=self.change_journal_size,
+            enumeration=self.file_enumeration,
+            include_untracked=self.git_untracked_files)
+        if self.file_index_enabled:
+            self.file_service.start_index()
 
         # Initialize Flask app and logging
         self.app = Flask(__name__)
         self.configure_logging()
         self.setup_routes()
+        self.setup_compression()
         self.setup_log_filters()
 
         if use_ngrok:
@@ -119,6 +171,43 @@ class CodeQueryAPI:
         normalized_path = os.path.normpath(path)
         return ignore_spec.match_file(normalized_path) if ignore_spec else False
 
+    def _ndjson(self, records):
+        """Serialize records as newline-delimited JSON while they are produced."""
+        try:
+            for record in records:
+                yield json.dumps(record) + '\n'
+        except Exception as e:  # pylint: disable=W0718
+            # Headers are already sent, so report the failure in-band
+            self.logger.error("Error while streaming records: %s", str(e))
+            yield json.dumps({"error": "Unexpected error", "details": str(e)}) + '\n'
+
+    @staticmethod
+    def _int_arg(name):
+        """Read an optional positive integer query parameter."""
+        value = request.args.get(name)
+        if value is None:
+            return None
+        if not value.isdigit() or int(value) < 1:
+            raise ValueError(f"'{name}' must be a positive integer")
+        return int(value)
+
+    @staticmethod
+    def _not_modified(etag):
+        """Return 304 Not Modified if the client's If-None-Match holds `etag`, else None."""
+        # Weak comparison, so compressed (weakly tagged) copies match as well
+        if etag is None or not request.if_none_match.contains_weak(etag):
+            return None
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    @staticmethod
+    def _with_etag(response, etag):
+        """Tag a response with a strong ETag, if there is one."""
+        if etag is not None:
+            response.set_etag(etag)
+        return response
+
     def setup_routes(self):
         """Define all the routes for the Flask app."""
 
@@ -133,12 +222,50 @@ class CodeQueryAPI:
             self.logger.info(
                 "Incoming GET /files/structure request: %s", request.headers)
             try:
+                path = request.args.get('path', '.')
+                depth = self._int_arg('depth')
+                limit = self._int_arg('limit')
+                cursor = request.args.get('cursor')
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+
+            try:
+                ndjson = request.accept_mimetypes.best_match(
+                    ['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+                etag = self.file_service.structure_etag(
+                    path, depth, limit, cursor, ndjson)
+                not_modified = self._not_modified(etag)
+                if not_modified is not None:
+                    self.logger.info("File structure not modified")
+                    return not_modified
+
+                if ndjson:
+                    self.logger.info(
+                        "Streaming FileService.iter_structure_records()...")
+                    records = self.file_service.iter_structure_records(
+                        path, depth)
+                    return self._with_etag(
+                        Response(stream_with_context(self._ndjson(records)),
+                                 mimetype='application/x-ndjson'), etag)
+
+                if limit is not None or cursor:
+                    self.logger.info(
+                        "Calling FileService.get_structure_page()...")
+                    page = self.file_service.get_structure_page(
+                        path, depth, cursor, limit or self.structure_page_size)
+                    return self._with_etag(jsonify(page), etag)
+
                 self.logger.info(
                     "Calling FileService.get_directory_structure()...")
-                structure = self.file_service.get_directory_structure()
-                self.logger.info("File structure retrieved: %s", structure)
-                return jsonify(structure)
-            except (FileNotFoundError, IOError, ValueError, KeyError) as e:
+                structure = self.file_service.get_directory_structure(
+                    path, depth)
+                self.logger.debug("File structure retrieved: %s", structure)
+                return self._with_etag(jsonify(structure), etag)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            except FileNotFoundError as e:
+                return jsonify({"error": str(e)}), 404
+            except (IOError, KeyError) as e:
                 self.logger.error("File-related or expected error: %s", str(e))
                 return jsonify({"error": "File-related or expected error", "details": str(e)}), 500
             except Exception as e:  # pylint: disable=W0718
@@ -155,6 +282,10 @@ class CodeQueryAPI:
             self.logger.info("Request data: %s", data)
 
             file_paths = data.get('file_paths', [])
+            mode = data.get('mode', 'full')
+            known_hashes = data.get('known_hashes')
+            max_tokens = data.get('max_tokens')
+            priority = data.get('priority')
             if not file_paths:
                 self.logger.warning(
                     "No file paths provided in the request data.")
@@ -164,13 +295,28 @@ class CodeQueryAPI:
             self.logger.info(
                 "Calling FileService.get_file_content() for paths: %s", file_paths
             )
-            content, status = self.file_service.get_file_content(file_paths)
+            try:
+                etag = self.file_service.content_etag(
+                    file_paths, mode, known_hashes, max_tokens, priority)
+                not_modified = self._not_modified(etag)
+                if not_modified is not None:
+                    self.logger.info("File content not modified")
+                    return not_modified
+                content, status = self.file_service.get_file_content(
+                    file_paths, mode, known_hashes, max_tokens, priority)
+            except ValueError as e:
+                self.logger.warning("Invalid file request: %s", str(e))
+                return jsonify({"error": str(e)}), 400
 
             # Log each file's path and the number of characters in its content
             for file_path, file_data in content.items():
                 file_content = file_data.get('content') if isinstance(
                     file_data, dict) else file_data
-                if isinstance(file_content, str):
+                if isinstance(file_data, dict) and file_data.get('unchanged'):
+                    self.logger.info("File unchanged: %s", file_path)
+                elif isinstance(file_data, dict) and file_data.get('packed') == 'omitted':
+                    self.logger.info("File omitted by the token budget: %s", file_path)
+                elif isinstance(file_content, str):
                     content_length = len(file_content)
                     self.logger.info(
                         "Retrieved file: %s with %d characters", file_path, content_length
@@ -180,7 +326,118 @@ class CodeQueryAPI:
                         "Unexpected format for file content: %s", file_path
                     )
 
-            return jsonify(content), status
+            response = jsonify(content)
+            response.status_code = status
+            return self._with_etag(response, etag if status == 200 else None)
+
+        @self.app.route('/files/search', methods=['POST'])
+        def search_files():
+            """Searches the text of the project's files for AI analysis."""
+            data = request.get_json(silent=True)
+            self.logger.info("Incoming POST /files/search request: %s", data)
+            if not isinstance(data, dict):
+                return jsonify({"error": "Request body must be a JSON object"}), 400
+            try:
+                result = self.file_service.search_files(data)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            except FileNotFoundError as e:
+                return jsonify({"error": str(e)}), 404
+            self.logger.info("Search for %r matched %d lines in %d files",
+                             data.get('query'), len(result["matches"]),
+                             result["files_scanned"])
+            return jsonify(result), 200
+
+        @self.app.route('/files/grep', methods=['POST'])
+        def grep_files():
+            """Streams the lines matching a regular expression as NDJSON."""
+            data = request.get_json(silent=True)
+            self.logger.info("Incoming POST /files/grep request: %s", data)
+            if not isinstance(data, dict):
+                return jsonify({"error": "Request body must be a JSON object"}), 400
+            try:
+                records = self.file_service.grep_files(data)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            except FileNotFoundError as e:
+                return jsonify({"error": str(e)}), 404
+            return Response(stream_with_context(self._ndjson(records)),
+                            mimetype='application/x-ndjson')
+
+        @self.app.route('/symbols/search', methods=['GET'])
+        def search_symbols():
+            """Finds class, function and type definitions by name."""
+            self.logger.info("Incoming GET /symbols/search request: %s", request.args)
+            query = request.args.get('query', '')
+            if not query:
+                return jsonify({"error": "'query' is required"}), 400
+            try:
+                max_results = self._int_arg('max_results') or 50
+                result = self.file_service.search_symbols(
+                    query, kind=request.args.get('kind'),
+                    path=request.args.get('path', '.'),
+                    exact=request.args.get('exact', 'false').lower() == 'true',
+                    max_results=min(max_results, 1000))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            except FileNotFoundError as e:
+                return jsonify({"error": str(e)}), 404
+            return jsonify(result), 200
+
+        @self.app.route('/symbols/source', methods=['GET'])
+        def get_symbol_source():
+            """Returns only the source lines of a class or function."""
+            self.logger.info("Incoming GET /symbols/source request: %s", request.args)
+            name = request.args.get('name', '')
+            if not name:
+                return jsonify({"error": "'name' is required"}), 400
+            try:
+                result = self.file_service.get_symbol_source(
+                    name, path=request.args.get('path'))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            except FileNotFoundError as e:
+                return jsonify({"error": str(e)}), 404
+            return jsonify(result), 200
+
+        @self.app.route('/files/manifest', methods=['GET'])
+        def get_file_manifest():
+            """Lists every file with its size, mtime and content hash, for client-side caches."""
+            self.logger.info("Incoming GET /files/manifest request: %s", request.args)
+            try:
+                manifest = self.file_service.get_manifest(request.args.get('path', '.'))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            except FileNotFoundError as e:
+                return jsonify({"error": str(e)}), 404
+            return jsonify(manifest), 200
+
+        @self.app.route('/files/changes', methods=['GET'])
+        def get_file_changes():
+            """Returns the paths changed since a cursor, so clients need not re-read the structure."""
+            self.logger.info("Incoming GET /files/changes request: %s", request.args)
+            try:
+                since = self._int_arg('since')
+                limit = min(self._int_arg('limit') or 1000, 10000)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify(self.file_service.get_changes(since, limit)), 200
+
+        @self.app.route('/files/stats', methods=['GET'])
+        def get_file_stats():
+            """Reports the content cache counters, for sizing CONTENT_CACHE_BYTES."""
+            return jsonify({"content_cache": self.file_service.content_cache.stats(),
+                            "outline_cache": self.file_service.outline_cache.stats()}), 200
+
+    def setup_compression(self):
+        """Compress responses for clients that accept gzip or zstd."""
+        if not self.compression_enabled:
+            return
+        compressor = ResponseCompressor(self.compression_min_size)
+
+        @self.app.after_request
+        def compress_response(response):
+            return compressor.compress(request, response)
 
     def run(self):
         """Run the Flask application."""
@@ -192,3 +449,6 @@ class CodeQueryAPI:
         except Exception as e:
             self.logger.error(f"Failed to start Flask application: {str(e)}")
             raise
+        finally:
+            # Saves the tree index snapshot for the next start
+            self.file_service.stop_index()
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import deque
+
+
+class ChangeJournal:
+    """
+    Bounded in-memory journal of the changes applied to the tree index, for
+    clients that poll for what changed since their last look.
+
+    Every change gets a sequence number one above the previous one. Numbers
+    start at the journal's creation time in microseconds, so they keep
+    growing across restarts and a cursor from an earlier process is always
+    older than the journal. A cursor the journal cannot answer - older than
+    its oldest retained entry, from before a rebuild of the index, or ahead
+    of it - gets `resync_required` instead of a partial delta.
+
+    `handle_event` takes tree index events; paths excluded by
+    `is_excluded(rel_path, is_dir)` are not recorded. Rebuilds and rescans
+    of the whole index reset the journal.
+    """
+
+    def __init__(self, is_excluded, max_entries=10000):
+        self.is_excluded = is_excluded
+        self._entries = deque(maxlen=max_entries)
+        self._seq = time.time_ns() // 1000
+        # Cursors below this may have missed changes that are no longer journaled
+        self._floor = self._seq
+        self._lock = threading.Lock()
+
+    @property
+    def cursor(self):
+        """Sequence number of the latest change."""
+        with self._lock:
+            return self._seq
+
+    def handle_event(self, kind, rel_path, is_dir, dest_path=None):
+        """Record a tree index event."""
+        if kind in ('rebuilt', 'rescanned'):
+            # A rescan cannot see files edited in place, so nothing vouches for the gap
+            self.reset()
+            return
+        if kind not in ('created', 'deleted', 'modified', 'renamed'):
+            return
+        source_visible = not self.is_excluded(rel_path, is_dir)
+        if kind == 'renamed':
+            # Renames across the ignore rules show up as the visible side alone
+            dest_visible = not self.is_excluded(dest_path, is_dir)
+            if source_visible and not dest_visible:
+                kind, dest_path = 'deleted', None
+            elif dest_visible and not source_visible:
+                kind, rel_path, dest_path = 'created', dest_path, None
+                source_visible = True
+        if source_visible:
+            self.record(kind, rel_path, is_dir, dest_path)
+
+    def record(self, kind, rel_path, is_dir, dest_path=None):
+        """Append a change, merging it with an identical previous one."""
+        with self._lock:
+            self._seq += 1
+            if self._entries and self._entries[-1][1:4] == (kind, rel_path, is_dir) \
+                    and dest_path is None:
+                self._entries.pop()  # Repeated writes to one file
+            elif len(self._entries) == self._entries.maxlen:
+                self._floor = self._entries[0][0]
+            self._entries.append((self._seq, kind, rel_path, is_dir, dest_path))
+
+    def reset(self):
+        """Forget every change, so every existing cursor has to resync."""
+        with self._lock:
+            self._seq += 1
+            self._entries.clear()
+            self._floor = self._seq
+
+    def changes(self, since, limit=1000):
+        """
+        Return the changes after sequence number `since`, oldest first and
+        at most `limit` of them, with the cursor to pass next time.
+        """
+        with self._lock:
+            if since < self._floor or since > self._seq:
+                return {"changes": [], "cursor": self._seq,
+                        "resync_required": True, "has_more": False}
+            changes = [entry for entry in self._entries if entry[0] > since]
+            has_more = len(changes) > limit
+            changes = changes[:limit]
+            cursor = changes[-1][0] if has_more else self._seq
+        records = []
+        for seq, kind, rel_path, is_dir, dest_path in changes:
+            record = {"seq": seq, "kind": kind, "path": rel_path, "is_dir": is_dir}
+            if dest_path is not None:
+                record["dest_path"] = dest_path
+            records.append(record)
+        return {"changes": records, "cursor": cursor,
+                "resync_required": False, "has_more": has_more}
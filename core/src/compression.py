@@ -0,0 +1,139 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+# Large buffered bodies are compressed and flushed in pieces of this size
+STREAM_FLUSH_BYTES = 64 * 1024
+# Buffered bodies above this size are sent in compressed chunks as they are produced
+STREAM_BODY_BYTES = 1024 * 1024
+
+
+class _GzipCompressor:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush_block(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _ZstdCompressor:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush_block(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def available_encodings():
+    """Content codings this process can produce, most preferred first."""
+    return ['zstd', 'gzip'] if zstandard is not None else ['gzip']
+
+
+def new_compressor(encoding, level=None):
+    """Return a streaming compressor for 'gzip' or 'zstd'."""
+    if encoding == 'zstd':
+        return _ZstdCompressor(3 if level is None else level)
+    return _GzipCompressor(6 if level is None else level)
+
+
+def compress_chunks(chunks, encoding, level=None, flush_each=False):
+    """
+    Compress an iterable of byte chunks into a stream of compressed chunks.
+    Output is flushed every STREAM_FLUSH_BYTES of input, or after every chunk
+    with `flush_each`, so records of a slow producer reach the client as
+    soon as they are produced instead of sitting in the compressor.
+    """
+    compressor = new_compressor(encoding, level)
+    pending = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if not chunk:
+                continue
+            data = compressor.compress(chunk)
+            pending += len(chunk)
+            if flush_each or pending >= STREAM_FLUSH_BYTES:
+                data += compressor.flush_block()
+                pending = 0
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def _split(data, size):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+class ResponseCompressor:
+    """
+    Compresses Flask responses with the best content coding the client
+    accepts. Bodies below `min_size` bytes are sent as is, streamed bodies
+    are compressed as they are produced, and large buffered bodies are sent
+    as a stream of compressed chunks.
+    """
+
+    def __init__(self, min_size=1024, level=None):
+        self.min_size = min_size
+        self.level = level
+        self.encodings = available_encodings()
+
+    def _compressible(self, response):
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return False
+        if 'Content-Encoding' in response.headers or response.direct_passthrough:
+            return False
+        return (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)
+
+    def compress(self, request, response):
+        """Compress `response` for `request` in place and return it."""
+        if not self._compressible(response):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+
+        flush_each = response.is_streamed
+        if flush_each:
+            chunks = response.response
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            if len(data) <= STREAM_BODY_BYTES:
+                response.set_data(b''.join(compress_chunks([data], encoding, self.level)))
+                chunks = None
+            else:
+                chunks = _split(data, STREAM_FLUSH_BYTES)
+
+        if chunks is not None:
+            response.response = compress_chunks(chunks, encoding, self.level, flush_each)
+            response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = encoding
+        # The compressed bytes are a different representation of the same data
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,58 @@
+import threading
+from collections import OrderedDict
+
+
+class ContentCache:
+    """
+    Bounded LRU cache of decoded file contents keyed by file path. An entry
+    is only served while the file's mtime and size match the ones it was read
+    with, and least recently used entries are evicted once the cached files
+    add up to more than `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, full_path, mtime_ns, size):
+        """Return the cached content of a file, or None if absent or stale."""
+        with self._lock:
+            entry = self._entries.get(full_path)
+            if entry is None or entry[0] != mtime_ns or entry[1] != size:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(full_path)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, full_path, mtime_ns, size, content, cost=None):
+        """
+        Cache the content of a file read with the given mtime and size. The
+        entry counts `cost` bytes against the budget, the file's size unless
+        the content is derived from the file.
+        """
+        cost = size if cost is None else cost
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(full_path, None)
+            if previous is not None:
+                self._bytes -= previous[3]
+            self._entries[full_path] = (mtime_ns, size, content, cost)
+            self._bytes += cost
+            while self._bytes > self.max_bytes:
+                _, (_, _, _, evicted_cost) = self._entries.popitem(last=False)
+                self._bytes -= evicted_cost
+                self.evictions += 1
+
+    def stats(self):
+        """Return the hit, miss and eviction counters and the current usage."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "entries": len(self._entries),
+                    "bytes": self._bytes, "max_bytes": self.max_bytes}
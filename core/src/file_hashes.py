@@ -0,0 +1,47 @@
+import hashlib
+import os
+import threading
+
+HASH_ALGORITHM = 'sha256'
+READ_CHUNK_BYTES = 1024 * 1024
+
+
+def hash_file(full_path):
+    """Return the hex digest of a file's content, read in chunks."""
+    digest = hashlib.new(HASH_ALGORITHM)
+    with open(full_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(READ_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileHashCache:
+    """
+    Content hashes of files keyed by path. A hash is computed the first time
+    it is asked for and reused while the file's mtime and size are unchanged.
+    """
+
+    def __init__(self):
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def get(self, full_path, st=None):
+        """
+        Return the content hash of a file, given its current `os.stat`
+        result when already known. Raises OSError for unreadable files.
+        """
+        if st is None:
+            st = os.stat(full_path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._hashes.get(full_path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        digest = hash_file(full_path)
+        with self._lock:
+            self._hashes[full_path] = (stamp, digest)
+        return digest
+
+    def __len__(self):
+        with self._lock:
+            return len(self._hashes)
@@ -1,6 +1,33 @@
+import base64
+import codecs
+import hashlib
+import json
 import logging
+import multiprocessing
 import os
-import pathspec
+import re
+import stat
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from src.change_journal import ChangeJournal
+from src.content_cache import ContentCache
+from src.file_hashes import HASH_ALGORITHM, FileHashCache
+from src.git_index import GitIndex, walk_git_tree
+from src.grep import iter_grep
+from src.ignore_matcher import IgnoreMatcher
+from src.index_snapshot import IndexSnapshot
+from src.large_file import preview_file
+from src.line_index import LineIndexCache
+from src.outline import MAX_FILE_SIZE as OUTLINE_MAX_FILE_SIZE, build_outline, outline_language
+from src.search_index import TrigramIndex
+from src.symbol_index import SymbolIndex
+from src.token_count import TokenCountCache, count_tokens, head_within_tokens
+from src.traversal import path_key, walk_tree
+from src.tree_index import TreeIndex
+
+
+# Seconds grep batches may run past their deadline before their pool is retired
+GREP_OVERRUN_GRACE = 2.0
 
 
 class FileService:
@@ -8,102 +35,918 @@ class FileService:
     A service class responsible for handling file structure and content retrieval.
     """
 
-    def __init__(self, project_path, agentignore_files):
+    def __init__(self, project_path, agentignore_files, rescan_interval=30.0,
+                 follow_symlinks=False, large_file_threshold=1024 * 1024,
+                 content_byte_budget=8 * 1024 * 1024, read_workers=8,
+                 content_cache_bytes=64 * 1024 * 1024, grep_workers=None,
+                 grep_max_file_size=8 * 1024 * 1024, outline_cache_bytes=16 * 1024 * 1024,
+                 snapshot_path=None, snapshot_interval=300.0, change_journal_size=10000,
+                 enumeration='walk', include_untracked=False):
         self.project_path = project_path
         self.agentignore_files = agentignore_files
+        self.rescan_interval = rescan_interval
+        self.follow_symlinks = follow_symlinks
+        self.large_file_threshold = large_file_threshold
+        self.content_byte_budget = content_byte_budget
+        self.read_workers = read_workers
+        self.grep_workers = grep_workers or os.cpu_count() or 1
+        self.grep_max_file_size = grep_max_file_size
+        self.snapshot_path = snapshot_path
+        # A snapshot saved inside the project is never part of it: its directory
+        # is left out, or the file and its temporary files at the project root
+        self._snapshot_entry = None
+        if snapshot_path:
+            rel_path = os.path.relpath(os.path.abspath(snapshot_path),
+                                       os.path.abspath(project_path))
+            if not rel_path.startswith(os.pardir):
+                folder = os.path.dirname(rel_path)
+                self._snapshot_entry = (folder, True) if folder else (rel_path, False)
+        if enumeration not in ('walk', 'git'):
+            raise ValueError(f"Unknown file enumeration mode: {enumeration}")
+        self.enumeration = enumeration
+        self.include_untracked = include_untracked
+        self.snapshot_interval = snapshot_interval
         self.logger = logging.getLogger("FileService")
+        self.ignore_files = agentignore_files.split(',')
+        self.ignore_file_names = {os.path.basename(f) for f in self.ignore_files}
+        self.ignore_matcher = IgnoreMatcher(self.ignore_files)
+        # Git already leaves out what .gitignore ignores from the tracked files
+        self.tracked_ignore_matcher = IgnoreMatcher(
+            [f for f in self.ignore_files if os.path.basename(f) != '.gitignore'])
+        self.git_index = GitIndex(project_path) if enumeration == 'git' else None
+        self.line_index_cache = LineIndexCache()
+        self.content_cache = ContentCache(content_cache_bytes)
+        self.outline_cache = ContentCache(outline_cache_bytes)
+        self.hash_cache = FileHashCache()
+        # Files previewed rather than read whole are never scanned in full
+        self.token_cache = TokenCountCache(max_scan_bytes=large_file_threshold)
+        self.change_journal = ChangeJournal(self.is_unlisted, max_entries=change_journal_size)
+        self.tree_index = None
+        self.search_index = TrigramIndex(
+            project_path, list_files=self._list_files, is_excluded=self.is_unlisted,
+            max_scan_size=grep_max_file_size)
+        self.symbol_index = SymbolIndex(
+            project_path, list_files=self._list_files, is_excluded=self.is_unlisted,
+            get_executor=self._get_process_pool)
+        self._read_pool = None
+        # Part of every ETag, so validators from an earlier process never match
+        self.instance_token = os.urandom(8).hex()
+        self._pool_lock = threading.Lock()
+        self._process_pool = None
+
+    def start_index(self):
+        """
+        Build the in-memory tree index and keep it updated from file system
+        events, so structure requests no longer walk the project. With a
+        `snapshot_path`, the index is restored from its last snapshot.
+        """
+        project_root = os.path.abspath(self.project_path)
+        rebuild_triggers = []
+        for ignore_file in self.ignore_files:
+            rel_path = os.path.relpath(os.path.abspath(ignore_file), project_root)
+            if not rel_path.startswith(os.pardir):
+                rebuild_triggers.append(rel_path)
+
+        self.tree_index = TreeIndex(
+            self.project_path,
+            walk=self.walk,
+            is_excluded=self.is_unlisted,
+            rescan_interval=self.rescan_interval,
+            before_build=self._before_build,
+            rebuild_triggers=rebuild_triggers,
+            snapshot=IndexSnapshot(self.snapshot_path) if self.snapshot_path else None,
+            snapshot_key=self._snapshot_key,
+            snapshot_interval=self.snapshot_interval)
+        self.tree_index.add_listener(self.search_index.handle_event)
+        self.tree_index.add_listener(self.symbol_index.handle_event)
+        self.tree_index.add_listener(self.change_journal.handle_event)
+        self.tree_index.start()
+        self.logger.info("Tree index ready (%s mode)", self.tree_index.mode)
+        # Build the search indexes in the background so the first search is fast
+        for index, name in ((self.search_index, "SearchIndexBuild"),
+                            (self.symbol_index, "SymbolIndexBuild")):
+            threading.Thread(target=index.sync, name=name, daemon=True).start()
+
+    def _before_build(self):
+        """Bring the rules `walk` depends on up to date before a full walk."""
+        self.ignore_matcher.refresh()
+        if self.git_index is not None:
+            self.git_index.refresh()
+
+    def _snapshot_key(self):
+        """Everything the indexed tree depends on besides the files themselves."""
+        return repr((os.path.abspath(self.project_path), self.follow_symlinks,
+                     self.enumeration, self.include_untracked,
+                     self.ignore_matcher.fingerprint))
 
-    def load_ignore_spec(self):
-        """Load patterns from multiple ignore files using pathspec."""
-        ignore_files = self.agentignore_files.split(',')
-        combined_spec = None
-
-        for ignore_file in ignore_files:
-            if os.path.exists(ignore_file):
-                with open(ignore_file, 'r', encoding='utf-8') as f:
-                    ignore_spec = pathspec.PathSpec.from_lines(
-                        'gitwildmatch', f)
-                    combined_spec = ignore_spec if combined_spec is None else combined_spec + ignore_spec
-        self.logger.debug(f"Loaded ignore spec: {combined_spec}")
-        return combined_spec
-
-    def is_ignored(self, path, ignore_spec):
+    def stop_index(self):
+        """Stop tracking file system changes, save the index snapshot and drop the index."""
+        if self.tree_index is not None:
+            self.tree_index.stop()
+            self.tree_index = None
+
+    def is_ignored(self, path, is_dir=False):
         """Check if a path should be ignored based on the loaded patterns."""
-        if not ignore_spec:
+        return self.ignore_matcher.match(os.path.normpath(path), is_dir)
+
+    def is_excluded(self, rel_path, is_dir):
+        """
+        Check if a single path is left out of the structure. Ignore files are
+        always kept, even if they match ignore patterns.
+        """
+        if self._is_snapshot(rel_path):
+            return True
+        if not is_dir and os.path.basename(rel_path) in self.ignore_file_names:
+            return False
+        return self.is_ignored(rel_path, is_dir)
+
+    def _is_tracked_excluded(self, rel_path, is_dir):
+        """`is_excluded` for files tracked by git, with the rules of every ignore file but .gitignore."""
+        if self._is_snapshot(rel_path):
+            return True
+        if not is_dir and os.path.basename(rel_path) in self.ignore_file_names:
+            return False
+        return self.tracked_ignore_matcher.match(os.path.normpath(rel_path), is_dir)
+
+    def _is_snapshot(self, rel_path):
+        """Check if a path belongs to the index snapshot."""
+        if self._snapshot_entry is None:
+            return False
+        entry, is_folder = self._snapshot_entry
+        rel_path = os.path.normpath(rel_path)
+        if is_folder:
+            return rel_path == entry or rel_path.startswith(entry + os.sep)
+        return rel_path.startswith(entry)  # With its temporary files
+
+    def is_unlisted(self, rel_path, is_dir):
+        """
+        `is_excluded` as `walk` applies it in the current enumeration mode. In
+        git mode, tracked paths only follow the rules git does not apply, and
+        untracked paths are left out unless `include_untracked`.
+        """
+        is_tracked = self.git_index.is_tracked(rel_path, is_dir) \
+            if self.git_index is not None else None
+        if is_tracked is None:
+            return self.is_excluded(rel_path, is_dir)
+        if is_tracked:
+            return self._is_tracked_excluded(rel_path, is_dir)
+        if not self.include_untracked or os.path.basename(rel_path) == '.git':
+            return True
+        return self.is_excluded(rel_path, is_dir)
+
+    def walk(self, rel_dir, max_depth=None):
+        """
+        Walk the project from `rel_dir` downwards, yielding
+        (folder, dirnames, filenames) with ignored entries already removed.
+        In git enumeration mode, the files tracked in the repository's index
+        are listed instead (plus untracked files if `include_untracked`),
+        falling back to the walk outside a git repository.
+        """
+        if self.git_index is not None:
+            tree = self.git_index.tree()
+            if tree is not None:
+                self.tracked_ignore_matcher.refresh()
+                return walk_git_tree(
+                    self.project_path, tree, rel_dir, is_excluded=self._is_tracked_excluded,
+                    is_excluded_untracked=self.is_excluded,
+                    include_untracked=self.include_untracked, max_depth=max_depth)
+        return walk_tree(self.project_path, rel_dir, is_excluded=self.is_excluded,
+                         follow_symlinks=self.follow_symlinks, max_depth=max_depth)
+
+    def _index_ready(self):
+        """
+        Check if the tree index can serve requests, rebuilding it if the
+        ignore rules or the tracked files changed.
+        """
+        ignore_rules_changed = self.ignore_matcher.refresh()
+        if self.tree_index is None or not self.tree_index.ready:
             return False
+        # `.git` is not watched, so changes to the tracked files are polled here
+        tracked_files_changed = self.git_index is not None and self.git_index.refresh()
+        if ignore_rules_changed or tracked_files_changed:
+            self.tree_index.rebuild()
+        return True
+
+    def search_files(self, request_data):
+        """
+        Search the text of all visible files for a literal or regular
+        expression query, narrowed down by the trigram index. Raises
+        ValueError for malformed requests and FileNotFoundError for an unknown
+        `path`.
+        """
+        query = self._query_option(request_data)
+        options = {
+            "regex": self._bool_option(request_data, 'regex'),
+            "case_sensitive": self._bool_option(request_data, 'case_sensitive'),
+            "max_results": self._int_option(request_data, 'max_results', 100, 1, 1000),
+            "context_lines": self._int_option(request_data, 'context_lines', 2, 0, 20),
+        }
+        rel_dir = self._resolve_directory(request_data.get('path', '.'))
+
+        if not self._index_ready():
+            # Without file system events, every file has to be checked again
+            self.search_index.invalidate()
+        return self.search_index.search(query, rel_dir=rel_dir, **options)
+
+    def grep_files(self, request_data):
+        """
+        Validate a grep request and return a generator of its NDJSON records:
+        the matching lines as they are found by the grep process pool, then a
+        summary. Unlike `search_files`, no index is used, so any regular
+        expression is supported. Raises ValueError for malformed requests
+        and FileNotFoundError for an unknown `path`.
+        """
+        pattern = self._query_option(request_data)
+        flags = 0 if self._bool_option(request_data, 'case_sensitive', True) \
+            else re.IGNORECASE
+        if not self._bool_option(request_data, 'regex', True):
+            pattern = re.escape(pattern)
+        try:
+            re.compile(pattern, flags)
+        except re.error as e:
+            raise ValueError(f"Invalid regular expression: {e}") from e
+        max_results = self._int_option(request_data, 'max_results', 500, 1, 10000)
+        deadline_ms = self._int_option(request_data, 'deadline_ms', 10000, 1, 60000)
+        rel_dir = self._resolve_directory(request_data.get('path', '.'))
+
+        rel_paths = (os.path.join(folder, name) if folder != '.' else name
+                     for folder, _, filenames in self.iter_directory_records(rel_dir)
+                     for name in filenames)
+        return iter_grep(self.project_path, rel_paths, pattern, flags, max_results,
+                         deadline_ms, self.grep_max_file_size,
+                         executor=self._get_process_pool(),
+                         max_in_flight=self.grep_workers * 2,
+                         on_overrun=self._watch_overrun)
+
+    def search_symbols(self, query, kind=None, path='.', exact=False, max_results=50):
+        """
+        Find class, function, method and type definitions by name. Returns
+        the matching symbols with their file and line span, best matches
+        first. Raises FileNotFoundError for an unknown `path`.
+        """
+        rel_dir = self._resolve_directory(path)
+        if not self._index_ready():
+            self.symbol_index.invalidate()
+        symbols, truncated = self.symbol_index.search(
+            query, kind=kind, rel_dir=rel_dir, exact=exact, max_results=max_results)
+        return {"symbols": symbols, "truncated": truncated}
+
+    def get_symbol_source(self, name, path=None):
+        """
+        Return the source of the definitions named `name` (a plain or
+        qualified name like `Config.load`), optionally only those in the file
+        `path`. Raises FileNotFoundError when there is no such symbol, or
+        when none of their files can be read anymore, like files deleted
+        since they were indexed.
+        """
+        if not self._index_ready():
+            self.symbol_index.invalidate()
+        symbols, _ = self.symbol_index.search(name, exact=True, max_results=100)
+        if path is not None:
+            symbols = [s for s in symbols if s["path"] == os.path.normpath(path)]
+        # Prefer definitions matching the name's case exactly
+        exact_case = [s for s in symbols if name in (s["name"], s["qualified_name"])]
+        symbols = (exact_case or symbols)[:10]
+        if not symbols:
+            raise FileNotFoundError(f"Symbol not found: {name}")
+
+        for symbol in symbols:
+            # One read per symbol, as several may come from the same file
+            contents, status = self.get_file_content([{
+                "path": symbol["path"], "start_line": symbol["start_line"],
+                "end_line": symbol["end_line"]}])
+            entry = contents.get(symbol["path"], contents) if status == 200 else contents
+            if "error" in entry:
+                symbol["error"] = entry["error"]
+            else:
+                symbol["source"] = entry.get("content", "")
+        if all("error" in symbol for symbol in symbols):
+            raise FileNotFoundError(f"Source not available for symbol: {name}")
+        return {"symbols": symbols}
+
+    def get_changes(self, since=None, limit=1000):
+        """
+        Return the created, modified, deleted and renamed paths recorded
+        after the cursor `since`, or just the current cursor without one.
+        Changes are only journaled while the tree index is running.
+        """
+        if not self._index_ready():
+            return {"changes": [], "cursor": self.change_journal.cursor,
+                    "resync_required": True, "has_more": False}
+        if since is None:
+            return {"changes": [], "cursor": self.change_journal.cursor,
+                    "resync_required": False, "has_more": False}
+        return self.change_journal.changes(since, limit)
+
+    def _get_process_pool(self):
+        """Return the process pool for grep and parsing, or None to work in-process."""
+        if self.grep_workers <= 1:
+            return None
+        with self._pool_lock:
+            if self._process_pool is None:
+                # Forking a process that runs watcher threads is unsafe
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.grep_workers,
+                    mp_context=multiprocessing.get_context('spawn'))
+        return self._process_pool
+
+    def _watch_overrun(self, pool, futures):
+        """
+        Retire `pool` if grep batches still run GREP_OVERRUN_GRACE seconds
+        after their deadline. Workers stop at the deadline by themselves
+        unless a single regular expression search never returns; such a
+        worker is terminated so later greps and parses get a fresh pool.
+        """
+        def watch():
+            _, not_done = wait(futures, timeout=GREP_OVERRUN_GRACE)
+            if not not_done:
+                return
+            with self._pool_lock:
+                if self._process_pool is not pool:
+                    return
+                self._process_pool = None
+            self.logger.warning("Grep overran its deadline, replacing the process pool")
+            # The executor has no public way to stop a busy worker
+            for process in list((getattr(pool, '_processes', None) or {}).values()):
+                process.terminate()
+            pool.shutdown(wait=False)
+
+        threading.Thread(target=watch, name="GrepOverrun", daemon=True).start()
+
+    @staticmethod
+    def _query_option(request_data):
+        query = request_data.get('query')
+        if not isinstance(query, str) or not query:
+            raise ValueError("'query' must be a non-empty string")
+        return query
+
+    @staticmethod
+    def _bool_option(request_data, name, default=False):
+        value = request_data.get(name, default)
+        if not isinstance(value, bool):
+            raise ValueError(f"'{name}' must be a boolean")
+        return value
+
+    @staticmethod
+    def _int_option(request_data, name, default, low, high):
+        value = request_data.get(name, default)
+        if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+            raise ValueError(f"'{name}' must be an integer from {low} to {high}")
+        return value
+
+    def _etag(self, *parts):
+        """Return a strong ETag for a response derived from `parts`."""
+        digest = hashlib.blake2b(
+            repr((self.instance_token,) + parts).encode('utf-8'), digest_size=16)
+        return digest.hexdigest()
+
+    def structure_etag(self, *params):
+        """
+        Return an ETag for a structure response with the given request
+        parameters, built from the tree index generation. Returns None when
+        the index is not serving, as the structure cannot be validated
+        without walking the project.
+        """
+        if not self._index_ready():
+            return None
+        return self._etag("structure", self.tree_index.generation,
+                          self.ignore_matcher.fingerprint, params)
+
+    def _stat_for_etag(self, file_path, selector):
+        try:
+            st = os.stat(os.path.join(self.project_path, file_path))
+            return file_path, selector, st.st_mode, st.st_mtime_ns, st.st_size
+        except OSError as e:
+            return file_path, selector, e.errno
+
+    def content_etag(self, file_paths, mode='full', known_hashes=None, max_tokens=None,
+                     priority=None):
+        """
+        Return an ETag for a content response, built from the mtime and size
+        of every requested file. Raises ValueError for malformed entries.
+        """
+        file_requests = [self.parse_file_request(item) for item in file_paths]
+        self._check_known_hashes(known_hashes)
+        self._check_token_budget(max_tokens, priority)
+        stats = self._map_reads(self._stat_for_etag, file_requests)
+        return self._etag("content", mode, self.large_file_threshold,
+                          self.content_byte_budget, stats,
+                          sorted(known_hashes.items()) if known_hashes is not None else None,
+                          max_tokens, priority)
+
+    @staticmethod
+    def _check_known_hashes(known_hashes):
+        if known_hashes is None:
+            return
+        if not isinstance(known_hashes, dict) or not all(
+                isinstance(value, str) for value in known_hashes.values()):
+            raise ValueError("'known_hashes' must map file paths to hashes")
+
+    @staticmethod
+    def _check_token_budget(max_tokens, priority):
+        if max_tokens is not None and (
+                isinstance(max_tokens, bool) or not isinstance(max_tokens, int) or max_tokens < 1):
+            raise ValueError("'max_tokens' must be a positive integer")
+        if priority is not None and (not isinstance(priority, list) or not all(
+                isinstance(path, str) for path in priority)):
+            raise ValueError("'priority' must be a list of file paths")
+
+    def get_manifest(self, path='.'):
+        """
+        Return the path, size, mtime and content hash of every visible file
+        below `path`. Hashes are computed the first time a file is listed and
+        cached while its mtime and size are unchanged.
+        """
+        rel_dir = self._resolve_directory(path)
+        file_paths = [(name if folder == '.' else os.path.join(folder, name),)
+                      for folder, _, filenames in self.iter_directory_records(rel_dir)
+                      for name in filenames]
+        entries = self._map_reads(self._manifest_entry, file_paths)
+        return {"algorithm": HASH_ALGORITHM,
+                "files": [entry for entry in entries if entry is not None]}
+
+    def _manifest_entry(self, file_path):
+        full_path = os.path.join(self.project_path, file_path)
+        try:
+            st = os.stat(full_path)
+            if not stat.S_ISREG(st.st_mode):
+                return None
+            return {"path": file_path, "size": st.st_size, "mtime": st.st_mtime,
+                    "hash": self.hash_cache.get(full_path, st)}
+        except OSError:
+            return None  # Deleted since it was listed
+
+    def _resolve_directory(self, path):
+        """Normalize a requested directory and make sure it is a visible part of the project."""
+        rel_dir = os.path.normpath(path or '.')
+        if os.path.isabs(rel_dir) or rel_dir.split(os.sep)[0] == os.pardir:
+            raise ValueError(f"Path must be inside the project: {path}")
+        if self._index_ready():
+            found = self.tree_index.has_directory(rel_dir)
+        else:
+            found = os.path.isdir(os.path.join(self.project_path, rel_dir)) \
+                and not self.is_unlisted(rel_dir, True)
+        if not found:
+            raise FileNotFoundError(f"Directory not found: {path}")
+        return rel_dir
+
+    def iter_directory_records(self, path='.', depth=None, resume_from=None):
+        """
+        Yield (folder, dirnames, filenames) for `path` and up to `depth` levels
+        of directories below it, top-down and sorted by name. Served from the
+        tree index when it is ready, otherwise from a walk of the project.
+        """
+        if self._index_ready():
+            records = self.tree_index.iter_records(path, depth, resume_from)
+        else:
+            resume_key = path_key(resume_from) if resume_from is not None else None
+            records = (record for record in self.walk(path, max_depth=depth)
+                       if resume_key is None or path_key(record[0]) >= resume_key)
+
+        for folder, dirnames, filenames in records:
+            if folder == '.':
+                filenames = self._with_ignore_files(filenames)
+            yield folder, dirnames, filenames
 
-        normalized_path = os.path.normpath(path)
-        # Ensure directory paths end with a slash for proper matching
-        if os.path.isdir(os.path.join(self.project_path, normalized_path)):
-            normalized_path = normalized_path.rstrip('/') + '/'
-        return ignore_spec.match_file(normalized_path)
-
-    def get_directory_structure(self):
-        """Returns the project directory structure as a dictionary."""
-        ignore_spec = self.load_ignore_spec()
-        ignore_files = self.agentignore_files.split(',')
-
-        def traverse_directory(root_dir):
-            dir_structure = {}
-            for dirpath, dirnames, filenames in os.walk(root_dir):
-                folder = os.path.relpath(dirpath, root_dir)
-                normalized_folder = os.path.normpath(folder)
-
-                # Skip ignored directories
-                if self.is_ignored(normalized_folder, ignore_spec):
-                    self.logger.debug(f"Ignored folder: {normalized_folder}")
-                    continue
-
-                dirnames[:] = [d for d in dirnames if not self.is_ignored(
-                    os.path.normpath(os.path.join(folder, d)), ignore_spec)]
-
-                # Keep ignore files in the structure even if they match ignore patterns
-                ignore_file_names = [os.path.basename(f) for f in ignore_files]
-                filenames = [f for f in filenames if f in ignore_file_names or not self.is_ignored(
-                    os.path.normpath(os.path.join(folder, f)), ignore_spec)]
-
-                # For the root directory, ensure all existing ignore files are included
-                if folder == ".":
-                    for ignore_file in ignore_files:
-                        basename = os.path.basename(ignore_file)
-                        if os.path.exists(ignore_file) and basename not in filenames:
-                            filenames.append(basename)
+    def _list_files(self):
+        """Yield the project-relative path of every visible file."""
+        for folder, _, filenames in self.iter_directory_records('.'):
+            for name in filenames:
+                yield name if folder == '.' else os.path.join(folder, name)
 
+    def _with_ignore_files(self, filenames):
+        """For the root directory, ensure all existing ignore files are included."""
+        filenames = list(filenames)
+        for ignore_file in self.ignore_files:
+            basename = os.path.basename(ignore_file)
+            if os.path.exists(ignore_file) and basename not in filenames:
+                filenames.append(basename)
+        return filenames
+
+    def iter_structure_records(self, path='.', depth=None):
+        """
+        Validate `path` and return a generator of one record per non-empty
+        directory, {"path", "files", "directories"}, produced as the tree is
+        traversed instead of being collected first.
+        """
+        rel_dir = self._resolve_directory(path)
+        return ({"path": folder, "files": filenames, "directories": dirnames}
+                for folder, dirnames, filenames in self.iter_directory_records(rel_dir, depth)
+                if filenames or dirnames)
+
+    def get_directory_structure(self, path='.', depth=None):
+        """
+        Returns the project directory structure as a dictionary, optionally
+        limited to the subtree at `path` and to `depth` directory levels.
+        """
+        try:
+            rel_dir = self._resolve_directory(path)
+            structure = {}
+            for folder, dirnames, filenames in self.iter_directory_records(rel_dir, depth):
                 # Only include non-empty directories and files in the structure
                 if filenames or dirnames:
-                    dir_structure[folder] = {
+                    structure[folder] = {
                         "files": filenames,
                         "directories": dirnames
                     }
-            return dir_structure
-
-        try:
-            structure = traverse_directory(self.project_path)
-            self.logger.info(f"Retrieved directory structure: {structure}")
+            self.logger.info(
+                f"Retrieved directory structure with {len(structure)} folders")
+            self.logger.debug(f"Retrieved directory structure: {structure}")
             return structure
         except Exception as e:
             self.logger.error(f"Failed to retrieve directory structure: {e}")
             raise
 
-    def get_file_content(self, file_paths):
-        """Retrieve the content of specified files."""
-        file_contents = {}
-        all_missing = True
+    def get_structure_page(self, path='.', depth=None, cursor=None, limit=1000):
+        """
+        Returns one page of the directory structure holding at most `limit`
+        entries (directories first, then files, folder by folder), plus the
+        cursor of the next page. A large folder may be split across pages, in
+        which case each page holds a slice of its entries.
+        """
+        rel_dir = self._resolve_directory(path)
+        resume_folder, offset = None, 0
+        if cursor:
+            state = self._decode_cursor(cursor)
+            if state.get("path") != rel_dir or state.get("depth") != depth:
+                raise ValueError("Cursor does not match the requested path and depth")
+            resume_folder, offset = state["folder"], state["offset"]
 
-        for file_path in file_paths:
-            full_path = os.path.join(self.project_path, file_path)
-            if os.path.isdir(full_path):
-                file_contents[file_path] = {
-                    "error": f"Cannot read directory: {file_path}"}
+        structure = {}
+        next_cursor = None
+        remaining = limit
+        for folder, dirnames, filenames in self.iter_directory_records(
+                rel_dir, depth, resume_from=resume_folder):
+            if not dirnames and not filenames:
+                continue
+            start = offset if folder == resume_folder else 0
+            total = len(dirnames) + len(filenames)
+            if start >= total:
                 continue
+            if remaining == 0:
+                next_cursor = self._encode_cursor(rel_dir, depth, folder, start)
+                break
 
-            try:
+            # Directories come first; only the slice on this page is copied
+            end = min(start + remaining, total)
+            structure[folder] = {
+                "files": filenames[max(start - len(dirnames), 0):max(end - len(dirnames), 0)],
+                "directories": dirnames[start:end]}
+            remaining -= end - start
+            if end < total:
+                next_cursor = self._encode_cursor(rel_dir, depth, folder, end)
+                break
+
+        return {"structure": structure, "next_cursor": next_cursor}
+
+    @staticmethod
+    def _encode_cursor(path, depth, folder, offset):
+        state = {"path": path, "depth": depth, "folder": folder, "offset": offset}
+        return base64.urlsafe_b64encode(json.dumps(state).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        try:
+            state = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            offset = state.get("offset")
+            if not isinstance(state.get("folder"), str) or not isinstance(offset, int) \
+                    or isinstance(offset, bool) or offset < 0:
+                raise ValueError
+            return state
+        except (ValueError, TypeError, AttributeError, UnicodeError) as e:
+            raise ValueError("Invalid cursor") from e
+
+    @staticmethod
+    def parse_file_request(item):
+        """
+        Split an entry of `file_paths` into (path, selector). Entries are either
+        a plain path or an object with a `path` and an optional line range
+        (`start_line`, `end_line`, 1-based and inclusive) or byte range
+        (`offset`, `length`).
+        """
+        if isinstance(item, str):
+            return item, None
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise ValueError(f"Invalid file request: {item}")
+
+        selector = {key: item[key] for key in (
+            'start_line', 'end_line', 'offset', 'length') if item.get(key) is not None}
+        for key, value in selector.items():
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                raise ValueError(f"'{key}' must be a non-negative integer")
+        is_line_range = 'start_line' in selector or 'end_line' in selector
+        if is_line_range and ('offset' in selector or 'length' in selector):
+            raise ValueError(
+                "Use either a line range or a byte range, not both")
+        if selector.get('start_line') == 0 or selector.get('end_line') == 0:
+            raise ValueError("Line numbers start at 1")
+        return item['path'], selector or None
+
+    def _plan_range(self, full_path, selector):
+        """Find the byte span of a line or byte range using the file's line index."""
+        with open(full_path, 'rb') as file:
+            st = os.fstat(file.fileno())
+            line_index = self.line_index_cache.get(full_path, file, st)
+
+        if 'offset' in selector or 'length' in selector:
+            start = min(selector.get('offset', 0), line_index.size)
+            end = min(start + selector.get('length', line_index.size), line_index.size)
+            result = {"offset": start}
+            errors = 'replace'  # A byte range may split a multi-byte character
+        else:
+            start_line = selector.get('start_line', 1)
+            end_line = min(selector.get('end_line', line_index.total_lines),
+                           line_index.total_lines)
+            start, end = line_index.byte_span(start_line, end_line)
+            result = {"start_line": start_line,
+                      "end_line": max(end_line, start_line - 1)}
+            errors = 'strict'
+        result.update({"total_lines": line_index.total_lines,
+                       "size": line_index.size})
+        return {"full_path": full_path, "span": (start, end), "result": result,
+                "errors": errors, "wanted": end - start}
+
+    def _plan_read(self, file_path, selector, outline=False, known_hashes=None):
+        """
+        Stat a requested file and, for ranges, resolve the bytes to read.
+        In outline mode, whole source files are planned as their outline.
+        With `known_hashes`, whole files are hashed, and an unchanged file
+        is answered without its content.
+        Returns a read plan, or an entry for the response instead.
+        """
+        full_path = os.path.join(self.project_path, file_path)
+        try:
+            st = os.stat(full_path)
+            if stat.S_ISDIR(st.st_mode):
+                return None, {"error": f"Cannot read directory: {file_path}"}
+            if selector:
+                return self._plan_range(full_path, selector), None
+            if outline and st.st_size <= OUTLINE_MAX_FILE_SIZE and outline_language(file_path):
+                plan = self._plan_outline(file_path, full_path, st)
+                if plan is not None:
+                    return plan, None
+            plan = {"full_path": full_path, "wanted": st.st_size,
+                    "mtime_ns": st.st_mtime_ns}
+            if known_hashes is not None:
+                plan["hash"] = self.hash_cache.get(full_path, st)
+                if known_hashes.get(file_path) == plan["hash"]:
+                    return None, {"unchanged": True, "hash": plan["hash"]}
+            return plan, None
+        except (OSError, UnicodeDecodeError) as e:
+            return None, {"error": f"Error reading file: {str(e)}"}
+
+    def _plan_outline(self, file_path, full_path, st):
+        """
+        Build the outline of a file, served from the outline cache while the
+        file is unchanged. Returns None when it has no outline, like a
+        Python file with a syntax error.
+        """
+        cached = self.outline_cache.get(full_path, st.st_mtime_ns, st.st_size)
+        if cached is None:
+            if st.st_size > self.large_file_threshold:
+                # Never sent whole, so not worth a place in the content cache
                 with open(full_path, 'r', encoding='utf-8') as file:
-                    file_contents[file_path] = {"content": file.read()}
-                    all_missing = False
-            except OSError as e:
-                file_contents[file_path] = {
-                    "error": f"Error reading file: {str(e)}"}
+                    text = file.read()
+            else:
+                text = self._read_whole(full_path, st.st_mtime_ns, st.st_size)
+            try:
+                outline = build_outline(file_path, text)
+            except (RecursionError, ValueError) as e:
+                # Too deeply nested, or NUL bytes: the file is read as usual
+                self.logger.warning("No outline for %s: %s", file_path, e)
+                return None
+            if outline is None:
+                return None
+            cached = (outline, text.count('\n') + (not text.endswith('\n')) if text else 0)
+            self.outline_cache.put(full_path, st.st_mtime_ns, st.st_size, cached,
+                                   cost=len(outline))
+        outline, total_lines = cached
+        return {"full_path": full_path, "wanted": len(outline.encode('utf-8')),
+                "outline": {"content": outline, "outline": True,
+                            "language": outline_language(file_path),
+                            "total_lines": total_lines, "size": st.st_size}}
+
+    def _read_whole(self, full_path, mtime_ns, size):
+        """Read a whole file, served from the content cache while unchanged."""
+        content = self.content_cache.get(full_path, mtime_ns, size)
+        if content is None:
+            with open(full_path, 'r', encoding='utf-8') as file:
+                st = os.fstat(file.fileno())
+                content = file.read()
+            self.content_cache.put(full_path, st.st_mtime_ns, st.st_size, content)
+        return content
+
+    def _read_planned(self, plan, max_bytes):
+        """
+        Read a planned range with one seek and one bounded read, a whole file,
+        or - when it is larger than `max_bytes` - a memory-mapped head/tail
+        preview.
+        """
+        full_path = plan["full_path"]
+        if "outline" in plan:
+            result = dict(plan["outline"])
+            if plan["wanted"] > max_bytes:
+                result["content"] = result["content"].encode('utf-8')[:max_bytes].decode(
+                    'utf-8', errors='ignore')
+                result["truncated"] = True
+            return result
+        if "span" not in plan:
+            if plan["wanted"] > max_bytes:
+                # Large files are only counted when a line range already indexed them
+                line_index = self.line_index_cache.peek(
+                    full_path, plan["mtime_ns"], plan["wanted"])
+                return preview_file(
+                    full_path, max_bytes, max_count_bytes=self.large_file_threshold,
+                    line_count=line_index.total_lines if line_index is not None else None)
+            return {"content": self._read_whole(
+                full_path, plan["mtime_ns"], plan["wanted"])}
+
+        start, end = plan["span"]
+        result = dict(plan["result"])
+        errors = plan["errors"]
+        if end - start > max_bytes:
+            end = start + max_bytes
+            result["truncated"] = True
+            errors = 'replace'
+        if "offset" in result:
+            result["length"] = end - start
+
+        with open(full_path, 'rb') as file:
+            file.seek(start)
+            result["content"] = file.read(end - start).decode('utf-8', errors=errors)
+        return result
+
+    def _read_head(self, plan, max_bytes):
+        """
+        Read the head of a planned read estimated at no more than
+        `plan["head_tokens"]` tokens, cut after a complete line.
+        """
+        if "span" in plan or "outline" in plan:
+            result = self._read_planned(plan, max_bytes)
+        else:
+            with open(plan["full_path"], 'rb') as file:
+                data = file.read(min(plan["wanted"], max_bytes))
+            # Leaves out a character split by the end of the read
+            text = codecs.getincrementaldecoder('utf-8')().decode(data)
+            result = {"content": text, "start_line": 1, "size": plan["wanted"],
+                      "truncated": len(data) < plan["wanted"]}
+        content = head_within_tokens(result["content"], plan["head_tokens"])
+        if content != result["content"]:
+            result["truncated"] = True
+        result["content"] = content
+        if "start_line" in result:
+            lines = content.count('\n') + (bool(content) and not content.endswith('\n'))
+            result["end_line"] = result["start_line"] - 1 + lines
+        if "length" in result:
+            result["length"] = len(content.encode('utf-8'))
+        return result
+
+    def _plan_tokens(self, plan):
+        """Estimate the tokens of a planned read, from the file's cached token count."""
+        if "outline" in plan:
+            return count_tokens(plan["outline"]["content"])
+        try:
+            tokens = self.token_cache.get(plan["full_path"])
+        except OSError:
+            return 0  # Reported by the read
+        if "span" in plan:
+            size = plan["result"]["size"]
+            return -(-tokens * plan["wanted"] // size) if size else 0
+        return tokens
+
+    def _outline_for_budget(self, file_path, plan):
+        """Plan the outline of a whole source file that does not fit the token budget."""
+        if "span" in plan or "outline" in plan or plan["wanted"] > OUTLINE_MAX_FILE_SIZE \
+                or not outline_language(file_path):
+            return None
+        try:
+            return self._plan_outline(file_path, plan["full_path"], os.stat(plan["full_path"]))
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def _pack_tokens(self, file_requests, planned, max_tokens, priority, outlines):
+        """
+        Fit the planned reads into `max_tokens` estimated tokens, first fit
+        in priority order (the `priority` paths first, then the request
+        order): a file is taken whole when it fits in what is left of the
+        budget, so one that does not fit leaves room for smaller files after
+        it. Otherwise it is replaced by its outline when `outlines` is set
+        and that fits, or gets the head that fits in the rest of the budget,
+        which uses it up and leaves the files after it omitted.
+        Returns the new plans and {index: (packing, full_tokens)}.
+        """
+        rank = {}
+        for position, path in enumerate(priority or []):
+            rank.setdefault(path, position)
+        order = sorted((i for i, (plan, _) in enumerate(planned) if plan is not None),
+                       key=lambda i: rank.get(file_requests[i][0], len(rank)))
+        estimates = self._map_reads(self._plan_tokens, [(planned[i][0],) for i in order])
+
+        packed = list(planned)
+        packing = {}
+        remaining = max_tokens
+        for i, tokens in zip(order, estimates):
+            plan = planned[i][0]
+            if tokens <= remaining:
+                remaining -= tokens
+                continue
+            outline = self._outline_for_budget(file_requests[i][0], plan) if outlines else None
+            outline_tokens = count_tokens(outline["outline"]["content"]) if outline else None
+            if outline is not None and outline_tokens <= remaining:
+                packed[i] = (outline, None)
+                packing[i] = ("outline", tokens)
+                remaining -= outline_tokens
+            elif remaining > 0:
+                packed[i] = (dict(plan, head_tokens=remaining), None)
+                packing[i] = ("head", tokens)
+                remaining = 0
+            else:
+                packed[i] = (None, {"packed": "omitted", "tokens": 0, "full_tokens": tokens})
+        return packed, packing
+
+    def _map_reads(self, func, items):
+        """Apply `func` to every item on the read pool, keeping their order."""
+        if self.read_workers <= 1 or len(items) <= 1:
+            return [func(*item) for item in items]
+        with self._pool_lock:
+            if self._read_pool is None:
+                self._read_pool = ThreadPoolExecutor(
+                    max_workers=self.read_workers, thread_name_prefix="file-read")
+        return list(self._read_pool.map(lambda item: func(*item), items))
+
+    def _read_or_error(self, plan, max_bytes):
+        """Read a planned file, returning an error entry instead of raising."""
+        try:
+            if "head_tokens" in plan:
+                return self._read_head(plan, max_bytes), None
+            return self._read_planned(plan, max_bytes), None
+        except (OSError, UnicodeDecodeError) as e:
+            return None, {"error": f"Error reading file: {str(e)}"}
+
+    def get_file_content(self, file_paths, mode='full', known_hashes=None, max_tokens=None,
+                         priority=None):
+        """
+        Retrieve the content of specified files, or of the requested line or
+        byte range of each file. Files above the large-file threshold, or past
+        the per-request byte budget, are returned as truncated previews. With
+        `mode='outline'`, whole source files are returned as their outline
+        instead (see `src.outline.build_outline`); other files are read as
+        usual. With `known_hashes` ({path: hash}), whole files carry their
+        content hash and the ones whose hash matches are returned as
+        `{"unchanged": true}` without content.
+
+        With `max_tokens`, files are packed into that many estimated tokens
+        (see `_pack_tokens`), and every entry carries the `tokens` it holds.
+        Files that did not fit whole are marked `packed` ("outline", "head"
+        or "omitted"), with their `full_tokens`.
+        Raises ValueError for malformed entries or an unknown mode.
+
+        Files are stat'ed and read on a bounded thread pool; the byte budget
+        is handed out in request order in between, so the response does not
+        depend on which read finishes first.
+        """
+        if mode not in ('full', 'outline'):
+            raise ValueError("'mode' must be 'full' or 'outline'")
+        file_requests = [self.parse_file_request(item) for item in file_paths]
+        self._check_known_hashes(known_hashes)
+        self._check_token_budget(max_tokens, priority)
+        planned = self._map_reads(self._plan_read, [
+            (file_path, selector, mode == 'outline', known_hashes)
+            for file_path, selector in file_requests])
+        packing = {}
+        if max_tokens is not None:
+            planned, packing = self._pack_tokens(
+                file_requests, planned, max_tokens, priority, outlines=mode == 'full')
+
+        file_contents = {}
+        reads = []
+        remaining = self.content_byte_budget
+        all_missing = True
+        for index, ((file_path, selector), (plan, entry)) in enumerate(
+                zip(file_requests, planned)):
+            if entry is not None:
+                file_contents[file_path] = entry
+                all_missing = all_missing and "error" in entry
+                continue
+            max_bytes = remaining if selector or "outline" in plan else min(
+                self.large_file_threshold, remaining)
+            remaining = max(remaining - min(plan["wanted"], max_bytes), 0)
+            file_contents[file_path] = None  # Keeps the requested order
+            reads.append((index, file_path, plan, max_bytes))
+
+        results = self._map_reads(self._read_or_error,
+                                  [(plan, max_bytes) for _, _, plan, max_bytes in reads])
+        for (index, file_path, plan, _), (content, error) in zip(reads, results):
+            if error is None and "hash" in plan and index not in packing:
+                content["hash"] = plan["hash"]
+            if error is None and max_tokens is not None:
+                # Previews hold the tail of the file too
+                content["tokens"] = count_tokens(content["content"]) + \
+                    count_tokens(content.get("tail", ""))
+                if index in packing:
+                    content["packed"], content["full_tokens"] = packing[index]
+            file_contents[file_path] = content if error is None else error
+            all_missing = all_missing and error is not None
 
         if all_missing:
             return {"error": "All requested files are missing"}, 404
@@ -0,0 +1,215 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import threading
+
+
+# inotify event masks (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class WatchLimitReached(OSError):
+    """Raised when the kernel refuses a new watch (fs.inotify.max_user_watches)."""
+
+
+def _load_libc():
+    """Load libc and check it exposes the inotify API, returning None otherwise."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c')
+                           or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class InotifyWatcher:
+    """
+    Watches a project tree through Linux inotify and reports changes as
+    (kind, rel_path, is_dir, dest_path) tuples to the `on_event` callback.
+
+    `kind` is one of 'created', 'deleted', 'modified', 'renamed' or 'overflow'.
+    `dest_path` is only set for renames. Paths are relative to the project root
+    and use the same '.'-rooted form as `os.path.relpath`.
+    """
+
+    def __init__(self, root, on_event):
+        self.root = os.path.abspath(root)
+        self.on_event = on_event
+        self.logger = logging.getLogger("InotifyWatcher")
+        self._libc = _load_libc()
+        self._fd = None
+        self._watches = {}  # wd -> rel_dir
+        self._paths = {}  # rel_dir -> wd
+        self._thread = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def is_supported():
+        """Return True if inotify is available on this platform."""
+        return _load_libc() is not None
+
+    def start(self):
+        """Open the inotify instance and start the reader thread."""
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._fd = fd
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="InotifyWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the reader thread and release the inotify instance."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        self._thread = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._watches.clear()
+        self._paths.clear()
+
+    def add_watch(self, rel_dir):
+        """Watch a single directory, raising WatchLimitReached when out of watches."""
+        full_path = os.path.join(self.root, rel_dir)
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(full_path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise WatchLimitReached(err, "inotify watch limit reached")
+            # The directory may have disappeared between listing and watching
+            self.logger.debug("Could not watch %s: %s",
+                              rel_dir, os.strerror(err))
+            return
+        self._watches[wd] = rel_dir
+        self._paths[rel_dir] = wd
+
+    def remove_subtree(self, rel_dir):
+        """Drop the watches of a directory and everything below it."""
+        prefix = rel_dir + os.sep
+        for path in [p for p in self._paths if p == rel_dir or p.startswith(prefix)]:
+            wd = self._paths.pop(path)
+            self._watches.pop(wd, None)
+            if self._fd is not None:
+                self._libc.inotify_rm_watch(self._fd, wd)
+
+    def rename_subtree(self, old_dir, new_dir):
+        """Re-point the watches of a directory moved within the project."""
+        prefix = old_dir + os.sep
+        for path in [p for p in self._paths if p == old_dir or p.startswith(prefix)]:
+            wd = self._paths.pop(path)
+            new_path = new_dir + path[len(old_dir):]
+            self._paths[new_path] = wd
+            self._watches[wd] = new_path
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                ready, _, _ = select.select([self._fd], [], [], 0.5)
+            except (OSError, ValueError):
+                return
+            if not ready:
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError:
+                return
+            try:
+                self._dispatch(self._parse(data))
+            except Exception as e:  # pylint: disable=W0718
+                self.logger.error("Error handling inotify events: %s", e)
+
+    def _parse(self, data):
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((wd, mask, cookie, os.fsdecode(name)))
+        return events
+
+    def _rel_path(self, wd, name):
+        rel_dir = self._watches.get(wd)
+        if rel_dir is None:
+            return None
+        return os.path.normpath(os.path.join(rel_dir, name)) if name else rel_dir
+
+    def _dispatch(self, events):
+        pending_moves = {}  # cookie -> (rel_path, is_dir)
+        for wd, mask, cookie, name in events:
+            if mask & IN_Q_OVERFLOW:
+                self.on_event('overflow', '.', True, None)
+                continue
+            if mask & IN_IGNORED:
+                rel_dir = self._watches.pop(wd, None)
+                if rel_dir is not None and self._paths.get(rel_dir) == wd:
+                    del self._paths[rel_dir]
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                # Reported to the parent directory as a DELETE/MOVED_FROM
+                continue
+
+            rel_path = self._rel_path(wd, name)
+            if rel_path is None:
+                continue
+            is_dir = bool(mask & IN_ISDIR)
+
+            if mask & IN_CREATE:
+                self.on_event('created', rel_path, is_dir, None)
+            elif mask & IN_DELETE:
+                self.on_event('deleted', rel_path, is_dir, None)
+            elif mask & (IN_MODIFY | IN_CLOSE_WRITE):
+                self.on_event('modified', rel_path, is_dir, None)
+            elif mask & IN_MOVED_FROM:
+                pending_moves[cookie] = (rel_path, is_dir)
+            elif mask & IN_MOVED_TO:
+                source = pending_moves.pop(cookie, None)
+                if source is None:
+                    self.on_event('created', rel_path, is_dir, None)
+                else:
+                    if is_dir:
+                        self.rename_subtree(source[0], rel_path)
+                    self.on_event('renamed', source[0], is_dir, rel_path)
+
+        # Moves out of the watched tree never get a matching MOVED_TO
+        for rel_path, is_dir in pending_moves.values():
+            if is_dir:
+                self.remove_subtree(rel_path)
+            self.on_event('deleted', rel_path, is_dir, None)
@@ -0,0 +1,308 @@
+import logging
+import os
+import struct
+import threading
+from src.traversal import walk_tree
+
+logger = logging.getLogger("GitIndex")
+
+_HEADER = struct.Struct('>4sLL')
+# ctime, mtime (seconds and nanoseconds), dev, ino, mode, uid, gid, size
+_STAT_FIELDS = struct.Struct('>10L')
+_FLAGS = struct.Struct('>H')
+
+FLAG_EXTENDED = 0x4000
+FLAG_STAGE = 0x3000
+EXTENDED_SKIP_WORKTREE = 0x4000
+MODE_TYPE = 0o170000
+MODE_GITLINK = 0o160000
+MODE_DIRECTORY = 0o040000
+
+
+class GitIndexError(ValueError):
+    """Raised for an index file this parser cannot use."""
+
+
+def find_git_index(project_path):
+    """
+    Locate the index of the git work tree containing `project_path`.
+    Returns (index_path, prefix), where `prefix` is the project's path
+    inside the work tree ('' at its root), or None outside a repository.
+    """
+    path = os.path.abspath(project_path)
+    prefix = []
+    while True:
+        dot_git = os.path.join(path, '.git')
+        if os.path.isdir(dot_git):
+            git_dir = dot_git
+            break
+        if os.path.isfile(dot_git):
+            # Linked work trees and submodules point to their git directory
+            try:
+                with open(dot_git, 'r', encoding='utf-8') as file:
+                    line = file.readline().strip()
+            except OSError:
+                return None
+            if not line.startswith('gitdir:'):
+                return None
+            git_dir = os.path.join(path, line[len('gitdir:'):].strip())
+            break
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        prefix.append(os.path.basename(path))
+        path = parent
+    return os.path.join(git_dir, 'index'), '/'.join(reversed(prefix))
+
+
+def _hash_size(index_path):
+    """Object ids are 32 bytes in SHA-256 repositories, 20 otherwise."""
+    try:
+        with open(os.path.join(os.path.dirname(index_path), 'config'), 'r',
+                  encoding='utf-8') as file:
+            for line in file:
+                key, _, value = line.partition('=')
+                if key.strip().lower() == 'objectformat' and value.strip() == 'sha256':
+                    return 32
+    except OSError:
+        pass
+    return 20
+
+
+def _varint(data, offset):
+    """Decode the offset-encoded varint of index v4 path compression."""
+    byte = data[offset]
+    offset += 1
+    value = byte & 0x7f
+    while byte & 0x80:
+        byte = data[offset]
+        offset += 1
+        value = ((value + 1) << 7) | (byte & 0x7f)
+    return value, offset
+
+
+def parse_index(data, hash_size=20):
+    """
+    Return the paths of the files tracked in the contents of a `.git/index`
+    (versions 2 to 4), in index order. Unmerged paths are listed once, and
+    gitlinks, sparse directory entries and skip-worktree files - none of
+    which are files in the work tree - are left out.
+    Raises GitIndexError for anything else than a complete index.
+    """
+    if len(data) < _HEADER.size:
+        raise GitIndexError("Index file is truncated")
+    signature, version, count = _HEADER.unpack_from(data)
+    if signature != b'DIRC' or version not in (2, 3, 4):
+        raise GitIndexError(f"Unsupported index format: {signature!r} v{version}")
+
+    paths = []
+    previous = b''
+    last_added = None
+    offset = _HEADER.size
+    flags_offset = _STAT_FIELDS.size + hash_size
+    try:
+        for _ in range(count):
+            entry_start = offset
+            mode = _STAT_FIELDS.unpack_from(data, offset)[6]
+            (flags,) = _FLAGS.unpack_from(data, offset + flags_offset)
+            offset += flags_offset + _FLAGS.size
+            skip_worktree = False
+            if flags & FLAG_EXTENDED:
+                (extended,) = _FLAGS.unpack_from(data, offset)
+                skip_worktree = bool(extended & EXTENDED_SKIP_WORKTREE)
+                offset += _FLAGS.size
+
+            if version == 4:
+                strip, offset = _varint(data, offset)
+                end = data.index(b'\0', offset)
+                name = previous[:len(previous) - strip] + data[offset:end]
+                offset = end + 1
+            else:
+                end = data.index(b'\0', offset)
+                name = data[offset:end]
+                # Entries are NUL-padded to a multiple of eight bytes
+                offset = entry_start + ((end - entry_start + 8) & ~7)
+            previous = name
+
+            mode_type = mode & MODE_TYPE
+            if skip_worktree or mode_type in (MODE_GITLINK, MODE_DIRECTORY):
+                continue
+            if flags & FLAG_STAGE and name == last_added:
+                continue  # Further stages of a conflicted path
+            paths.append(name)
+            last_added = name
+    except (struct.error, ValueError, IndexError) as e:
+        raise GitIndexError(f"Index file is corrupt: {e}") from e
+
+    # A split index keeps most entries in a shared file
+    while offset + 8 <= len(data) - hash_size:
+        signature = data[offset:offset + 4]
+        (size,) = struct.unpack_from('>L', data, offset + 4)
+        if signature == b'link':
+            raise GitIndexError("Split indexes are not supported")
+        offset += 8 + size
+    return [path.decode('utf-8', errors='surrogateescape') for path in paths]
+
+
+class GitIndex:
+    """
+    Tracked files of the git repository containing a project, read straight
+    from `.git/index` and arranged as a directory tree. The index is parsed
+    again only when its mtime or size changes.
+    """
+
+    def __init__(self, project_path):
+        self.project_path = project_path
+        self._stamp = None
+        self._tree = None
+        self._refreshed_tree = None
+        self._lock = threading.Lock()
+
+    def tree(self):
+        """
+        Return {folder: (dirnames, filenames)} for the tracked files below
+        the project, or None when it is not in a usable git repository.
+        """
+        location = find_git_index(self.project_path)
+        if location is None:
+            return None
+        index_path, prefix = location
+        try:
+            st = os.stat(index_path)
+        except OSError:
+            return None
+        stamp = (index_path, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if stamp == self._stamp:
+                return self._tree
+            try:
+                with open(index_path, 'rb') as file:
+                    paths = parse_index(file.read(), _hash_size(index_path))
+            except (OSError, GitIndexError) as e:
+                logger.warning("Cannot use git index %s: %s", index_path, e)
+                return None
+            self._tree = self._build_tree(paths, prefix)
+            self._stamp = stamp
+            logger.info("Read %d tracked files from %s", len(paths), index_path)
+            return self._tree
+
+    def refresh(self):
+        """
+        Re-read the index if it changed on disk. Returns True if the tracked
+        files differ from the last call, so a `git add` or a checkout can be
+        picked up even though `.git` itself is never watched.
+        """
+        tree = self.tree()
+        changed = tree is not self._refreshed_tree and tree != self._refreshed_tree
+        self._refreshed_tree = tree
+        return changed
+
+    def is_tracked(self, rel_path, is_dir):
+        """
+        Check if a path below the project is tracked, a directory being
+        tracked when it holds a tracked file. None outside a repository.
+        """
+        tree = self.tree()
+        if tree is None:
+            return None
+        rel_path = os.path.normpath(rel_path)
+        if is_dir:
+            return rel_path in tree
+        folder, name = os.path.split(rel_path)
+        return name in tree.get(folder or '.', ((), ()))[1]
+
+    @staticmethod
+    def _build_tree(paths, prefix):
+        tree = {'.': (set(), set())}
+        start = len(prefix) + 1 if prefix else 0
+        for path in paths:
+            if prefix and not path.startswith(prefix + '/'):
+                continue
+            parts = path[start:].split('/')
+            folder = '.'
+            for name in parts[:-1]:
+                tree[folder][0].add(name)
+                folder = name if folder == '.' else os.path.join(folder, name)
+                if folder not in tree:
+                    tree[folder] = (set(), set())
+            tree[folder][1].add(parts[-1])
+        return tree
+
+
+def walk_git_tree(root, tree, rel_dir='.', is_excluded=None, is_excluded_untracked=None,
+                  include_untracked=False, max_depth=None):
+    """
+    Walk the tracked files of `tree` (from `GitIndex.tree`) like `walk_tree`,
+    yielding (folder, dirnames, filenames) top-down and sorted by name.
+
+    Tracked paths are only checked with `is_excluded`, meant for the ignore
+    rules git does not already apply (like `.agentignore`). Every tracked
+    directory is listed, so files deleted from the work tree are dropped.
+    With `include_untracked`, untracked entries are kept unless
+    `is_excluded_untracked` (all ignore rules) excludes them, untracked
+    directories being walked with `walk_tree`.
+    """
+    rel_dir = os.path.normpath(rel_dir)
+    if rel_dir not in tree:
+        if include_untracked:
+            yield from walk_tree(root, rel_dir, is_excluded_untracked, max_depth=max_depth)
+        return
+    if is_excluded is not None and is_excluded(rel_dir, True):
+        return
+
+    stack = [(rel_dir, 1, True)]
+    while stack:
+        folder, level, tracked = stack.pop()
+        if not tracked:
+            remaining = None if max_depth is None else max_depth - level + 1
+            yield from walk_tree(root, folder, is_excluded_untracked, max_depth=remaining)
+            continue
+
+        tracked_dirs, tracked_files = tree[folder]
+        subdirs = []
+        dirnames, filenames = [], []
+        listing = _list_directory(root, folder)
+        if listing is None:
+            continue
+
+        for name, is_dir in listing:
+            rel_path = name if folder == '.' else os.path.join(folder, name)
+            is_tracked = name in tracked_dirs if is_dir else name in tracked_files
+            if is_tracked:
+                if is_excluded is not None and is_excluded(rel_path, is_dir):
+                    continue
+            elif not include_untracked or name == '.git' or (
+                    is_excluded_untracked is not None
+                    and is_excluded_untracked(rel_path, is_dir)):
+                continue
+            if is_dir:
+                dirnames.append(name)
+                subdirs.append((rel_path, is_tracked))
+            else:
+                filenames.append(name)
+
+        dirnames.sort()
+        filenames.sort()
+        yield folder, dirnames, filenames
+
+        if max_depth is not None and level >= max_depth:
+            continue
+        subdirs.sort(reverse=True)
+        stack.extend((path, level + 1, is_tracked) for path, is_tracked in subdirs)
+
+
+def _list_directory(root, folder):
+    """Return the (name, is_dir) entries of a directory, or None if it is gone."""
+    try:
+        with os.scandir(os.path.join(root, folder)) as entries:
+            listing = []
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    is_dir = False
+                listing.append((entry.name, is_dir))
+            return listing
+    except OSError as e:
+        logger.debug("Cannot list %s: %s", folder, e)
+        return None
@@ -0,0 +1,143 @@
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+BINARY_SNIFF_BYTES = 8192
+# Files handed to a worker per task, to amortize the inter-process round trip
+BATCH_SIZE = 32
+MAX_LINE_LENGTH = 500
+
+
+def grep_files(root, rel_paths, pattern, flags, max_file_size, max_matches, deadline=None):
+    """
+    Search files for a regular expression, in a worker process. Binary files
+    (a NUL byte in the first block) and files above `max_file_size` are
+    skipped. Returns (matches, scanned, skipped), with one
+    (path, line, column, text) match per matching line and at most
+    `max_matches` of them. The search stops early, before the next file or
+    match, once the wall-clock time `deadline` (from `time.time()`) passed.
+    """
+    regex = re.compile(pattern, flags | re.MULTILINE)
+    matches = []
+    scanned = skipped = 0
+    for rel_path in rel_paths:
+        if deadline is not None and time.time() >= deadline:
+            break
+        try:
+            with open(os.path.join(root, rel_path), 'rb') as file:
+                if os.fstat(file.fileno()).st_size > max_file_size:
+                    skipped += 1
+                    continue
+                head = file.read(BINARY_SNIFF_BYTES)
+                if b'\0' in head:
+                    skipped += 1
+                    continue
+                data = head + file.read()
+        except OSError:
+            skipped += 1
+            continue
+        scanned += 1
+        text = data.decode('utf-8', errors='replace')
+
+        line_no, line_pos, last_line = 1, 0, 0
+        for match in regex.finditer(text):
+            line_no += text.count('\n', line_pos, match.start())
+            line_pos = match.start()
+            if line_no == last_line:
+                continue
+            last_line = line_no
+            line_start = text.rfind('\n', 0, match.start()) + 1
+            line_end = text.find('\n', match.start())
+            line = text[line_start:line_end if line_end != -1 else len(text)]
+            matches.append((rel_path, line_no, match.start() - line_start + 1,
+                            line[:MAX_LINE_LENGTH]))
+            if len(matches) >= max_matches:
+                return matches, scanned, skipped
+            if deadline is not None and time.time() >= deadline:
+                return matches, scanned, skipped
+    return matches, scanned, skipped
+
+
+def _batches(rel_paths, size):
+    batch = []
+    for rel_path in rel_paths:
+        batch.append(rel_path)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_grep(root, rel_paths, pattern, flags, max_results, deadline_ms,
+              max_file_size, executor=None, max_in_flight=8, on_overrun=None):
+    """
+    Yield grep records: one {"type": "match", ...} per matching line as soon
+    as its batch of files has been searched, then a {"type": "summary", ...}
+    record with the number of files scanned and skipped, and whether the
+    results are partial.
+
+    Batches run on `executor` (a process pool, so regex work is not bound by
+    the GIL) with at most `max_in_flight` outstanding, or inline without one.
+    The search stops at `max_results` matches or after `deadline_ms`, and
+    batches not yet started are cancelled. Workers stop at the deadline as
+    well; batches still running then, like a regular expression stuck in
+    backtracking, are passed to `on_overrun(executor, futures)`.
+    """
+    deadline = time.monotonic() + deadline_ms / 1000
+    # Workers in other processes compare against the wall clock
+    wall_deadline = time.time() + deadline_ms / 1000
+    batches = _batches(rel_paths, BATCH_SIZE)
+    found = scanned = skipped = 0
+    truncated = timed_out = False
+    in_flight = {}
+
+    def submit():
+        """Run the next batch inline, or top up the batches in flight."""
+        while executor is None or len(in_flight) < max_in_flight:
+            batch = next(batches, None)
+            if batch is None:
+                break
+            args = (root, batch, pattern, flags, max_file_size, max_results - found,
+                    wall_deadline)
+            if executor is None:
+                return batch, grep_files(*args)
+            in_flight[executor.submit(grep_files, *args)] = batch
+        return None
+
+    try:
+        while True:
+            inline = submit()
+            if inline is not None:
+                done = [inline]
+            elif in_flight:
+                finished, _ = wait(in_flight, timeout=max(deadline - time.monotonic(), 0),
+                                   return_when=FIRST_COMPLETED)
+                done = [(in_flight.pop(future), future.result()) for future in finished]
+            else:
+                break
+
+            for _, (matches, batch_scanned, batch_skipped) in done:
+                scanned += batch_scanned
+                skipped += batch_skipped
+                for rel_path, line, column, text in matches:
+                    if found == max_results:
+                        truncated = True
+                        break
+                    found += 1
+                    yield {"type": "match", "path": rel_path, "line": line,
+                           "column": column, "text": text}
+            if found == max_results:
+                truncated = True
+                break
+            if time.monotonic() >= deadline:
+                timed_out = True
+                break
+    finally:
+        running = [future for future in in_flight if not future.cancel()]
+        if running and on_overrun is not None:
+            on_overrun(executor, running)
+
+    yield {"type": "summary", "files_scanned": scanned, "files_skipped": skipped,
+           "matches": found, "truncated": truncated, "timed_out": timed_out}
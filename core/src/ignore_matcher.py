@@ -0,0 +1,143 @@
+import logging
+import os
+import re
+import threading
+from pathspec.patterns import GitWildMatchPattern
+
+# Patterns without wildcards or inner slashes, like 'venv/' or '.env', match
+# a single path component and can be checked with a set lookup
+LITERAL_NAME = re.compile(r'^[\w.\-]*[\w\-][\w.\-]*/?$')
+UNANCHORED_PREFIX = '^(?:.+/)?'
+
+
+class _RuleGroup:
+    """A run of consecutive patterns sharing the same polarity."""
+    __slots__ = ("include", "names", "dir_names", "unanchored", "anchored", "regex")
+
+    def __init__(self, include):
+        self.include = include
+        self.names = set()
+        self.dir_names = set()
+        self.unanchored = []
+        self.anchored = []
+        self.regex = None
+
+    def add(self, pattern, regex):
+        body = pattern[1:] if pattern.startswith('!') else pattern
+        if LITERAL_NAME.match(body):
+            if body.endswith('/'):
+                self.dir_names.add(body[:-1])
+            else:
+                self.names.add(body)
+        elif regex.startswith(UNANCHORED_PREFIX):
+            self.unanchored.append(regex[len(UNANCHORED_PREFIX):])
+        else:
+            self.anchored.append(regex)
+
+    def compile(self):
+        # Unanchored patterns share their '(?:.+/)?' prefix so it is only
+        # scanned once for the whole group
+        alternatives = list(self.anchored)
+        if self.unanchored:
+            alternatives.append(
+                UNANCHORED_PREFIX + '(?:' + '|'.join(self.unanchored) + ')')
+        if alternatives:
+            self.regex = re.compile('|'.join(f'(?:{r})' for r in alternatives))
+        return self
+
+    def match(self, path, parts):
+        if self.names and not self.names.isdisjoint(parts):
+            return True
+        # Every component but the last is followed by a slash
+        if self.dir_names and not self.dir_names.isdisjoint(parts[:-1]):
+            return True
+        return self.regex is not None and self.regex.match(path) is not None
+
+
+class IgnoreMatcher:
+    """
+    Matches paths against the patterns of several ignore files.
+
+    All patterns are compiled once into a handful of rule groups (one per run of
+    consecutive ignore or negated '!' patterns). Plain names are checked with
+    set lookups on the path components and everything else with one combined
+    regex, instead of pathspec's per-pattern loop. The compiled rules are
+    cached against the mtime and size of every ignore file and are only
+    rebuilt when one of them changes.
+    """
+
+    def __init__(self, ignore_files):
+        self.ignore_files = [f for f in ignore_files if f]
+        self.logger = logging.getLogger("IgnoreMatcher")
+        self._fingerprint = None
+        self._rules = []
+        self._lock = threading.Lock()
+
+    @property
+    def fingerprint(self):
+        """The (path, mtime_ns, size) tuples the current rules were built from."""
+        return self._fingerprint
+
+    def _stat_files(self):
+        fingerprint = []
+        for ignore_file in self.ignore_files:
+            try:
+                st = os.stat(ignore_file)
+                fingerprint.append((ignore_file, st.st_mtime_ns, st.st_size))
+            except OSError:
+                fingerprint.append((ignore_file, None, None))
+        return tuple(fingerprint)
+
+    def refresh(self):
+        """Recompile the rules if any ignore file changed. Returns True if it did."""
+        fingerprint = self._stat_files()
+        if fingerprint == self._fingerprint:
+            return False
+        with self._lock:
+            if fingerprint == self._fingerprint:
+                return False
+            self._rules = self._compile(fingerprint)
+            self._fingerprint = fingerprint
+        self.logger.debug("Compiled %d ignore rule groups from %s",
+                          len(self._rules), self.ignore_files)
+        return True
+
+    def _compile(self, fingerprint):
+        groups = []
+        for ignore_file, mtime_ns, _ in fingerprint:
+            if mtime_ns is None:
+                continue
+            with open(ignore_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    pattern = line.rstrip('\n')
+                    regex, include = GitWildMatchPattern.pattern_to_regex(
+                        pattern)
+                    if include is None:
+                        continue
+                    # pathspec tags directory matches with a named group that
+                    # would clash once several patterns share one regex
+                    regex = regex.replace('(?P<ps_d>', '(?:')
+                    if not groups or groups[-1].include != include:
+                        groups.append(_RuleGroup(include))
+                    groups[-1].add(pattern, regex)
+
+        # Later patterns take precedence, so the last group is checked first
+        return [group.compile() for group in reversed(groups)]
+
+    def match(self, path, is_dir=False):
+        """Check if a project-relative path is ignored."""
+        if not self._rules:
+            return False
+        norm_path = path.replace(os.sep, '/') if os.sep != '/' else path
+        if is_dir:
+            # Directory patterns like 'venv/' only match with a trailing slash
+            norm_path = norm_path.rstrip('/') + '/'
+        if norm_path.startswith('./'):
+            norm_path = norm_path[2:]
+        elif norm_path.startswith('/'):
+            norm_path = norm_path[1:]
+        parts = norm_path.split('/')
+        for group in self._rules:
+            if group.match(norm_path, parts):
+                return group.include
+        return False
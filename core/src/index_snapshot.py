@@ -0,0 +1,84 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+
+# Bumped whenever the layout of the snapshot changes
+FORMAT_VERSION = 1
+
+
+
+def default_snapshot_path(project_path):
+    """
+    Snapshot location for a project in the user's cache directory, outside
+    the project and keyed by its absolute path so projects never share one.
+    """
+    cache_dir = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    key = hashlib.sha256(os.path.abspath(project_path).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, 'codequery', key, 'tree_index.sqlite')
+class IndexSnapshot:
+    """
+    SQLite snapshot of the tree index, so a restarted Core can serve the
+    project structure without walking it first.
+
+    A snapshot is tied to a `key` describing everything the indexed tree
+    depends on (project root, ignore rules, symlink policy); loading with a
+    different key finds nothing. Snapshots are written to a temporary file
+    and moved into place, so readers never see a partial one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.logger = logging.getLogger("IndexSnapshot")
+
+    def load(self, key):
+        """
+        Return the saved directories as {folder: (mtime_ns, dirnames,
+        filenames)}, or None when there is no usable snapshot for `key`.
+        """
+        if not os.path.exists(self.path):
+            return None
+        try:
+            connection = sqlite3.connect(self.path)
+            try:
+                meta = dict(connection.execute("SELECT name, value FROM meta"))
+                if meta.get("version") != str(FORMAT_VERSION) or meta.get("key") != key:
+                    self.logger.info("Ignoring index snapshot built for another configuration")
+                    return None
+                return {folder: (mtime_ns, json.loads(dirnames), json.loads(filenames))
+                        for folder, mtime_ns, dirnames, filenames in connection.execute(
+                            "SELECT folder, mtime_ns, dirnames, filenames FROM dirs")}
+            finally:
+                connection.close()
+        except (sqlite3.Error, ValueError) as e:
+            self.logger.warning("Could not load index snapshot %s: %s", self.path, e)
+            return None
+
+    def save(self, key, records):
+        """Replace the snapshot with (folder, mtime_ns, dirnames, filenames) records."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        if os.path.exists(temp_path):  # Left over by a crash
+            os.unlink(temp_path)
+        connection = sqlite3.connect(temp_path)
+        try:
+            with connection:
+                connection.execute("CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)")
+                connection.execute(
+                    "CREATE TABLE dirs (folder TEXT PRIMARY KEY, mtime_ns INTEGER,"
+                    " dirnames TEXT, filenames TEXT)")
+                connection.executemany("INSERT INTO meta VALUES (?, ?)",
+                                       [("version", str(FORMAT_VERSION)), ("key", key)])
+                connection.executemany(
+                    "INSERT INTO dirs VALUES (?, ?, ?, ?)",
+                    ((folder, mtime_ns, json.dumps(dirnames), json.dumps(filenames))
+                     for folder, mtime_ns, dirnames, filenames in records))
+        except BaseException:
+            connection.close()
+            os.unlink(temp_path)
+            raise
+        connection.close()
+        os.replace(temp_path, self.path)
@@ -0,0 +1,86 @@
+import mmap
+import os
+
+COUNT_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def count_lines(mapped, size):
+    """Count lines in a mapped file, chunk by chunk to keep memory bounded."""
+    if not size:
+        return 0
+    newlines = 0
+    for start in range(0, size, COUNT_CHUNK_SIZE):
+        newlines += mapped[start:start + COUNT_CHUNK_SIZE].count(b'\n')
+    # A last line without a trailing newline still counts
+    return newlines + (mapped[size - 1:size] != b'\n')
+
+
+def _char_start(mapped, position, limit):
+    """Move `position` forward to the first byte of a UTF-8 character."""
+    while position < limit and mapped[position] & 0xC0 == 0x80:
+        position += 1
+    return position
+
+
+def _char_end(mapped, position):
+    """Move `position` back so it does not split a UTF-8 character."""
+    while position > 0 and mapped[position] & 0xC0 == 0x80:
+        position -= 1
+    return position
+
+
+def preview_file(full_path, max_bytes, line_count=None, max_count_bytes=None):
+    """
+    Return a head/tail preview of a file that is too large to send whole.
+
+    The file is memory-mapped, so only the previewed pages are read. Head and
+    tail share `max_bytes` and are cut at line boundaries, or at a character
+    boundary when their window holds no line break. The byte offsets they
+    cover are always returned, so the omitted middle can be requested as a
+    byte range; line numbers are added for the cuts made at line boundaries.
+
+    Lines are only counted in files up to `max_count_bytes` (no limit if
+    None) unless `line_count` is already known; without a count, the
+    `line_count` and `tail_start_line` are left out.
+    """
+    with open(full_path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if not size:
+            return {"content": "", "truncated": False, "size": 0, "line_count": 0}
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if line_count is None and (max_count_bytes is None or size <= max_count_bytes):
+                line_count = count_lines(mapped, size)
+            head_bytes = min(max_bytes // 2, size)
+            tail_bytes = max_bytes - head_bytes
+
+            head_end = mapped.rfind(b'\n', 0, head_bytes) + 1
+            head_at_line = head_end > 0 or not head_bytes
+            if not head_at_line:
+                head_end = _char_end(mapped, head_bytes) if head_bytes < size else size
+            head = mapped[:head_end]
+
+            tail_start = max(size - tail_bytes, head_end)
+            tail_at_line = tail_start == head_end and head_at_line \
+                or mapped[tail_start - 1:tail_start] == b'\n'
+            if not tail_at_line:
+                cut = mapped.find(b'\n', tail_start, size)
+                tail_at_line = cut != -1
+                tail_start = cut + 1 if tail_at_line else _char_start(mapped, tail_start, size)
+            tail = mapped[tail_start:size]
+
+    preview = {
+        "content": head.decode('utf-8', errors='replace'),
+        "tail": tail.decode('utf-8', errors='replace'),
+        "truncated": True,
+        "size": size,
+        "head_end_offset": head_end,
+        "tail_start_offset": tail_start,
+    }
+    if line_count is not None:
+        preview["line_count"] = line_count
+    if head_at_line:
+        preview["head_end_line"] = head.count(b'\n')
+    if tail_at_line and line_count is not None:
+        tail_lines = tail.count(b'\n') + (tail[-1:] not in (b'', b'\n'))
+        preview["tail_start_line"] = line_count - tail_lines + 1
+    return preview
@@ -0,0 +1,90 @@
+import threading
+from array import array
+from collections import OrderedDict
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class LineIndex:
+    """Byte offsets of the start of every line of a file."""
+    __slots__ = ("offsets", "size", "mtime_ns")
+
+    def __init__(self, offsets, size, mtime_ns):
+        self.offsets = offsets
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    @classmethod
+    def build(cls, file, size, mtime_ns):
+        """Scan an open binary file once and record where each line starts."""
+        offsets = array('Q')
+        if size:
+            offsets.append(0)
+        position = 0
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            newline = chunk.find(b'\n')
+            while newline != -1:
+                offsets.append(position + newline + 1)
+                newline = chunk.find(b'\n', newline + 1)
+            position += len(chunk)
+        # A trailing newline does not start another line
+        if offsets and offsets[-1] >= position:
+            offsets.pop()
+        return cls(offsets, position, mtime_ns)
+
+    @property
+    def total_lines(self):
+        """Number of lines, counting a last line without a trailing newline."""
+        return len(self.offsets)
+
+    def byte_span(self, start_line, end_line):
+        """
+        Return the (start, end) byte offsets of lines `start_line` through
+        `end_line` (1-based, inclusive), clamped to the file.
+        """
+        end_line = min(end_line, self.total_lines)
+        if start_line > end_line:
+            return self.size, self.size
+        start = self.offsets[start_line - 1]
+        end = self.offsets[end_line] if end_line < self.total_lines else self.size
+        return start, end
+
+
+class LineIndexCache:
+    """
+    Bounded LRU cache of line indexes keyed by file path. Entries are rebuilt
+    when the file's mtime or size changes.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def peek(self, full_path, mtime_ns, size):
+        """Return the cached line index of a file if it is current, without building one."""
+        with self._lock:
+            index = self._entries.get(full_path)
+        if index is not None and index.mtime_ns == mtime_ns and index.size == size:
+            return index
+        return None
+
+    def get(self, full_path, file, st):
+        """Return the line index of `file` (an open binary file with stat `st`)."""
+        with self._lock:
+            index = self._entries.get(full_path)
+            if index is not None and index.mtime_ns == st.st_mtime_ns \
+                    and index.size == st.st_size:
+                self._entries.move_to_end(full_path)
+                return index
+
+        index = LineIndex.build(file, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            self._entries[full_path] = index
+            self._entries.move_to_end(full_path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
@@ -0,0 +1,130 @@
+import ast
+import os
+import re
+from src.symbol_index import LANGUAGES, extract_symbols
+
+# Larger files are read as usual instead of being outlined
+MAX_FILE_SIZE = 8 * 1024 * 1024
+
+OUTLINE_LANGUAGES = dict(LANGUAGES, **{'.md': 'markdown', '.markdown': 'markdown'})
+# Kinds whose members are listed in brace-delimited languages
+CONTAINER_KINDS = ('class', 'interface', 'struct', 'enum')
+
+_DOCSTRING_OPENER = re.compile(r'^[rRuUbBfF]*("""|\'\'\'|"|\')$')
+_FENCE = re.compile(r'^\s*(```|~~~)')
+
+
+def outline_language(rel_path):
+    """Return the language of a file an outline can be built for, or None."""
+    return OUTLINE_LANGUAGES.get(os.path.splitext(rel_path)[1].lower())
+
+
+def _header_end(lines, node):
+    """Last line of a class or function header: the one ending with its colon."""
+    last = max(node.body[0].lineno - 1, node.lineno)
+    for line_no in range(node.lineno, last + 1):
+        if lines[line_no - 1].split('#', 1)[0].rstrip().endswith(':'):
+            return line_no
+    return node.lineno
+
+
+def _python_lines(text, lines):
+    keep = set()
+
+    def keep_docstring(body):
+        first = body[0] if body else None
+        if (isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant)
+                and isinstance(first.value.value, str)):
+            keep.add(first.lineno)
+            # A docstring opening on its own line is summarized by the next one
+            if (_DOCSTRING_OPENER.match(lines[first.lineno - 1].strip())
+                    and first.end_lineno > first.lineno):
+                keep.add(first.lineno + 1)
+
+    def visit(body, in_class):
+        for node in body:
+            if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                for decorator in node.decorator_list:
+                    keep.update(range(decorator.lineno, decorator.end_lineno + 1))
+                keep.update(range(node.lineno, _header_end(lines, node) + 1))
+                keep_docstring(node.body)
+                if isinstance(node, ast.ClassDef):
+                    visit(node.body, True)
+            elif isinstance(node, (ast.Import, ast.ImportFrom)) and not in_class:
+                keep.update(range(node.lineno, node.end_lineno + 1))
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                keep.add(node.lineno)
+
+    module = ast.parse(text)
+    keep_docstring(module.body)
+    visit(module.body, False)
+    return keep
+
+
+def _brace_lines(rel_path, text, lines, comments):
+    """
+    Lines at the top level of the file, plus the members of classes,
+    interfaces, structs and enums; function bodies and comments are dropped.
+    """
+    containers = [(start, end) for _, _, kind, start, end in extract_symbols(rel_path, text)
+                  if kind in CONTAINER_KINDS]
+    keep = set()
+    depth = 0
+    for line_no, line in enumerate(lines, 1):
+        stripped = line.strip()
+        if stripped and not stripped.startswith(comments):
+            if depth == 0 or (depth == 1 and any(
+                    start < line_no <= end for start, end in containers)):
+                keep.add(line_no)
+        depth = max(depth + line.count('{') - line.count('}'), 0)
+    return keep
+
+
+def _markdown_lines(lines):
+    keep = set()
+    in_fence = False
+    for line_no, line in enumerate(lines, 1):
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        elif not in_fence and line.startswith('#'):
+            keep.add(line_no)
+    return keep
+
+
+def build_outline(rel_path, text):
+    """
+    Return a skeleton of a source file: the signatures of its classes and
+    functions with their docstrings' first lines, imports and top-level
+    assignments for Python, the top-level declarations and container
+    members of brace-delimited languages, or the headings of Markdown.
+    Every line is prefixed with its line number and elided bodies are
+    marked with `...`. Returns None when no outline can be built.
+    """
+    language = outline_language(rel_path)
+    lines = text.split('\n')
+    if language == 'python':
+        try:
+            keep = _python_lines(text, lines)
+        except (SyntaxError, ValueError):
+            return None
+    elif language == 'markdown':
+        keep = _markdown_lines(lines)
+    elif language == 'shell':
+        keep = _brace_lines(rel_path, text, lines, ('#',))
+    elif language is not None:
+        keep = _brace_lines(rel_path, text, lines, ('//', '/*', '*'))
+    else:
+        return None
+
+    width = len(str(len(lines)))
+    result = []
+    previous = 0
+    for line_no in sorted(keep) + [len(lines) + 1]:
+        skipped = [line for line in lines[previous:line_no - 1] if line.strip()]
+        if skipped:
+            indent = skipped[0][:len(skipped[0]) - len(skipped[0].lstrip())]
+            result.append(f"{'':>{width}}  {indent}...")
+        if line_no <= len(lines):
+            result.append(f"{line_no:>{width}}: {lines[line_no - 1]}".rstrip())
+        previous = line_no
+    return '\n'.join(result) + '\n' if result else ''
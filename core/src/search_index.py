@@ -0,0 +1,333 @@
+import logging
+import os
+import re
+import stat
+import threading
+from collections import defaultdict
+from itertools import count
+
+# The regex parser is private; without it, queries are not narrowed down
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    try:
+        import sre_parse  # pylint: disable=W4901
+    except ImportError:
+        sre_parse = None
+
+BINARY_SNIFF_BYTES = 8192
+
+
+def trigrams(text):
+    """Return the set of lowercased three-character substrings of `text`."""
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def pack_trigrams(grams):
+    """Pack a set of trigrams into one string, far smaller than the set."""
+    return ''.join(grams)
+
+
+def unpack_trigrams(packed):
+    """Yield the trigrams of a string made by `pack_trigrams`."""
+    for i in range(0, len(packed), 3):
+        yield packed[i:i + 3]
+
+
+def required_literals(pattern):
+    """
+    Return literal strings every match of the regular expression `pattern`
+    must contain. Only sequences, groups and mandatory repeats are followed;
+    alternations, classes and lookarounds end a literal run. Returns no
+    literals when the private regex parser is not available.
+    """
+    if sre_parse is None:
+        return []
+    # The opcodes are re-exported from re._constants, which pylint cannot see
+    # pylint: disable=E1101
+    runs = []
+
+    def visit(parsed):
+        current = []
+        for op, av in parsed:
+            if op is sre_parse.LITERAL:
+                current.append(chr(av))
+                continue
+            if current:
+                runs.append(''.join(current))
+                current = []
+            if op is sre_parse.SUBPATTERN:
+                visit(av[-1])
+            elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+                visit(av[2])
+        if current:
+            runs.append(''.join(current))
+
+    visit(sre_parse.parse(pattern))
+    return runs
+
+
+class TrigramIndex:
+    """
+    Full-text index mapping every trigram of the project's text files to the
+    files containing it. Queries intersect the posting sets of their
+    trigrams and only the remaining candidate files are read to verify
+    matches.
+
+    Trigrams are lowercased, so one index serves case-sensitive and
+    case-insensitive queries. Text files larger than `max_file_size` are not
+    indexed but always scanned, up to `max_scan_size`; larger ones are
+    reported as skipped. The index is kept current incrementally:
+    `handle_event` takes tree index events and only marks files as dirty,
+    and every `sync` re-reads the dirty files whose mtime or size changed.
+    Files are read without holding the index lock, so searches are not held
+    up by a sync, and only swapped in under it. Searches still wait for the
+    first full sync, as the index is incomplete until then.
+    `list_files()` must yield the project-relative paths of every visible
+    file, and is used for full syncs.
+    """
+
+    def __init__(self, project_path, list_files, is_excluded,
+                 max_file_size=1024 * 1024, max_scan_size=8 * 1024 * 1024):
+        self.project_path = project_path
+        self.list_files = list_files
+        self.is_excluded = is_excluded
+        self.max_file_size = max_file_size
+        self.max_scan_size = max_scan_size
+        self.logger = logging.getLogger("TrigramIndex")
+        self._postings = defaultdict(set)
+        # rel_path -> ((mtime_ns, size), packed trigrams or None for skipped files)
+        self._docs = {}
+        # Text files too large to index, candidates for every query
+        self._large = set()
+        self._dirty = set()
+        self._full_sync = True
+        self._built = threading.Event()
+        # rel_path -> ticket of the latest refresh in progress
+        self._refreshing = {}
+        self._tickets = count()
+        self._lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+
+    def handle_event(self, kind, rel_path, is_dir, dest_path=None):
+        """Mark the files touched by a tree index event for re-indexing."""
+        with self._pending_lock:
+            if is_dir or kind not in ('created', 'deleted', 'modified', 'renamed'):
+                self._full_sync = True
+            else:
+                self._dirty.add(rel_path)
+                if dest_path is not None:
+                    self._dirty.add(dest_path)
+
+    def invalidate(self):
+        """Check every file again on the next sync."""
+        with self._pending_lock:
+            self._full_sync = True
+
+    def sync(self):
+        """
+        Bring the index up to date with the pending changes, and wait for
+        the first full sync if another thread is running it.
+        """
+        with self._pending_lock:
+            full_sync, dirty = self._full_sync, self._dirty
+            self._full_sync, self._dirty = False, set()
+        try:
+            if full_sync:
+                present = set(self.list_files())
+                with self._lock:
+                    for rel_path in set(self._docs) - present:
+                        self._remove(rel_path)
+                dirty = present
+            for rel_path in dirty:
+                self._refresh(rel_path)
+        finally:
+            if full_sync:
+                self._built.set()
+        if full_sync:
+            with self._lock:
+                self.logger.info("Indexed %d files, %d trigrams",
+                                 len(self._docs), len(self._postings))
+        self._built.wait()
+
+    @property
+    def file_count(self):
+        """Number of indexed text files."""
+        with self._lock:
+            return sum(1 for _, grams in self._docs.values() if grams is not None)
+
+    def _refresh(self, rel_path):
+        """
+        Re-read a file if it changed, without holding the lock, and swap the
+        result in under it unless a later refresh of the file started since.
+        """
+        with self._lock:
+            ticket = self._refreshing[rel_path] = next(self._tickets)
+            doc = self._docs.get(rel_path)
+        full_path = os.path.join(self.project_path, rel_path)
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode) or self.is_excluded(rel_path, False):
+            self._swap(rel_path, ticket)
+            return
+
+        stamp = (st.st_mtime_ns, st.st_size)
+        if doc is not None and doc[0] == stamp:
+            with self._lock:
+                if self._refreshing.get(rel_path) == ticket:
+                    del self._refreshing[rel_path]
+            return
+        if st.st_size > self.max_file_size:
+            self._swap(rel_path, ticket, stamp, large=self.is_text(full_path))
+            return
+        text = self.read_text(full_path)
+        self._swap(rel_path, ticket, stamp, trigrams(text) if text is not None else None)
+
+    def _swap(self, rel_path, ticket, stamp=None, grams=None, large=False):
+        """Store the result of a refresh, or remove the file without a `stamp`."""
+        with self._lock:
+            if self._refreshing.get(rel_path) != ticket:
+                return  # Superseded by a later refresh
+            del self._refreshing[rel_path]
+            self._remove(rel_path)
+            if stamp is None:
+                return
+            self._docs[rel_path] = (stamp, pack_trigrams(grams) if grams is not None else None)
+            if large:
+                self._large.add(rel_path)
+            for gram in grams or ():
+                self._postings[gram].add(rel_path)
+
+    def _remove(self, rel_path):
+        self._large.discard(rel_path)
+        doc = self._docs.pop(rel_path, None)
+        if doc is None:
+            return
+        for gram in unpack_trigrams(doc[1] or ''):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(rel_path)
+                if not posting:
+                    del self._postings[gram]
+
+    @staticmethod
+    def is_text(full_path):
+        """Check if a file looks like text from its first bytes."""
+        try:
+            with open(full_path, 'rb') as file:
+                return b'\0' not in file.read(BINARY_SNIFF_BYTES)
+        except OSError:
+            return False
+
+    @staticmethod
+    def read_text(full_path):
+        """Return the text of a UTF-8 file, or None for binary or unreadable files."""
+        try:
+            with open(full_path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            return None
+        if b'\0' in data[:BINARY_SNIFF_BYTES]:
+            return None
+        try:
+            return data.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+
+    def candidates(self, required):
+        """
+        Return the sorted paths of the files containing every trigram of the
+        `required` literal strings, or of all text files when no trigram is
+        known. Text files too large to index are always included.
+        """
+        grams = set()
+        for literal in required:
+            grams |= trigrams(literal)
+        with self._lock:
+            if not grams:
+                return sorted(path for path, (_, doc_grams) in self._docs.items()
+                              if doc_grams is not None or path in self._large)
+            postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+            result = set(postings[0])
+            for posting in postings[1:]:
+                if not result:
+                    break
+                result &= posting
+            return sorted(result | self._large)
+
+    def search(self, query, regex=False, case_sensitive=False, rel_dir='.',
+               max_results=100, context_lines=2):
+        """
+        Find the lines matching a literal or regular expression `query` in
+        the files below `rel_dir`. Returns the matches, each with path,
+        1-based line and column and a snippet of surrounding lines, whether
+        they were truncated at `max_results`, how many files were indexed
+        and read, and the files over `max_scan_size` that were not read.
+        Raises ValueError for an invalid regular expression.
+        """
+        flags = re.MULTILINE | (0 if case_sensitive else re.IGNORECASE)
+        try:
+            pattern = re.compile(query if regex else re.escape(query), flags)
+            required = required_literals(query) if regex else [query]
+        except re.error as e:
+            raise ValueError(f"Invalid regular expression: {e}") from e
+
+        self.sync()
+        candidates = self.candidates(required)
+        if rel_dir != '.':
+            prefix = rel_dir + os.sep
+            candidates = [path for path in candidates if path.startswith(prefix)]
+
+        matches = []
+        truncated = False
+        scanned = 0
+        skipped = []
+        for rel_path in candidates:
+            full_path = os.path.join(self.project_path, rel_path)
+            try:
+                if os.path.getsize(full_path) > self.max_scan_size:
+                    skipped.append(rel_path)
+                    continue
+            except OSError:
+                continue
+            text = self.read_text(full_path)
+            if text is None:
+                continue
+            scanned += 1
+            truncated = self._match_file(rel_path, text, pattern, matches,
+                                         max_results, context_lines)
+            if truncated:
+                break
+
+        return {"matches": matches, "truncated": truncated,
+                "files_indexed": self.file_count, "files_scanned": scanned,
+                "skipped": skipped}
+
+    @staticmethod
+    def _match_file(rel_path, text, pattern, matches, max_results, context_lines):
+        """Append the matches of one file. Returns True once `max_results` is exceeded."""
+        lines = None
+        line_no, line_pos, last_line = 1, 0, 0
+        for match in pattern.finditer(text):
+            line_no += text.count('\n', line_pos, match.start())
+            line_pos = match.start()
+            if line_no == last_line:
+                continue  # One result per line
+            last_line = line_no
+            if len(matches) == max_results:
+                return True
+            if lines is None:
+                lines = text.split('\n')
+            line_start = text.rfind('\n', 0, match.start()) + 1
+            first = max(line_no - context_lines, 1)
+            matches.append({
+                "path": rel_path,
+                "line": line_no,
+                "column": match.start() - line_start + 1,
+                "snippet": '\n'.join(lines[first - 1:line_no + context_lines]),
+                "snippet_start_line": first,
+            })
+        return False
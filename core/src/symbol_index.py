@@ -0,0 +1,338 @@
+import ast
+import logging
+import os
+import re
+import stat
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from itertools import count
+
+# Files handed to a worker per task, to amortize the inter-process round trip
+BATCH_SIZE = 64
+# How far a brace-delimited body is followed to find where a definition ends
+MAX_BODY_LINES = 5000
+
+_JS_PATTERNS = [
+    (re.compile(r'^[ \t]*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)',
+                re.M), 'function'),
+    (re.compile(r'^[ \t]*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+([A-Za-z_$][\w$]*)',
+                re.M), 'class'),
+    (re.compile(r'^[ \t]*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*(?::[^=]+)?='
+                r'\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|[A-Za-z_$][\w$]*\s*=>)',
+                re.M), 'function'),
+]
+_TS_PATTERNS = _JS_PATTERNS + [
+    (re.compile(r'^[ \t]*(?:export\s+)?interface\s+([A-Za-z_$][\w$]*)', re.M), 'interface'),
+    (re.compile(r'^[ \t]*(?:export\s+)?type\s+([A-Za-z_$][\w$]*)\s*(?:<[^=]*>)?\s*=', re.M), 'type'),
+    (re.compile(r'^[ \t]*(?:export\s+)?(?:const\s+)?enum\s+([A-Za-z_$][\w$]*)', re.M), 'enum'),
+]
+_GO_PATTERNS = [
+    (re.compile(r'^func\s+\(\s*(?:\w+\s+)?\*?\s*(\w+)[^)]*\)\s*(\w+)', re.M), 'method'),
+    (re.compile(r'^func\s+(\w+)', re.M), 'function'),
+    (re.compile(r'^type\s+(\w+)\s+struct\b', re.M), 'struct'),
+    (re.compile(r'^type\s+(\w+)\s+interface\b', re.M), 'interface'),
+]
+_SHELL_PATTERNS = [
+    (re.compile(r'^[ \t]*function[ \t]+([\w.:-]+)(?:[ \t]*\([ \t]*\))?', re.M), 'function'),
+    (re.compile(r'^[ \t]*([\w.:-]+)[ \t]*\([ \t]*\)', re.M), 'function'),
+]
+
+LANGUAGES = {
+    '.py': 'python',
+    '.js': 'javascript', '.jsx': 'javascript', '.mjs': 'javascript', '.cjs': 'javascript',
+    '.ts': 'typescript', '.tsx': 'typescript',
+    '.go': 'go',
+    '.sh': 'shell', '.bash': 'shell',
+}
+_PATTERNS = {'javascript': _JS_PATTERNS, 'typescript': _TS_PATTERNS,
+             'go': _GO_PATTERNS, 'shell': _SHELL_PATTERNS}
+
+
+def _python_symbols(text):
+    symbols = []
+
+    def visit(node, scope, in_class):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.ClassDef):
+                kind = 'class'
+            elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                kind = 'method' if in_class else 'function'
+            else:
+                continue
+            qualified = f"{scope}.{child.name}" if scope else child.name
+            # Decorators belong to the definition's source
+            start = min([child.lineno] + [d.lineno for d in child.decorator_list])
+            symbols.append((child.name, qualified, kind, start, child.end_lineno))
+            visit(child, qualified, kind == 'class')
+
+    visit(ast.parse(text), '', False)
+    return symbols
+
+
+def _block_end(text, offset, line):
+    """
+    Return the line where the definition starting at `offset` (on `line`)
+    ends: the line closing its brace-delimited body, or the line of its
+    header when it has no body, like `type Id = string`.
+    """
+    parens = 0
+    index = offset
+    # Find the body's opening brace; the header may span lines inside parentheses
+    while index < len(text):
+        char = text[index]
+        if char in '([':
+            parens += 1
+        elif char in ')]':
+            parens -= 1
+        elif char == ';' and parens <= 0:
+            return line
+        elif char == '{':
+            break
+        elif char == '\n':
+            if parens <= 0 and not text[index + 1:].lstrip(' \t').startswith('{'):
+                return line
+            line += 1
+        index += 1
+    else:
+        return line
+
+    depth = 0
+    last_line = line + MAX_BODY_LINES
+    for index in range(index, len(text)):
+        char = text[index]
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return line
+        elif char == '\n':
+            line += 1
+            if line > last_line:
+                break
+    return line
+
+
+def _regex_symbols(text, patterns):
+    symbols = []
+    seen = set()
+    for pattern, kind in patterns:
+        for match in pattern.finditer(text):
+            if match.start() in seen:
+                continue
+            seen.add(match.start())
+            start = text.count('\n', 0, match.start()) + 1
+            if kind == 'method' and match.lastindex == 2:
+                name = match.group(2)
+                qualified = f"{match.group(1)}.{name}"
+            else:
+                name = qualified = match.group(1)
+            end = _block_end(text, match.end(), start)
+            symbols.append((name, qualified, kind, start, end))
+    symbols.sort(key=lambda symbol: symbol[3])
+    return symbols
+
+
+def extract_symbols(rel_path, text):
+    """
+    Return the (name, qualified_name, kind, start_line, end_line) definitions
+    of a source file. Python is parsed with `ast`; JavaScript/TypeScript, Go
+    and shell definitions are found with regular expressions and their end
+    is the line closing their brace-delimited body.
+    """
+    language = LANGUAGES.get(os.path.splitext(rel_path)[1])
+    if language == 'python':
+        try:
+            return _python_symbols(text)
+        except (SyntaxError, ValueError, RecursionError):
+            return []  # Including NUL bytes and deeply nested sources
+    if language is not None:
+        return _regex_symbols(text, _PATTERNS[language])
+    return []
+
+
+def parse_files(root, rel_paths):
+    """
+    Extract the symbols of several files, in a worker process. A file that
+    cannot be read or parsed has no symbols, so one bad file never fails
+    the batch.
+    """
+    results = []
+    for rel_path in rel_paths:
+        try:
+            with open(os.path.join(root, rel_path), 'r', encoding='utf-8') as file:
+                results.append((rel_path, extract_symbols(rel_path, file.read())))
+        except (OSError, UnicodeDecodeError):
+            results.append((rel_path, []))
+        except Exception as e:  # pylint: disable=W0718
+            logging.getLogger("SymbolIndex").warning("Cannot parse %s: %r", rel_path, e)
+            results.append((rel_path, []))
+    return results
+
+
+class SymbolIndex:
+    """
+    Index of the definitions (classes, functions, methods, types) of the
+    project's source files, by name.
+
+    Like the trigram index, it is kept current from tree index events passed
+    to `handle_event`; a `sync` only re-parses files whose mtime or size
+    changed, in batches on the executor returned by `get_executor()`
+    (a process pool, or None to parse in-process). As in the trigram index,
+    files are parsed without holding the lock and their symbols swapped in
+    under it, so searches only wait for the first full sync.
+    """
+
+    def __init__(self, project_path, list_files, is_excluded, get_executor=None,
+                 max_file_size=1024 * 1024):
+        self.project_path = project_path
+        self.list_files = list_files
+        self.is_excluded = is_excluded
+        self.get_executor = get_executor or (lambda: None)
+        self.max_file_size = max_file_size
+        self.logger = logging.getLogger("SymbolIndex")
+        # rel_path -> ((mtime_ns, size), symbols)
+        self._files = {}
+        self._dirty = set()
+        self._full_sync = True
+        self._built = threading.Event()
+        # rel_path -> ticket of the latest refresh in progress
+        self._refreshing = {}
+        self._tickets = count()
+        self._lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+
+    def handle_event(self, kind, rel_path, is_dir, dest_path=None):
+        """Mark the files touched by a tree index event for re-parsing."""
+        with self._pending_lock:
+            if is_dir or kind not in ('created', 'deleted', 'modified', 'renamed'):
+                self._full_sync = True
+            else:
+                self._dirty.add(rel_path)
+                if dest_path is not None:
+                    self._dirty.add(dest_path)
+
+    def invalidate(self):
+        """Check every file again on the next sync."""
+        with self._pending_lock:
+            self._full_sync = True
+
+    def sync(self):
+        """
+        Re-parse the source files that changed since the last sync, and wait
+        for the first full sync if another thread is running it.
+        """
+        with self._pending_lock:
+            full_sync, dirty = self._full_sync, self._dirty
+            self._full_sync, self._dirty = False, set()
+        try:
+            if full_sync:
+                present = {path for path in self.list_files()
+                           if os.path.splitext(path)[1] in LANGUAGES}
+                with self._lock:
+                    dirty = present | set(self._files)
+            stale = self._find_stale(dirty)
+            if stale:
+                paths = sorted(stale)
+                batches = [paths[i:i + BATCH_SIZE] for i in range(0, len(paths), BATCH_SIZE)]
+                executor = self.get_executor() if len(batches) > 1 else None
+                try:
+                    self._parse(batches, stale, executor)
+                except BrokenProcessPool:
+                    # The pool was retired under us, e.g. after a runaway grep
+                    self.logger.warning("Process pool went away, parsing in-process")
+                    self._parse(batches, stale, None)
+                self.logger.info("Parsed %d source files", len(stale))
+        finally:
+            if full_sync:
+                self._built.set()
+        self._built.wait()
+
+    def _find_stale(self, dirty):
+        """
+        Take a refresh ticket for each dirty file and return {rel_path:
+        (stamp, ticket)} for those to re-parse. Files that are gone are
+        removed, unchanged ones left as they are.
+        """
+        stale = {}
+        for rel_path in dirty:
+            with self._lock:
+                ticket = self._refreshing[rel_path] = next(self._tickets)
+                entry = self._files.get(rel_path)
+            stamp = self._stamp(rel_path)
+            if stamp is None:
+                self._swap(rel_path, ticket)
+            elif entry is not None and entry[0] == stamp:
+                with self._lock:
+                    if self._refreshing.get(rel_path) == ticket:
+                        del self._refreshing[rel_path]
+            else:
+                stale[rel_path] = (stamp, ticket)
+        return stale
+
+    def _parse(self, batches, stale, executor):
+        if executor is None:
+            results = (parse_files(self.project_path, batch) for batch in batches)
+        else:
+            results = executor.map(parse_files, [self.project_path] * len(batches), batches)
+        for batch_results in results:
+            for rel_path, symbols in batch_results:
+                stamp, ticket = stale[rel_path]
+                self._swap(rel_path, ticket, stamp, symbols)
+
+    def _swap(self, rel_path, ticket, stamp=None, symbols=None):
+        """Store the symbols of a refresh, or remove the file without a `stamp`."""
+        with self._lock:
+            if self._refreshing.get(rel_path) != ticket:
+                return  # Superseded by a later refresh
+            del self._refreshing[rel_path]
+            if stamp is None:
+                self._files.pop(rel_path, None)
+            else:
+                self._files[rel_path] = (stamp, symbols)
+
+    def _stamp(self, rel_path):
+        if os.path.splitext(rel_path)[1] not in LANGUAGES or self.is_excluded(rel_path, False):
+            return None
+        try:
+            st = os.stat(os.path.join(self.project_path, rel_path))
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode) or st.st_size > self.max_file_size:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def search(self, query, kind=None, rel_dir='.', exact=False, max_results=50):
+        """
+        Find definitions whose name or qualified name matches `query`,
+        case-insensitively. Exact matches rank first, then prefix matches,
+        then names containing the query (unless `exact`).
+        """
+        self.sync()
+        needle = query.lower()
+        prefix = None if rel_dir == '.' else rel_dir + os.sep
+        ranked = []
+        with self._lock:
+            for rel_path, (_, symbols) in self._files.items():
+                if prefix is not None and not rel_path.startswith(prefix):
+                    continue
+                for name, qualified, symbol_kind, start, end in symbols:
+                    if kind is not None and symbol_kind != kind:
+                        continue
+                    lowered, lowered_qualified = name.lower(), qualified.lower()
+                    if needle in (lowered, lowered_qualified):
+                        rank = 0
+                    elif exact:
+                        continue
+                    elif lowered.startswith(needle) or lowered_qualified.startswith(needle):
+                        rank = 1
+                    elif needle in lowered_qualified:
+                        rank = 2
+                    else:
+                        continue
+                    ranked.append((rank, rel_path, start, {
+                        "name": name, "qualified_name": qualified, "kind": symbol_kind,
+                        "path": rel_path, "start_line": start, "end_line": end,
+                        "language": LANGUAGES[os.path.splitext(rel_path)[1]]}))
+        ranked.sort(key=lambda item: item[:3])
+        return [symbol for *_, symbol in ranked[:max_results]], len(ranked) > max_results
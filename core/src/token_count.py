@@ -0,0 +1,95 @@
+import os
+import re
+import threading
+from itertools import islice
+
+READ_CHUNK_BYTES = 1024 * 1024
+# Bytes counted to extrapolate the tokens of a file too large to scan
+SAMPLE_BYTES = 256 * 1024
+# Runs of up to four word characters and single other characters, roughly
+# how BPE tokenizers split code and prose. Non-ASCII text is counted per
+# byte, which overestimates it - the safe side for a budget.
+TOKEN_PATTERN = re.compile(rb'\w{1,4}|[^\w\s]')
+
+
+def count_tokens(data):
+    """Estimate the number of model tokens in a str or UTF-8 bytes."""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return len(TOKEN_PATTERN.findall(data))
+
+
+def count_file_tokens(full_path):
+    """Estimate the tokens of a file's content, read in chunks."""
+    total = 0
+    with open(full_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(READ_CHUNK_BYTES), b''):
+            total += count_tokens(chunk)
+    return total
+
+
+def estimate_file_tokens(full_path, size, sample_bytes=None):
+    """
+    Estimate the tokens of a file of `size` bytes from its first
+    `sample_bytes` (SAMPLE_BYTES by default), scaled to the whole size.
+    """
+    if sample_bytes is None:
+        sample_bytes = SAMPLE_BYTES
+    with open(full_path, 'rb') as file:
+        sample = file.read(sample_bytes)
+    if not sample:
+        return 0
+    return -(-count_tokens(sample) * size // len(sample))
+
+
+def head_within_tokens(text, max_tokens):
+    """
+    Return the longest head of `text` estimated at no more than
+    `max_tokens`, cut after the last complete line when there is one.
+    """
+    encoded = text.encode('utf-8')
+    overflow = next(islice(TOKEN_PATTERN.finditer(encoded), max_tokens, None), None)
+    if overflow is None:
+        return text
+    end = overflow.start()
+    line_end = encoded.rfind(b'\n', 0, end)
+    if line_end != -1:
+        end = line_end + 1
+    return encoded[:end].decode('utf-8', errors='ignore')
+
+
+class TokenCountCache:
+    """
+    Estimated token counts of files keyed by path, reused while a file's
+    mtime and size are unchanged. Files above `max_scan_bytes` are not read
+    in full; their count is extrapolated from a sample of their head.
+    """
+
+    def __init__(self, max_scan_bytes=None):
+        self.max_scan_bytes = max_scan_bytes
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def get(self, full_path, st=None):
+        """
+        Return the estimated tokens of a file, given its current `os.stat`
+        result when already known. Raises OSError for unreadable files.
+        """
+        if st is None:
+            st = os.stat(full_path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._counts.get(full_path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        if self.max_scan_bytes is not None and st.st_size > self.max_scan_bytes:
+            tokens = estimate_file_tokens(full_path, st.st_size)
+        else:
+            tokens = count_file_tokens(full_path)
+        with self._lock:
+            self._counts[full_path] = (stamp, tokens)
+        return tokens
+
+    def __len__(self):
+        with self._lock:
+            return len(self._counts)
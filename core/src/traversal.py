@@ -0,0 +1,98 @@
+import logging
+import os
+
+logger = logging.getLogger("traversal")
+
+
+def path_key(rel_path):
+    """
+    Sort key of a project-relative folder. Ordering folders by it gives the
+    same top-down, name-sorted order in which `walk_tree` yields them.
+    """
+    rel_path = os.path.normpath(rel_path)
+    return () if rel_path == '.' else tuple(rel_path.split(os.sep))
+
+
+def walk_tree(root, rel_dir='.', is_excluded=None, follow_symlinks=False,
+              max_depth=None):
+    """
+    Walk `root` from `rel_dir` downwards with os.scandir, yielding
+    (folder, dirnames, filenames) top-down with entries sorted by name.
+    With `max_depth`, only that many directory levels are listed, counting
+    `rel_dir` itself as the first.
+
+    File types come from the cached `DirEntry` information, so listing a
+    directory costs one getdents pass and no per-entry stat. Entries for which
+    `is_excluded(rel_path, is_dir)` is true are dropped and excluded
+    directories are never opened. When following symlinks, visited
+    (device, inode) pairs are tracked so link cycles are only walked once.
+    """
+    rel_dir = os.path.normpath(rel_dir)
+    if is_excluded is not None and is_excluded(rel_dir, True):
+        return
+
+    visited = None
+    if follow_symlinks:
+        try:
+            st = os.stat(os.path.join(root, rel_dir))
+        except OSError:
+            return
+        visited = {(st.st_dev, st.st_ino)}
+        stack = [(rel_dir, st.st_dev, 1)]
+    else:
+        stack = [(rel_dir, None, 1)]
+
+    while stack:
+        folder, device, level = stack.pop()
+        descend = max_depth is None or level < max_depth
+        dirnames, filenames, subdirs = [], [], []
+        try:
+            with os.scandir(os.path.join(root, folder)) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=True)
+                    except OSError:
+                        is_dir = False
+                    rel_path = entry.name if folder == '.' else os.path.join(
+                        folder, entry.name)
+                    if is_excluded is not None and is_excluded(rel_path, is_dir):
+                        continue
+                    if not is_dir:
+                        filenames.append(entry.name)
+                        continue
+
+                    dirnames.append(entry.name)
+                    if not descend:
+                        continue
+                    if visited is None:
+                        # Like os.walk, links to directories are listed but not entered
+                        if not entry.is_symlink():
+                            subdirs.append((rel_path, None))
+                        continue
+                    key = _entry_key(entry, device)
+                    if key is not None and key not in visited:
+                        visited.add(key)
+                        subdirs.append((rel_path, key[0]))
+        except OSError as e:
+            logger.debug("Cannot list %s: %s", folder, e)
+            continue
+
+        dirnames.sort()
+        filenames.sort()
+        yield folder, dirnames, filenames
+
+        # Reverse so the stack pops subdirectories in name order
+        subdirs.sort(reverse=True)
+        stack.extend((path, dev, level + 1) for path, dev in subdirs)
+
+
+def _entry_key(entry, parent_device):
+    """Return the (device, inode) pair of a directory entry's target."""
+    try:
+        if entry.is_symlink():
+            st = entry.stat(follow_symlinks=True)
+            return st.st_dev, st.st_ino
+        # d_ino is part of the directory listing, no stat needed
+        return parent_device, entry.inode()
+    except OSError:
+        return None
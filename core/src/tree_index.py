@@ -0,0 +1,459 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from src.file_watcher import InotifyWatcher, WatchLimitReached
+from src.traversal import path_key
+
+# Directory mtimes come from a coarse clock that can lag `time.time_ns()`
+CATCH_UP_MARGIN_NS = 1_000_000_000
+# Sorted listings kept for folders read again, like a large folder read page by page
+SORTED_LISTINGS = 16
+
+
+class _DirNode:
+    """Files and subdirectories of one indexed directory."""
+    __slots__ = ("files", "directories", "mtime_ns", "validated")
+
+    def __init__(self, files=(), directories=(), mtime_ns=0, validated=True):
+        self.files = set(files)
+        self.directories = set(directories)
+        self.mtime_ns = mtime_ns
+        # False for directories loaded from a snapshot until their mtime is checked
+        self.validated = validated
+
+
+class TreeIndex:
+    """
+    In-memory index of the project tree, built once and kept up to date from
+    inotify events. When inotify is unavailable or the watch limit is reached,
+    the index falls back to a periodic rescan of directory mtimes.
+
+    `walk(rel_dir)` must yield (folder, dirnames, filenames) tuples top-down,
+    already filtered by the ignore rules, like `FileService.walk`.
+    `is_excluded(rel_path, is_dir)` applies the same rules to single paths.
+
+    Listeners added with `add_listener` are called with every applied event
+    as (kind, rel_path, is_dir, dest_path), including 'modified' for changed
+    file contents, and with ('rebuilt', '.', True, None) or
+    ('rescanned', '.', True, None) when the index was synced as a whole.
+
+    With a `snapshot` (an `IndexSnapshot`), the index is saved every
+    `snapshot_interval` seconds and when stopped, and the next start loads
+    it instead of walking the project. Loaded directories are validated
+    lazily: each one is re-listed if its mtime changed, either when it is
+    first read or by a background pass. `snapshot_key()` must describe the
+    configuration the tree depends on, like the ignore rules.
+    """
+
+    def __init__(self, project_path, walk, is_excluded, rescan_interval=30.0,
+                 before_build=None, rebuild_triggers=(), snapshot=None,
+                 snapshot_key=None, snapshot_interval=300.0):
+        self.project_path = project_path
+        self.walk = walk
+        self.is_excluded = is_excluded
+        self.rescan_interval = rescan_interval
+        self.before_build = before_build
+        self.rebuild_triggers = set(rebuild_triggers)
+        self.snapshot = snapshot
+        self.snapshot_key = snapshot_key or (lambda: "")
+        self.snapshot_interval = snapshot_interval
+        self.logger = logging.getLogger("TreeIndex")
+
+        self.mode = None
+        self.generation = 0
+        self._dirs = {}
+        # folder -> (generation, dirnames, filenames), sorted
+        self._sorted = OrderedDict()
+        self._lock = threading.RLock()
+        self._watcher = None
+        self._poll_thread = None
+        self._snapshot_thread = None
+        self._saved_generation = None
+        self._stop = threading.Event()
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Register a callable notified of every change applied to the index."""
+        self._listeners.append(listener)
+
+    def _notify(self, kind, rel_path, is_dir, dest_path=None):
+        for listener in self._listeners:
+            try:
+                listener(kind, rel_path, is_dir, dest_path)
+            except Exception as e:  # pylint: disable=W0718
+                self.logger.error("Error notifying index listener: %s", e)
+
+    @property
+    def ready(self):
+        """True once the initial build has completed."""
+        return self.mode is not None
+
+    def start(self):
+        """Build the index, or load its snapshot, and start tracking changes."""
+        self._stop.clear()
+        loaded = self._load_snapshot()
+        if not loaded:
+            walk_started_ns = time.time_ns()
+            self.build()
+        self._start_watching()
+        if loaded:
+            # Watches are in place, so changes made from now on are not missed
+            threading.Thread(target=self._validate_all, name="TreeIndexValidate",
+                             daemon=True).start()
+        else:
+            # Changes made during the walk came before any watch existed
+            self._catch_up(walk_started_ns - CATCH_UP_MARGIN_NS)
+        if self.snapshot is not None:
+            self._snapshot_thread = threading.Thread(
+                target=self._save_periodically, name="TreeIndexSnapshot", daemon=True)
+            self._snapshot_thread.start()
+
+    def _start_watching(self):
+        if InotifyWatcher.is_supported():
+            try:
+                self._start_inotify()
+                return
+            except WatchLimitReached:
+                self.logger.warning(
+                    "inotify watch limit reached, falling back to periodic rescans")
+            except OSError as e:
+                self.logger.warning(
+                    "inotify unavailable (%s), falling back to periodic rescans", e)
+        self._start_polling()
+
+    def stop(self):
+        """
+        Stop watching the tree and save its snapshot. The index keeps its
+        last known state.
+        """
+        self._stop.set()
+        self._stop_inotify()
+        for thread in (self._poll_thread, self._snapshot_thread):
+            if thread is not None:
+                thread.join(timeout=2)
+        self._poll_thread = self._snapshot_thread = None
+        if self.ready:
+            self.save_snapshot()
+
+    def _load_snapshot(self):
+        """Replace the index with its snapshot. Returns True if one was loaded."""
+        if self.snapshot is None:
+            return False
+        if self.before_build:
+            self.before_build()
+        records = self.snapshot.load(self.snapshot_key())
+        if records is None:
+            return False
+        dirs = {folder: _DirNode(filenames, dirnames, mtime_ns, validated=False)
+                for folder, (mtime_ns, dirnames, filenames) in records.items()}
+        with self._lock:
+            self._dirs = dirs
+            self.generation += 1
+            self._saved_generation = self.generation
+        self.logger.info("Loaded %d directories from the index snapshot", len(dirs))
+        self._notify('rebuilt', '.', True)
+        return True
+
+    def save_snapshot(self):
+        """Save the index to its snapshot, unless nothing changed since the last save."""
+        if self.snapshot is None:
+            return
+        with self._lock:
+            if self.generation == self._saved_generation:
+                return
+            generation = self.generation
+            records = [(folder, node.mtime_ns, sorted(node.directories), sorted(node.files))
+                       for folder, node in self._dirs.items()]
+        self.snapshot.save(self.snapshot_key(), records)
+        self._saved_generation = generation
+        self.logger.info("Saved %d directories to the index snapshot", len(records))
+
+    def _save_periodically(self):
+        while not self._stop.wait(self.snapshot_interval):
+            try:
+                self.save_snapshot()
+            except Exception as e:  # pylint: disable=W0718
+                self.logger.error("Error saving index snapshot: %s", e)
+
+    def _validate(self, folder):
+        """Re-list a directory loaded from the snapshot if its mtime changed."""
+        with self._lock:
+            node = self._dirs.get(folder)
+            if node is None or node.validated:
+                return
+            node.validated = True
+            current = self._dir_mtime_ns(folder)
+            if current is None:
+                self._remove_path(folder, True)
+            elif current != node.mtime_ns:
+                self._relist(folder)
+
+    def _validate_all(self):
+        with self._lock:
+            folders = list(self._dirs)
+        try:
+            for folder in folders:
+                if self._stop.is_set():
+                    return
+                self._validate(folder)
+        except Exception as e:  # pylint: disable=W0718
+            self.logger.error("Error validating index snapshot: %s", e)
+            return
+        self.logger.info("Validated the index snapshot")
+        self._notify('rescanned', '.', True)
+
+    def build(self):
+        """(Re)build the whole index with a full walk of the project."""
+        if self.before_build:
+            self.before_build()
+        dirs = {}
+        for folder, dirnames, filenames in self.walk('.'):
+            dirs[folder] = _DirNode(
+                filenames, dirnames, self._dir_mtime_ns(folder))
+        with self._lock:
+            self._dirs = dirs
+            self.generation += 1
+        self.logger.info("Indexed %d directories", len(dirs))
+        self._notify('rebuilt', '.', True)
+
+    def rebuild(self):
+        """Rebuild the index and re-register the watches of every directory."""
+        self.build()
+        self._rewatch()
+
+    def has_directory(self, rel_dir):
+        """Check if a directory is part of the index."""
+        rel_dir = os.path.normpath(rel_dir)
+        self._validate(rel_dir)
+        with self._lock:
+            return rel_dir in self._dirs
+
+    def iter_records(self, rel_dir='.', max_depth=None, resume_from=None):
+        """
+        Yield (folder, dirnames, filenames) for `rel_dir` and the directories
+        below it, in the same order as `walk_tree`. With `resume_from`, folders
+        sorting before it are skipped without visiting their subtrees.
+        """
+        resume_key = path_key(resume_from) if resume_from is not None else None
+        stack = [(os.path.normpath(rel_dir), 1)]
+        while stack:
+            folder, level = stack.pop()
+            self._validate(folder)
+            with self._lock:
+                node = self._dirs.get(folder)
+                if node is None:
+                    continue
+                dirnames, filenames = self._sorted_listing(folder, node)
+
+            key = path_key(folder)
+            if resume_key is None or key >= resume_key:
+                yield folder, dirnames, filenames
+
+            if max_depth is not None and level >= max_depth:
+                continue
+            for name in reversed(dirnames):
+                child_key = key + (name,)
+                if resume_key is not None and child_key < resume_key \
+                        and resume_key[:len(child_key)] != child_key:
+                    continue
+                child = name if folder == '.' else os.path.join(folder, name)
+                stack.append((child, level + 1))
+
+    def _sorted_listing(self, folder, node):
+        """
+        Return the sorted (dirnames, filenames) of a folder, cached while the
+        index is unchanged. The lists are shared and must not be modified.
+        """
+        cached = self._sorted.get(folder)
+        if cached is not None and cached[0] == self.generation:
+            self._sorted.move_to_end(folder)
+            return cached[1], cached[2]
+        dirnames, filenames = sorted(node.directories), sorted(node.files)
+        self._sorted[folder] = (self.generation, dirnames, filenames)
+        self._sorted.move_to_end(folder)
+        while len(self._sorted) > SORTED_LISTINGS:
+            self._sorted.popitem(last=False)
+        return dirnames, filenames
+
+    def handle_event(self, kind, rel_path, is_dir, dest_path=None):
+        """Apply a single watcher event to the index."""
+        if kind == 'overflow' or rel_path in self.rebuild_triggers \
+                or dest_path in self.rebuild_triggers:
+            self.logger.info("Rebuilding index after %s on %s", kind, rel_path)
+            self.rebuild()
+            return
+
+        with self._lock:
+            if kind == 'created':
+                self._add_path(rel_path, is_dir)
+            elif kind == 'deleted':
+                self._remove_path(rel_path, is_dir)
+            elif kind == 'renamed':
+                self._remove_path(rel_path, is_dir)
+                self._add_path(dest_path, is_dir)
+        self._notify(kind, rel_path, is_dir, dest_path)
+
+    def rescan(self):
+        """Re-list every directory whose mtime changed since it was indexed."""
+        with self._lock:
+            snapshot = [(folder, node.mtime_ns)
+                        for folder, node in self._dirs.items()]
+        for folder, mtime_ns in snapshot:
+            current = self._dir_mtime_ns(folder)
+            if current is None:
+                with self._lock:
+                    self._remove_path(folder, True)
+            elif current != mtime_ns:
+                self._relist(folder)
+        # Directory mtimes do not change when a file is edited in place
+        self._notify('rescanned', '.', True)
+
+    def _catch_up(self, since_ns):
+        """Re-list every directory modified since `since_ns` or since it was indexed."""
+        with self._lock:
+            snapshot = [(folder, node.mtime_ns) for folder, node in self._dirs.items()]
+        for folder, mtime_ns in snapshot:
+            current = self._dir_mtime_ns(folder)
+            if current is None:
+                with self._lock:
+                    self._remove_path(folder, True)
+            elif current != mtime_ns or current >= since_ns:
+                self._relist(folder)
+
+    def _relist(self, folder):
+        """Re-list a directory, notifying listeners of the entries that came and went."""
+        try:
+            _, dirnames, filenames = next(iter(self.walk(folder)))
+        except StopIteration:
+            return
+        with self._lock:
+            node = self._dirs.get(folder)
+            if node is None:
+                return
+            changes = []
+            for names, current, is_dir in ((node.directories, set(dirnames), True),
+                                           (node.files, set(filenames), False)):
+                changes += [('deleted', name, is_dir) for name in names - current]
+                changes += [('created', name, is_dir) for name in current - names]
+            for kind, name, is_dir in changes:
+                rel_path = os.path.normpath(os.path.join(folder, name))
+                if is_dir and kind == 'deleted':
+                    self._remove_subtree(rel_path)
+                elif is_dir:
+                    self._index_subtree(rel_path)
+            node.files = set(filenames)
+            node.directories = set(dirnames)
+            node.mtime_ns = self._dir_mtime_ns(folder) or node.mtime_ns
+            self.generation += 1
+        for kind, name, is_dir in changes:
+            self._notify(kind, os.path.normpath(os.path.join(folder, name)), is_dir)
+
+    def _add_path(self, rel_path, is_dir):
+        parent, name = self._split(rel_path)
+        node = self._dirs.get(parent)
+        if node is None or self.is_excluded(rel_path, is_dir):
+            return
+        if is_dir:
+            node.directories.add(name)
+            self._index_subtree(rel_path)
+        else:
+            node.files.add(name)
+        self.generation += 1
+
+    def _remove_path(self, rel_path, is_dir):
+        parent, name = self._split(rel_path)
+        node = self._dirs.get(parent)
+        removed = False
+        if node is not None and (name in node.files or name in node.directories):
+            node.files.discard(name)
+            node.directories.discard(name)
+            removed = True
+        if is_dir:
+            removed = self._remove_subtree(rel_path) or removed
+        # Events on ignored or unknown paths leave the index, and its ETags, alone
+        if removed:
+            self.generation += 1
+
+    def _index_subtree(self, rel_dir):
+        for folder, dirnames, filenames in self.walk(rel_dir):
+            self._dirs[folder] = _DirNode(
+                filenames, dirnames, self._dir_mtime_ns(folder))
+            if self._watcher is not None:
+                try:
+                    self._watcher.add_watch(folder)
+                except WatchLimitReached:
+                    self._fall_back_to_polling()
+
+    def _remove_subtree(self, rel_dir):
+        """Drop a directory and everything below it. Returns True if any was indexed."""
+        prefix = rel_dir + os.sep
+        folders = [f for f in self._dirs if f == rel_dir or f.startswith(prefix)]
+        for folder in folders:
+            del self._dirs[folder]
+        if self._watcher is not None:
+            self._watcher.remove_subtree(rel_dir)
+        return bool(folders)
+
+    def _start_inotify(self):
+        self._watcher = InotifyWatcher(self.project_path, self.handle_event)
+        self._watcher.start()
+        try:
+            self._watch_all()
+        except WatchLimitReached:
+            self._stop_inotify()
+            raise
+        self.mode = 'inotify'
+
+    def _stop_inotify(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def _rewatch(self):
+        try:
+            self._watch_all()
+        except WatchLimitReached:
+            self._fall_back_to_polling()
+
+    def _fall_back_to_polling(self):
+        self.logger.warning(
+            "inotify watch limit reached, falling back to periodic rescans")
+        self._stop_inotify()
+        self._start_polling()
+
+    def _watch_all(self):
+        if self._watcher is None:
+            return
+        with self._lock:
+            folders = list(self._dirs)
+        for folder in folders:
+            self._watcher.add_watch(folder)
+
+    def _start_polling(self):
+        self.mode = 'polling'
+        if self._poll_thread is not None:
+            return
+        self._poll_thread = threading.Thread(
+            target=self._poll, name="TreeIndexRescan", daemon=True)
+        self._poll_thread.start()
+
+    def _poll(self):
+        while not self._stop.wait(self.rescan_interval):
+            try:
+                self.rescan()
+            except Exception as e:  # pylint: disable=W0718
+                self.logger.error("Error rescanning project tree: %s", e)
+
+    def _dir_mtime_ns(self, folder):
+        try:
+            return os.stat(os.path.join(self.project_path, folder)).st_mtime_ns
+        except OSError:
+            return None
+
+    @staticmethod
+    def _split(rel_path):
+        parent, name = os.path.split(rel_path)
+        return parent or '.', name
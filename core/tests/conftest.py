@@ -0,0 +1,58 @@
+import pytest
+from src.app import CodeQueryAPI
+
+
+@pytest.fixture
+def project(tmp_path):
+    """Creates a small project with sources in several languages and an ignore file."""
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "main.py").write_text("print('hi')\n")
+    (tmp_path / "src" / "util.py").write_text("def helper():\n    return 'Config'\n")
+    (tmp_path / "src" / "config.py").write_text(
+        "class Config:\n    def load(self, path):\n        return open(path).read()\n")
+    (tmp_path / "web").mkdir()
+    (tmp_path / "web" / "user.ts").write_text(
+        "export const loadUser = async (id: string) => {\n  return fetch(id);\n};\n")
+    (tmp_path / "server.go").write_text(
+        "package main\n\ntype Server struct {\n\taddr string\n}\n")
+    (tmp_path / "venv").mkdir()
+    (tmp_path / "venv" / "lib.py").write_text("def helper():\n    return 'venv'\n")
+    (tmp_path / "README.md").write_text("# readme\n")
+    (tmp_path / ".agentignore").write_text("venv/\n*.log\n")
+    return tmp_path
+
+
+@pytest.fixture
+def make_api(project, monkeypatch):
+    """
+    Provides a factory of CodeQueryAPI instances serving `project`, without
+    ngrok, a snapshot or a process pool. Keyword arguments override those
+    environment variables; None unsets one. Their indexes are stopped afterwards.
+    """
+    apis = []
+
+    def make(**env):
+        settings = {"PROJECT_PATH": str(project),
+                    "AGENTIGNORE_FILES": str(project / ".agentignore"),
+                    "FILE_INDEX_SNAPSHOT": "", "GREP_WORKERS": "1"}
+        settings.update(env)
+        for name, value in settings.items():
+            if value is None:
+                monkeypatch.delenv(name, raising=False)
+            else:
+                monkeypatch.setenv(name, value)
+        api = CodeQueryAPI(use_ngrok=False)
+        api.app.config['TESTING'] = True
+        apis.append(api)
+        return api
+
+    yield make
+    for api in apis:
+        api.file_service.stop_index()
+
+
+@pytest.fixture
+def project_client(make_api):
+    """Provides a test client for the Flask application serving `project`."""
+    with make_api().app.test_client() as client:
+        yield client
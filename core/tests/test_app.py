@@ -1,5 +1,10 @@
+import json
+import os
 from unittest.mock import mock_open, patch
+import pytest
 from src.app import CodeQueryAPI
+from src.file_watcher import InotifyWatcher
+from test_tree_index import wait_for
 
 PROJECT_PATH = "./"
 AGENTIGNORE_FILE_1 = ".agentignore"
@@ -11,7 +16,10 @@ class TestCodeQueryAPI:
     # pylint: disable=attribute-defined-outside-init
     def setup_method(self):
         """Setup method to initialize the CodeQueryAPI instance for each test."""
-        self.api = CodeQueryAPI()  # Initialize a fresh instance for each test
+        # The search and symbol indexes are built in the background, reading files
+        # while `open` is patched, so the tree index they start from is disabled
+        with patch.dict(os.environ, {"FILE_INDEX_ENABLED": "false"}):
+            self.api = CodeQueryAPI()  # Initialize a fresh instance for each test
 
     def test_ensure_ngrok_tunnel_already_running(self):
         """
@@ -73,3 +81,103 @@ class TestCodeQueryAPI:
                 mock_file.assert_any_call(
                     '.agentignore', 'r', encoding='utf-8')
                 mock_file.assert_any_call('.gitignore', 'r', encoding='utf-8')
+
+
+class TestRoutes:
+    """Test suite for the routes of the CodeQueryAPI, serving a small project."""
+
+    def test_snapshot_path(self, project, make_api, tmp_path_factory, monkeypatch):
+        """Snapshots default to the user's cache; relative paths are taken from PROJECT_PATH."""
+        cache_dir = tmp_path_factory.mktemp("cache")
+        monkeypatch.setenv("XDG_CACHE_HOME", str(cache_dir))
+        api = make_api(FILE_INDEX_ENABLED="false", FILE_INDEX_SNAPSHOT=None)
+        assert api.file_service.snapshot_path.startswith(
+            os.path.join(str(cache_dir), "codequery", ""))
+
+        api = make_api(FILE_INDEX_ENABLED="false",
+                       FILE_INDEX_SNAPSHOT=".codequery/tree_index.sqlite")
+        assert api.file_service.snapshot_path == os.path.join(
+            str(project), ".codequery", "tree_index.sqlite")
+
+    @pytest.mark.skipif(not InotifyWatcher.is_supported(), reason="inotify not available")
+    def test_snapshot_inside_the_project_is_never_listed(self, project, make_api):
+        """A snapshot saved inside the project shows up in neither the structure nor the changes."""
+        api = make_api(FILE_INDEX_SNAPSHOT=".codequery/tree_index.sqlite")
+        client = api.app.test_client()
+        cursor = json.loads(client.get('/files/changes').data)["cursor"]
+        api.file_service.tree_index.save_snapshot()
+        assert (project / ".codequery" / "tree_index.sqlite").exists()
+        (project / "notes.md").write_text("")
+
+        def changed_paths():
+            result = json.loads(client.get(f'/files/changes?since={cursor}').data)
+            return [change["path"] for change in result["changes"]]
+        # Events arrive in order, so the snapshot's would come first
+        assert wait_for(lambda: "notes.md" in changed_paths())
+        assert set(changed_paths()) == {"notes.md"}
+        assert ".codequery" not in client.get('/files/structure').get_data(as_text=True)
+
+    @pytest.mark.skipif(not InotifyWatcher.is_supported(), reason="inotify not available")
+    def test_changes_endpoint(self, project, project_client):
+        """The endpoint hands out a cursor and the watcher's changes after it."""
+        cursor = json.loads(project_client.get('/files/changes').data)["cursor"]
+        (project / "src" / "main.py").write_text("print('bye')\n")
+        assert wait_for(lambda: json.loads(project_client.get(
+            f'/files/changes?since={cursor}').data)["changes"])
+        result = json.loads(project_client.get(f'/files/changes?since={cursor}').data)
+        assert result["changes"][0]["path"] == 'src/main.py'
+        assert result["changes"][0]["kind"] == 'modified'
+        assert project_client.get('/files/changes?since=abc').status_code == 400
+
+    def test_manifest_endpoint_and_delta_etag(self, project_client):
+        """The endpoints serve the manifest, and known hashes vary the content ETag."""
+        response = project_client.get('/files/manifest')
+        assert response.status_code == 200
+        hashes = {entry["path"]: entry["hash"] for entry in json.loads(response.data)["files"]}
+        assert project_client.get('/files/manifest?path=../').status_code == 400
+
+        full = project_client.post('/files/content', json={"file_paths": ["README.md"]})
+        delta = project_client.post('/files/content', json={
+            "file_paths": ["README.md"], "known_hashes": {"README.md": hashes["README.md"]}})
+        assert json.loads(delta.data)["README.md"]["unchanged"] is True
+        assert full.headers["ETag"] != delta.headers["ETag"]
+
+    def test_outline_endpoint(self, project_client):
+        """The mode is part of the content ETag."""
+        full = project_client.post('/files/content', json={"file_paths": ["src/config.py"]})
+        outline = project_client.post(
+            '/files/content', json={"file_paths": ["src/config.py"], "mode": "outline"})
+        assert json.loads(outline.data)["src/config.py"]["outline"] is True
+        assert full.headers["ETag"] != outline.headers["ETag"]
+        response = project_client.post(
+            '/files/content', json={"file_paths": ["src/config.py"], "mode": "bodies"})
+        assert response.status_code == 400
+
+    def test_search_endpoint(self, project_client):
+        """POST /files/search answers matches and rejects bad requests."""
+        response = project_client.post('/files/search', json={"query": "helper"})
+        assert response.status_code == 200
+        matches = json.loads(response.data)["matches"]
+        assert [(match["path"], match["line"]) for match in matches] == \
+            [(os.path.join("src", "util.py"), 1)]
+        assert project_client.post('/files/search', json={}).status_code == 400
+        assert project_client.post('/files/search', json={
+            "query": "x", "path": "missing"}).status_code == 404
+
+    def test_grep_endpoint(self, project_client):
+        """POST /files/grep streams NDJSON records."""
+        response = project_client.post('/files/grep', json={"query": "helper\\b"})
+        assert response.mimetype == 'application/x-ndjson'
+        records = [json.loads(line) for line in response.data.splitlines()]
+        assert records[0]["path"] == os.path.join("src", "util.py")
+        assert records[-1]["type"] == "summary"
+        assert project_client.post('/files/grep', json={"query": "("}).status_code == 400
+
+    def test_symbol_endpoints(self, project_client):
+        """The /symbols endpoints answer lookups and reject bad requests."""
+        response = project_client.get('/symbols/search?query=Server')
+        assert json.loads(response.data)["symbols"][0]["kind"] == "struct"
+        response = project_client.get('/symbols/source?name=loadUser')
+        assert "fetch(id)" in json.loads(response.data)["symbols"][0]["source"]
+        assert project_client.get('/symbols/search').status_code == 400
+        assert project_client.get('/symbols/source?name=nope').status_code == 404
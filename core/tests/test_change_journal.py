@@ -0,0 +1,78 @@
+from unittest.mock import patch
+import pytest
+from src.change_journal import ChangeJournal
+from src.file_service import FileService
+from src.file_watcher import InotifyWatcher
+
+
+def never_excluded(rel_path, is_dir):
+    return False
+
+
+class TestChangeJournal:
+    """Test suite for the change journal and /files/changes."""
+
+    def test_changes_since_cursor(self):
+        """Changes after a cursor are returned in order, repeated writes merged."""
+        journal = ChangeJournal(never_excluded)
+        start = journal.cursor
+        journal.handle_event('created', 'a.py', False)
+        journal.handle_event('modified', 'a.py', False)
+        journal.handle_event('modified', 'a.py', False)
+        journal.handle_event('renamed', 'a.py', False, 'b.py')
+        result = journal.changes(start)
+        assert [(c["kind"], c["path"]) for c in result["changes"]] == [
+            ('created', 'a.py'), ('modified', 'a.py'), ('renamed', 'a.py')]
+        assert result["changes"][-1]["dest_path"] == 'b.py'
+        assert result["cursor"] == journal.cursor == start + 4
+        assert not result["resync_required"]
+        assert journal.changes(result["cursor"])["changes"] == []
+
+        page = journal.changes(start, limit=2)
+        assert page["has_more"]
+        assert [c["kind"] for c in journal.changes(page["cursor"])["changes"]] == ['renamed']
+
+    def test_resync_required(self):
+        """Cursors older than the journal, from before a rebuild or ahead of it must resync."""
+        journal = ChangeJournal(never_excluded, max_entries=2)
+        start = journal.cursor
+        for name in ('a', 'b', 'c'):
+            journal.handle_event('created', name, False)
+        assert journal.changes(start)["resync_required"]
+        assert [c["path"] for c in journal.changes(start + 1)["changes"]] == ['b', 'c']
+        assert journal.changes(journal.cursor + 1)["resync_required"]
+
+        cursor = journal.cursor
+        journal.handle_event('rebuilt', '.', True)
+        assert journal.changes(cursor)["resync_required"]
+        assert not journal.changes(journal.cursor)["resync_required"]
+
+    def test_excluded_paths(self):
+        """Ignored paths are left out; renames across the ignore rules become creates or deletes."""
+        journal = ChangeJournal(lambda rel_path, is_dir: rel_path.endswith('.log'))
+        start = journal.cursor
+        journal.handle_event('created', 'debug.log', False)
+        journal.handle_event('renamed', 'debug.log', False, 'debug.txt')
+        journal.handle_event('renamed', 'notes.txt', False, 'notes.log')
+        journal.handle_event('renamed', 'notes.log', False, 'old.log')
+        assert [(c["kind"], c["path"]) for c in journal.changes(start)["changes"]] == [
+            ('created', 'debug.txt'), ('deleted', 'notes.txt')]
+
+    def test_rescans_require_a_resync(self, project):
+        """An mtime rescan may miss files edited in place, so cursors from before it resync."""
+        service = FileService(str(project), str(project / ".agentignore"),
+                              rescan_interval=60)
+        with patch.object(InotifyWatcher, "is_supported", return_value=False):
+            service.start_index()
+        try:
+            cursor = service.get_changes()["cursor"]
+            (project / "src" / "util.py").write_text("")
+            (project / "src" / "main.py").unlink()
+            (project / "src" / "trace.log").write_text("")
+            service.tree_index.rescan()
+            assert service.get_changes(cursor)["resync_required"] is True
+            cursor = service.get_changes()["cursor"]
+            assert service.get_changes(cursor) == {
+                "changes": [], "cursor": cursor, "resync_required": False, "has_more": False}
+        finally:
+            service.stop_index()
@@ -0,0 +1,118 @@
+import gzip
+import json
+import zlib
+import pytest
+from flask import Flask, Response, jsonify, request
+from src.app import CodeQueryAPI
+from src.compression import ResponseCompressor, compress_chunks
+
+
+@pytest.fixture
+def _client_(monkeypatch):
+    """Provides a test client for the Flask application, stopping its index afterwards."""
+    monkeypatch.setenv("FILE_INDEX_SNAPSHOT", "")
+    api_instance = CodeQueryAPI(use_ngrok=False)
+    api_instance.app.config['TESTING'] = True
+    try:
+        with api_instance.app.test_client() as client:
+            yield client
+    finally:
+        api_instance.file_service.stop_index()
+
+
+@pytest.fixture
+def app():
+    """Provides a small app with buffered and streamed routes of any size."""
+    flask_app = Flask(__name__)
+    compressor = ResponseCompressor(min_size=100)
+
+    @flask_app.route('/json/<int:size>')
+    def buffered(size):
+        return jsonify({"data": "x" * size})
+
+    @flask_app.route('/stream/<int:records>')
+    def streamed(records):
+        lines = (json.dumps({"n": n}) + "\n" for n in range(records))
+        return Response(lines, mimetype='application/x-ndjson')
+
+    @flask_app.after_request
+    def compress_response(response):
+        return compressor.compress(request, response)
+
+    return flask_app.test_client()
+
+
+class TestCompression:
+    """Test suite for negotiated response compression."""
+
+    def test_gzip_structure(self, _client_):
+        """Structures are gzipped for clients that accept it."""
+        plain = _client_.get('/files/structure')
+        response = _client_.get('/files/structure', headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert json.loads(gzip.decompress(response.data)) == json.loads(plain.data)
+        assert len(response.data) < len(plain.data)
+
+    def test_compressed_etag_still_matches(self, _client_):
+        """Compressed responses are weakly tagged and still validate."""
+        response = _client_.get('/files/structure', headers={"Accept-Encoding": "gzip"})
+        etag = response.headers["ETag"]
+        assert etag.startswith('W/')
+        response = _client_.get('/files/structure', headers={
+            "Accept-Encoding": "gzip", "If-None-Match": etag})
+        assert response.status_code == 304
+
+    def test_small_and_unaccepted_bodies_are_not_compressed(self, app):
+        """Bodies below the minimum size, or without Accept-Encoding, are sent as is."""
+        assert "Content-Encoding" not in app.get(
+            '/json/10', headers={"Accept-Encoding": "gzip"}).headers
+        assert "Content-Encoding" not in app.get('/json/1000').headers
+        assert "Content-Encoding" not in app.get(
+            '/json/1000', headers={"Accept-Encoding": "br"}).headers
+
+    def test_large_and_streamed_bodies(self, app):
+        """Large buffered and streamed bodies are compressed chunk by chunk."""
+        response = app.get('/json/3000000', headers={"Accept-Encoding": "gzip"})
+        assert "Content-Length" not in response.headers
+        assert len(json.loads(gzip.decompress(response.data))["data"]) == 3000000
+
+        response = app.get('/stream/50000', headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        lines = gzip.decompress(response.data).decode().splitlines()
+        assert len(lines) == 50000
+        assert json.loads(lines[-1]) == {"n": 49999}
+
+    def test_streamed_chunks_are_flushed(self):
+        """Compressed output is emitted while the input is still streaming."""
+        chunks = list(compress_chunks((b"%d\n" % n * 5000 for n in range(30)), "gzip"))
+        assert len(chunks) > 2
+        assert gzip.decompress(b"".join(chunks)).count(b"\n") == 150000
+
+    def test_streamed_records_are_not_held_back(self, app):
+        """Each record of a streamed body can be decoded before the stream ends."""
+        produced = []
+
+        def records():
+            for n in range(3):
+                produced.append(n)
+                yield json.dumps({"n": n}) + "\n"
+
+        chunks = compress_chunks(records(), "gzip", flush_each=True)
+        decompressor = zlib.decompressobj(31)
+        assert decompressor.decompress(next(chunks)) == b'{"n": 0}\n'
+        assert produced == [0]
+
+        response = app.get('/stream/3', headers={"Accept-Encoding": "gzip"},
+                           buffered=False)
+        first = next(iter(response.response))
+        assert zlib.decompressobj(31).decompress(first) == b'{"n": 0}\n'
+        response.close()
+
+    def test_zstd(self, app):
+        """zstd is preferred when the optional zstandard package is installed."""
+        zstandard = pytest.importorskip("zstandard")
+        response = app.get('/json/1000', headers={"Accept-Encoding": "gzip, zstd"})
+        assert response.headers["Content-Encoding"] == "zstd"
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(response.data)
+        assert len(json.loads(data)["data"]) == 1000
@@ -0,0 +1,53 @@
+import os
+from src.content_cache import ContentCache
+from src.file_service import FileService
+
+
+class TestContentCache:
+    """Test suite for the LRU content cache."""
+
+    def test_hit_and_stale_entries(self):
+        """Entries are only served while mtime and size match."""
+        cache = ContentCache(max_bytes=100)
+        cache.put("/p/a", 1, 3, "abc")
+        assert cache.get("/p/a", 1, 3) == "abc"
+        assert cache.get("/p/a", 2, 3) is None
+        assert cache.get("/p/b", 1, 3) is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 2
+
+    def test_lru_eviction_by_bytes(self):
+        """The least recently used entries are evicted past the byte budget."""
+        cache = ContentCache(max_bytes=10)
+        cache.put("/p/a", 1, 4, "aaaa")
+        cache.put("/p/b", 1, 4, "bbbb")
+        cache.get("/p/a", 1, 4)
+        cache.put("/p/c", 1, 4, "cccc")
+        assert cache.get("/p/b", 1, 4) is None
+        assert cache.get("/p/a", 1, 4) == "aaaa"
+        stats = cache.stats()
+        assert stats["evictions"] == 1
+        assert stats["bytes"] == 8
+        assert stats["entries"] == 2
+
+    def test_oversized_entries_are_not_cached(self):
+        """Files larger than the whole budget are never cached."""
+        cache = ContentCache(max_bytes=2)
+        cache.put("/p/a", 1, 3, "abc")
+        assert cache.stats()["entries"] == 0
+
+    def test_file_service_serves_repeated_reads_from_cache(self, tmp_path):
+        """Repeated reads hit the cache until the file changes."""
+        path = tmp_path / "README.md"
+        path.write_text("first")
+        service = FileService(str(tmp_path), "")
+        service.get_file_content(["README.md"])
+        content, _ = service.get_file_content(["README.md"])
+        assert content["README.md"] == {"content": "first"}
+        assert service.content_cache.stats()["hits"] == 1
+
+        path.write_text("second!")
+        os.utime(path, ns=(0, 10**9))
+        content, _ = service.get_file_content(["README.md"])
+        assert content["README.md"] == {"content": "second!"}
+        assert service.content_cache.stats()["misses"] == 2
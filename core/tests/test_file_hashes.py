@@ -0,0 +1,75 @@
+import hashlib
+import os
+import pytest
+from src import file_hashes
+from src.file_hashes import FileHashCache
+from src.file_service import FileService
+
+
+@pytest.fixture
+def project(tmp_path):
+    """Creates a small project with an ignored directory."""
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "app.py").write_text("print('app')\n")
+    (tmp_path / "README.md").write_text("# readme\n")
+    (tmp_path / "venv").mkdir()
+    (tmp_path / "venv" / "lib.py").write_text("")
+    (tmp_path / ".agentignore").write_text("venv/\n")
+    return tmp_path
+
+
+def sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class TestFileHashes:
+    """Test suite for content hashes, the manifest and delta content requests."""
+
+    def test_hashes_are_cached_by_mtime(self, project, monkeypatch):
+        """A file is only hashed again once its mtime or size changed."""
+        hashed = []
+        hash_file = file_hashes.hash_file
+        monkeypatch.setattr(file_hashes, "hash_file",
+                            lambda path: hashed.append(path) or hash_file(path))
+        cache = FileHashCache()
+        path = str(project / "README.md")
+        assert cache.get(path) == sha256("# readme\n")
+        assert cache.get(path) == sha256("# readme\n")
+        assert len(hashed) == 1
+
+        (project / "README.md").write_text("# changed\n")
+        os.utime(path, ns=(0, 10**9))
+        assert cache.get(path) == sha256("# changed\n")
+        assert len(hashed) == 2
+
+    def test_manifest(self, project):
+        """The manifest lists every visible file with its size and hash."""
+        service = FileService(str(project), str(project / ".agentignore"))
+        manifest = service.get_manifest()
+        assert manifest["algorithm"] == "sha256"
+        files = {entry["path"]: entry for entry in manifest["files"]}
+        assert set(files) == {".agentignore", "README.md", os.path.join("src", "app.py")}
+        assert files["README.md"]["size"] == 9
+        assert files["README.md"]["hash"] == sha256("# readme\n")
+        assert [entry["path"] for entry in service.get_manifest("src")["files"]] == [
+            os.path.join("src", "app.py")]
+        with pytest.raises(FileNotFoundError):
+            service.get_manifest("missing")
+
+    def test_known_hashes_skip_unchanged_files(self, project):
+        """Only files whose hash differs from the client's are sent."""
+        service = FileService(str(project), str(project / ".agentignore"))
+        content, status = service.get_file_content(
+            ["README.md", "src/app.py", "missing.py"],
+            known_hashes={"README.md": sha256("# readme\n"), "src/app.py": "stale"})
+        assert status == 200
+        assert content["README.md"] == {"unchanged": True, "hash": sha256("# readme\n")}
+        assert content["src/app.py"] == {"content": "print('app')\n",
+                                         "hash": sha256("print('app')\n")}
+        assert "error" in content["missing.py"]
+
+        content, status = service.get_file_content(
+            ["README.md"], known_hashes={"README.md": sha256("# readme\n")})
+        assert status == 200
+        with pytest.raises(ValueError):
+            service.get_file_content(["README.md"], known_hashes=["README.md"])
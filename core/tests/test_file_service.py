@@ -1,6 +1,9 @@
 # tests/test_file_service.py
 
+import base64
 import json
+import threading
+from unittest.mock import patch
 import pytest
 from src.app import CodeQueryAPI
 from src.file_service import FileService
@@ -10,12 +13,18 @@ AGENTIGNORE_FILE_1 = ".agentignore"
 
 
 @pytest.fixture
-def _client_():
-    """Provides a test client for the Flask application."""
+def _client_(monkeypatch):
+    """Provides a test client for the Flask application, ignoring what .agentignore lists."""
+    monkeypatch.setenv("PROJECT_PATH", PROJECT_PATH)
+    monkeypatch.setenv("AGENTIGNORE_FILES", ".agentignore,.gitignore")
+    monkeypatch.setenv("FILE_INDEX_SNAPSHOT", "")
     api_instance = CodeQueryAPI()  # Create a new instance of the CodeQueryAPI class
     api_instance.app.config['TESTING'] = True
-    with api_instance.app.test_client() as client:
-        yield client
+    try:
+        with api_instance.app.test_client() as client:
+            yield client
+    finally:
+        api_instance.file_service.stop_index()
 
 
 @pytest.fixture
@@ -76,3 +85,156 @@ class TestFileService:
         for folder in data:
             assert "gateway/venv/" not in data[folder]['directories']
             assert "gateway/.terraform/" not in data[folder]['directories']
+
+    def test_structure_subtree_and_depth(self, _client_):
+        """Test that /files/structure can be limited to a subtree and a depth."""
+        response = _client_.get('/files/structure?path=core&depth=1')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert list(data) == ["core"]
+        assert "src" in data["core"]["directories"]
+
+        response = _client_.get('/files/structure?path=core&depth=2')
+        data = json.loads(response.data)
+        assert "core/src" in data
+        assert "core/src/__pycache__" not in data
+
+    def test_structure_unknown_path(self, _client_):
+        """Test that unknown, ignored or escaping paths are rejected."""
+        assert _client_.get('/files/structure?path=missing').status_code == 404
+        assert _client_.get('/files/structure?path=.git').status_code == 404
+        assert _client_.get('/files/structure?path=../').status_code == 400
+        assert _client_.get('/files/structure?depth=0').status_code == 400
+
+    def test_structure_pagination(self, _client_):
+        """Test that paging with small limits returns every entry exactly once."""
+        full = json.loads(_client_.get('/files/structure').data)
+        merged = {}
+        url = '/files/structure?limit=7'
+        pages = 0
+        while True:
+            page = json.loads(_client_.get(url).data)
+            pages += 1
+            for folder, entry in page["structure"].items():
+                assert len(entry["files"]) + len(entry["directories"]) <= 7
+                record = merged.setdefault(folder, {"files": [], "directories": []})
+                record["files"].extend(entry["files"])
+                record["directories"].extend(entry["directories"])
+            if not page["next_cursor"]:
+                break
+            url = f'/files/structure?limit=7&cursor={page["next_cursor"]}'
+        assert pages > 1
+        assert merged == full
+
+    def test_structure_invalid_cursor(self, _client_):
+        """Test that malformed or mismatched cursors are rejected."""
+        assert _client_.get('/files/structure?cursor=not-a-cursor').status_code == 400
+        negative = base64.urlsafe_b64encode(json.dumps(
+            {"path": ".", "depth": None, "folder": ".", "offset": -1}).encode()).decode()
+        assert _client_.get(f'/files/structure?cursor={negative}').status_code == 400
+        page = json.loads(_client_.get('/files/structure?limit=1').data)
+        response = _client_.get(
+            f'/files/structure?path=core&cursor={page["next_cursor"]}')
+        assert response.status_code == 400
+
+    def test_structure_ndjson_stream(self, _client_):
+        """Test that /files/structure streams one record per directory as NDJSON."""
+        full = json.loads(_client_.get('/files/structure').data)
+        response = _client_.get(
+            '/files/structure', headers={"Accept": "application/x-ndjson"})
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.mimetype == "application/x-ndjson"
+
+        records = [json.loads(line) for line in response.data.decode().splitlines()]
+        assert records[0]["path"] == "."
+        assert {r["path"]: {"files": r["files"], "directories": r["directories"]}
+                for r in records} == full
+
+    def test_structure_ndjson_unknown_path(self, _client_):
+        """Test that streaming requests are validated before the stream starts."""
+        response = _client_.get('/files/structure?path=missing',
+                                headers={"Accept": "application/x-ndjson"})
+        assert response.status_code == 404
+
+    def test_file_stats(self, _client_):
+        """Test that the /files/stats endpoint reports content cache counters."""
+        _client_.post('/files/content', json={"file_paths": ["README.md"]})
+        _client_.post('/files/content', json={"file_paths": ["README.md"]})
+        response = _client_.get('/files/stats')
+        assert response.status_code == 200
+        stats = json.loads(response.data)["content_cache"]
+        assert stats["hits"] >= 1
+        assert {"misses", "evictions", "bytes"} <= set(stats)
+
+    def test_structure_etag(self, _client_):
+        """Test that unchanged structures are answered with 304 Not Modified."""
+        response = _client_.get('/files/structure?depth=1')
+        etag = response.headers.get("ETag")
+        assert etag
+        response = _client_.get('/files/structure?depth=1',
+                                headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.data == b""
+        response = _client_.get('/files/structure?depth=2',
+                                headers={"If-None-Match": etag})
+        assert response.status_code == 200
+
+    def test_content_etag(self, _client_):
+        """Test that unchanged file contents are answered with 304 Not Modified."""
+        body = {"file_paths": ["README.md", "core/src/app.py"]}
+        etag = _client_.post('/files/content', json=body).headers.get("ETag")
+        assert etag
+        response = _client_.post('/files/content', json=body,
+                                 headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        response = _client_.post('/files/content', json={"file_paths": ["README.md"]},
+                                 headers={"If-None-Match": etag})
+        assert response.status_code == 200
+
+    def test_content_etag_changes_with_files(self, tmp_path):
+        """Content ETags follow the mtime and size of the requested files."""
+        path = tmp_path / "a.txt"
+        path.write_text("one")
+        service = FileService(str(tmp_path), "")
+        etag = service.content_etag(["a.txt", "missing.txt"])
+        assert service.content_etag(["a.txt", "missing.txt"]) == etag
+        path.write_text("three")
+        assert service.content_etag(["a.txt", "missing.txt"]) != etag
+
+    def test_retrieve_line_range(self, _client_):
+        """Test the /files/content endpoint with a line range."""
+        response = _client_.post('/files/content', json={"file_paths": [
+            {"path": "core/src/app.py", "start_line": 1, "end_line": 2}]})
+        assert response.status_code == 200
+        data = json.loads(response.data)["core/src/app.py"]
+        assert data["content"].count("\n") == 2
+        assert data["total_lines"] > 2
+
+    def test_retrieve_invalid_range(self, _client_):
+        """Test that malformed range requests are rejected."""
+        response = _client_.post('/files/content', json={"file_paths": [
+            {"path": "core/src/app.py", "start_line": "a"}]})
+        assert response.status_code == 400
+
+    def test_parallel_reads_keep_order_and_errors(self, tmp_path):
+        """Concurrent reads keep the requested order and per-file errors."""
+        for name in ("a.txt", "b.txt", "c.txt"):
+            (tmp_path / name).write_text(name)
+        (tmp_path / "folder").mkdir()
+        service = FileService(str(tmp_path), "", read_workers=4)
+        barrier = threading.Barrier(3, timeout=5)
+        read_planned = FileService._read_planned
+
+        def concurrent_read(plan, max_bytes):
+            barrier.wait()  # Only passes if the three reads run at once
+            return read_planned(service, plan, max_bytes)
+
+        with patch.object(FileService, "_read_planned", side_effect=concurrent_read):
+            content, status = service.get_file_content(
+                ["c.txt", "folder", "missing.txt", "a.txt", "b.txt"])
+        assert status == 200
+        assert list(content) == ["c.txt", "folder", "missing.txt", "a.txt", "b.txt"]
+        assert content["c.txt"] == {"content": "c.txt"}
+        assert content["folder"] == {"error": "Cannot read directory: folder"}
+        assert content["missing.txt"]["error"].startswith("Error reading file:")
@@ -0,0 +1,122 @@
+import os
+import shutil
+import subprocess
+from unittest.mock import patch
+import pytest
+from src.file_service import FileService
+from src.file_watcher import InotifyWatcher
+from src.git_index import GitIndexError, find_git_index, parse_index
+
+requires_git = pytest.mark.skipif(shutil.which("git") is None, reason="git not available")
+
+
+def git(cwd, *args):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """Creates a git repository with tracked, untracked and ignored files."""
+    (tmp_path / "src" / "pkg").mkdir(parents=True)
+    (tmp_path / "src" / "main.py").write_text("print('hi')\n")
+    (tmp_path / "src" / "pkg" / "util.py").write_text("")
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "secret.md").write_text("")
+    (tmp_path / ".gitignore").write_text("*.log\n")
+    (tmp_path / ".agentignore").write_text("docs/\n")
+    git(tmp_path, "init", "-q")
+    git(tmp_path, "add", ".")
+    (tmp_path / "notes.txt").write_text("")
+    (tmp_path / "debug.log").write_text("")
+    (tmp_path / "scratch").mkdir()
+    (tmp_path / "scratch" / "draft.py").write_text("")
+    return tmp_path
+
+
+def service_for(project, **kwargs):
+    ignore_files = f"{project / '.agentignore'},{project / '.gitignore'}"
+    return FileService(str(project), ignore_files, **kwargs)
+
+
+def listed_files(service):
+    service.ignore_matcher.refresh()
+    return sorted(os.path.join(folder, name) if folder != '.' else name
+                  for folder, _, filenames in service.walk('.') for name in filenames)
+
+
+def indexed_files(service):
+    return sorted(os.path.join(folder, name) if folder != '.' else name
+                  for folder, _, filenames in service.iter_directory_records('.')
+                  for name in filenames)
+
+
+@requires_git
+class TestGitIndex:
+    """Test suite for enumerating files from the git index."""
+
+    @pytest.mark.parametrize("version", ["2", "3", "4"])
+    def test_parse_index(self, repo, version):
+        """Every index version lists the staged paths."""
+        git(repo, "update-index", "--index-version", version)
+        index_path, prefix = find_git_index(str(repo / "src"))
+        assert prefix == "src"
+        with open(index_path, 'rb') as file:
+            paths = parse_index(file.read())
+        assert paths == [".agentignore", ".gitignore", "docs/secret.md",
+                         "src/main.py", "src/pkg/util.py"]
+        with pytest.raises(GitIndexError):
+            parse_index(b"DIRC\0\0\0\x09")
+
+    def test_tracked_files_only(self, repo):
+        """Only tracked files are listed, and .agentignore rules still apply."""
+        service = service_for(repo, enumeration='git')
+        assert listed_files(service) == [
+            ".agentignore", ".gitignore",
+            os.path.join("src", "main.py"), os.path.join("src", "pkg", "util.py")]
+        assert [folder for folder, _, _ in service.walk('src', max_depth=1)] == ["src"]
+
+    def test_deleted_tracked_files(self, repo):
+        """Tracked files missing from the work tree are not listed."""
+        (repo / "src" / "main.py").unlink()
+        shutil.rmtree(repo / "src" / "pkg")
+        service = service_for(repo, enumeration='git')
+        assert listed_files(service) == [".agentignore", ".gitignore"]
+
+    def test_untracked_files(self, repo):
+        """Untracked files are added unless ignored, and deleted files dropped."""
+        (repo / "src" / "main.py").unlink()
+        service = service_for(repo, enumeration='git', include_untracked=True)
+        assert listed_files(service) == [
+            ".agentignore", ".gitignore", "notes.txt",
+            os.path.join("scratch", "draft.py"), os.path.join("src", "pkg", "util.py")]
+
+    def test_falls_back_to_walk(self, repo):
+        """Without a repository the project is walked."""
+        shutil.rmtree(repo / ".git")
+        service = service_for(repo, enumeration='git')
+        assert listed_files(service) == listed_files(service_for(repo))
+        assert "notes.txt" in listed_files(service)
+
+    def test_index_follows_the_git_listing(self, repo):
+        """Events and `git add` keep the tree index in line with the git listing."""
+        (repo / "build.log").write_text("")
+        git(repo, "add", "-f", "build.log")
+        service = service_for(repo, enumeration='git')
+        with patch.object(InotifyWatcher, "is_supported", return_value=False):
+            service.start_index()
+        try:
+            assert "build.log" in indexed_files(service)
+            # Untracked files are not added by their creation events
+            service.tree_index.handle_event('created', 'notes.txt', False)
+            assert "notes.txt" not in indexed_files(service)
+            # A tracked file ignored by .gitignore survives an atomic save
+            (repo / "build.log").unlink()
+            service.tree_index.handle_event('deleted', 'build.log', False)
+            (repo / "build.log").write_text("saved")
+            service.tree_index.handle_event('created', 'build.log', False)
+            assert "build.log" in indexed_files(service)
+            # Staging a file changes .git/index, which is not watched
+            git(repo, "add", "notes.txt")
+            assert "notes.txt" in indexed_files(service)
+        finally:
+            service.stop_index()
@@ -0,0 +1,105 @@
+import os
+import time
+import pytest
+from src import file_service
+from src.file_service import FileService
+from src.grep import grep_files, iter_grep
+
+
+@pytest.fixture
+def project(tmp_path):
+    """Creates a project with text, binary and ignored files."""
+    (tmp_path / "src").mkdir()
+    for n in range(40):
+        (tmp_path / "src" / f"mod{n:02d}.py").write_text(
+            f"def handler_{n}(event):\n    return event\n")
+    (tmp_path / "data.bin").write_bytes(b"\0\0def handler_x(")
+    (tmp_path / "venv").mkdir()
+    (tmp_path / "venv" / "lib.py").write_text("def handler_venv(event):\n")
+    (tmp_path / ".agentignore").write_text("venv/\n")
+    return tmp_path
+
+
+def grep(service, **request_data):
+    records = list(service.grep_files(request_data))
+    return records[:-1], records[-1]
+
+
+class TestGrep:
+    """Test suite for the streaming grep endpoint."""
+
+    def test_matches_and_summary(self, project):
+        """Matching lines are reported with a summary of the files searched."""
+        service = FileService(str(project), str(project / ".agentignore"), grep_workers=1)
+        matches, summary = grep(service, query=r"def handler_\d+\(")
+        assert len(matches) == 40
+        assert matches[0] == {"type": "match", "path": os.path.join("src", "mod00.py"),
+                              "line": 1, "column": 1, "text": "def handler_0(event):"}
+        assert summary == {"type": "summary", "files_scanned": 41, "files_skipped": 1,
+                           "matches": 40, "truncated": False, "timed_out": False}
+
+    def test_max_results(self, project):
+        """The search stops once max_results lines matched."""
+        service = FileService(str(project), str(project / ".agentignore"), grep_workers=1)
+        matches, summary = grep(service, query="return", max_results=5)
+        assert len(matches) == 5
+        assert summary["truncated"] is True
+        assert summary["files_scanned"] < 41
+
+    def test_deadline(self, project):
+        """Results are marked partial when the deadline passes."""
+        records = list(iter_grep(str(project), (f"src/mod{n:02d}.py" for n in range(40)),
+                                 "return", 0, 100, 0, 1024))
+        assert records[-1]["timed_out"] is True
+        assert records[-1]["files_scanned"] < 40
+
+    def test_worker_stops_at_deadline(self, project):
+        """A worker given a past deadline searches no further file."""
+        matches, scanned, _ = grep_files(str(project), ["src/mod00.py", "src/mod01.py"],
+                                         "return", 0, 1024, 100, deadline=time.time() - 1)
+        assert (matches, scanned) == ([], 0)
+
+    def test_runaway_regex_retires_the_pool(self, project, monkeypatch):
+        """A search stuck past its deadline does not hold the pool for later requests."""
+        monkeypatch.setattr(file_service, "GREP_OVERRUN_GRACE", 0.1)
+        for n in range(4):
+            (project / "src" / f"slow{n}.txt").write_text("a" * 40 + "!\n")
+        service = FileService(str(project), str(project / ".agentignore"), grep_workers=2)
+        try:
+            start = time.monotonic()
+            _, summary = grep(service, query="(a+)+$", path="src", deadline_ms=500)
+            assert summary["timed_out"] is True
+            assert time.monotonic() - start < 5
+            stuck_pool = service._process_pool  # pylint: disable=W0212
+            for _ in range(100):
+                if service._process_pool is not stuck_pool:  # pylint: disable=W0212
+                    break
+                time.sleep(0.05)
+            assert service._process_pool is None  # pylint: disable=W0212
+
+            matches, summary = grep(service, query="handler_1\\b", path="src")
+            assert len(matches) == 1 and summary["timed_out"] is False
+        finally:
+            if service._process_pool is not None:  # pylint: disable=W0212
+                service._process_pool.shutdown()  # pylint: disable=W0212
+
+    def test_process_pool(self, project):
+        """Files are searched on the process pool with the same results."""
+        service = FileService(str(project), str(project / ".agentignore"), grep_workers=2)
+        try:
+            matches, summary = grep(service, query="EVENT", case_sensitive=False,
+                                    regex=False, path="src")
+            assert len(matches) == 80
+            assert summary["files_scanned"] == 40
+        finally:
+            service._process_pool.shutdown()  # pylint: disable=W0212
+
+    def test_invalid_requests(self, project):
+        """Malformed requests are rejected before streaming starts."""
+        service = FileService(str(project), str(project / ".agentignore"), grep_workers=1)
+        with pytest.raises(ValueError):
+            service.grep_files({"query": "("})
+        with pytest.raises(ValueError):
+            service.grep_files({"query": "x", "deadline_ms": 0})
+        with pytest.raises(FileNotFoundError):
+            service.grep_files({"query": "x", "path": "venv"})
@@ -0,0 +1,90 @@
+import os
+import pathspec
+import pytest
+from src.ignore_matcher import IgnoreMatcher
+
+GITIGNORE = """
+# Python
+__pycache__/
+*.py[cod]
+venv/
+/build/
+dist/
+*.egg-info/
+
+# Logs
+*.log
+!important.log
+logs/**/debug.txt
+
+# Node
+node_modules/
+"""
+
+PATHS = [
+    ("src/app.py", False),
+    ("src/app.pyc", False),
+    ("src/__pycache__", True),
+    ("src/__pycache__/app.cpython-311.pyc", False),
+    ("venv", True),
+    ("nested/venv", True),
+    ("build", True),
+    ("src/build", True),
+    ("dist/pkg.tar.gz", False),
+    ("pkg.egg-info", True),
+    ("server.log", False),
+    ("important.log", False),
+    ("logs/a/b/debug.txt", False),
+    ("web/node_modules", True),
+    ("README.md", False),
+    (".", True),
+]
+
+
+@pytest.fixture
+def ignore_file(tmp_path):
+    """Writes a realistic ignore file."""
+    path = tmp_path / ".gitignore"
+    path.write_text(GITIGNORE)
+    return path
+
+
+class TestIgnoreMatcher:
+    """Test suite for the compiled ignore matcher."""
+
+    def test_matches_pathspec(self, ignore_file):
+        """The combined regexes agree with pathspec's per-pattern matching."""
+        matcher = IgnoreMatcher([str(ignore_file)])
+        matcher.refresh()
+        spec = pathspec.PathSpec.from_lines(
+            'gitwildmatch', GITIGNORE.splitlines())
+
+        for path, is_dir in PATHS:
+            expected_path = path.rstrip('/') + '/' if is_dir else path
+            assert matcher.match(path, is_dir) == spec.match_file(expected_path), path
+
+    def test_negation_takes_precedence(self, ignore_file):
+        """A later '!' pattern re-includes a previously ignored path."""
+        matcher = IgnoreMatcher([str(ignore_file)])
+        matcher.refresh()
+        assert matcher.match("server.log")
+        assert not matcher.match("important.log")
+
+    def test_reloads_only_on_change(self, ignore_file):
+        """Rules are recompiled only when an ignore file's mtime or size changes."""
+        matcher = IgnoreMatcher([str(ignore_file)])
+        assert matcher.refresh()
+        assert not matcher.refresh()
+        assert not matcher.match("notes.txt")
+
+        ignore_file.write_text(GITIGNORE + "*.txt\n")
+        st = ignore_file.stat()
+        os.utime(ignore_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+        assert matcher.refresh()
+        assert matcher.match("notes.txt")
+
+    def test_missing_files_match_nothing(self, tmp_path):
+        """Missing ignore files are skipped instead of raising."""
+        matcher = IgnoreMatcher([str(tmp_path / "missing"), ""])
+        matcher.refresh()
+        assert not matcher.match("anything.py")
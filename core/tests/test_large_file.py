@@ -0,0 +1,94 @@
+import pytest
+from src.file_service import FileService
+from src.large_file import preview_file
+
+
+@pytest.fixture
+def project(tmp_path):
+    """Creates a project with one small and one large file."""
+    (tmp_path / "small.txt").write_text("small\n")
+    (tmp_path / "big.log").write_text(
+        "".join(f"entry {n:04d}\n" for n in range(1, 1001)))
+    return tmp_path
+
+
+class TestLargeFiles:
+    """Test suite for large-file previews and the per-request byte budget."""
+
+    def test_preview_head_and_tail(self, project):
+        """Previews are cut at line boundaries and report what they cover."""
+        preview = preview_file(str(project / "big.log"), 110)
+        assert preview["truncated"] is True
+        assert preview["size"] == 11000
+        assert preview["line_count"] == 1000
+        assert preview["content"] == "".join(
+            f"entry {n:04d}\n" for n in range(1, 6))
+        assert preview["head_end_line"] == 5
+        assert preview["tail"].endswith("entry 1000\n")
+        assert preview["tail_start_line"] == 996
+
+    def test_preview_without_trailing_newline(self, tmp_path):
+        """The last line is counted even without a trailing newline."""
+        path = tmp_path / "f.txt"
+        path.write_text("a\nb\nc\nd")
+        preview = preview_file(str(path), 4)
+        assert preview["line_count"] == 4
+        assert preview["content"] == "a\n"
+        assert preview["tail"] == "d"
+        assert preview["tail_start_line"] == 4
+
+    def test_preview_of_a_single_line(self, tmp_path):
+        """Without a line break in a window, it is cut at a character boundary."""
+        path = tmp_path / "min.js"
+        path.write_text("é" * 50)
+        preview = preview_file(str(path), 11)
+        assert preview["content"] == "éé"
+        assert preview["tail"] == "ééé"
+        assert preview["head_end_offset"] == 4
+        assert preview["tail_start_offset"] == 94
+        assert preview["line_count"] == 1
+        assert "head_end_line" not in preview
+        assert "tail_start_line" not in preview
+
+    def test_large_previews_are_not_counted(self, project):
+        """Lines of files above `max_count_bytes` are only reported when already known."""
+        preview = preview_file(str(project / "big.log"), 110, max_count_bytes=1000)
+        assert "line_count" not in preview and "tail_start_line" not in preview
+        assert preview["head_end_line"] == 5
+        assert preview["head_end_offset"] == 55
+        assert preview["tail_start_offset"] == 10945
+
+        preview = preview_file(str(project / "big.log"), 110, line_count=1000,
+                               max_count_bytes=1000)
+        assert preview["tail_start_line"] == 996
+
+    def test_large_files_are_previewed(self, project):
+        """Files above the threshold are previewed, smaller ones are read whole."""
+        service = FileService(str(project), "", large_file_threshold=1000)
+        content, status = service.get_file_content(["small.txt", "big.log"])
+        assert status == 200
+        assert content["small.txt"] == {"content": "small\n"}
+        assert content["big.log"]["truncated"] is True
+        assert len(content["big.log"]["content"]) <= 500
+        assert "line_count" not in content["big.log"]
+
+        # A line range indexes the file, so its lines are known from then on
+        service.get_file_content([{"path": "big.log", "start_line": 1, "end_line": 2}])
+        content, _ = service.get_file_content(["big.log"])
+        assert content["big.log"]["line_count"] == 1000
+
+    def test_byte_budget_is_shared(self, project):
+        """Once the request budget is spent, later files only get metadata."""
+        service = FileService(str(project), "", large_file_threshold=100_000,
+                              content_byte_budget=11_000)
+        content, _ = service.get_file_content(["big.log", "small.txt"])
+        assert "truncated" not in content["big.log"]
+        assert content["small.txt"]["truncated"] is True
+        assert content["small.txt"]["content"] == ""
+        assert content["small.txt"]["line_count"] == 1
+
+        service = FileService(str(project), "", content_byte_budget=50)
+        content, _ = service.get_file_content(
+            [{"path": "big.log", "start_line": 1, "end_line": 100}])
+        assert content["big.log"]["truncated"] is True
+        assert len(content["big.log"]["content"]) == 50
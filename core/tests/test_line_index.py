@@ -0,0 +1,97 @@
+import io
+import os
+import pytest
+from src.file_service import FileService
+from src.line_index import LineIndex, LineIndexCache
+
+
+@pytest.fixture
+def file_service(tmp_path):
+    """Provides a FileService over a directory with a multi-line file."""
+    lines = "".join(f"line {n}\n" for n in range(1, 101))
+    (tmp_path / "big.txt").write_text(lines)
+    (tmp_path / "utf8.txt").write_text("héllo\nwörld")
+    return FileService(str(tmp_path), "")
+
+
+class TestLineIndex:
+    """Test suite for line-offset indexes and range reads."""
+
+    @pytest.mark.parametrize("data,expected", [
+        (b"", []),
+        (b"a", [0]),
+        (b"a\n", [0]),
+        (b"a\nbb\n", [0, 2]),
+        (b"a\nbb\nccc", [0, 2, 5]),
+        (b"\n\n", [0, 1]),
+    ])
+    def test_build_offsets(self, data, expected):
+        """Line starts are recorded, without a phantom line after a trailing newline."""
+        index = LineIndex.build(io.BytesIO(data), len(data), 0)
+        assert list(index.offsets) == expected
+        assert index.size == len(data)
+
+    def test_build_across_chunks(self, monkeypatch):
+        """Offsets stay correct when newlines fall on chunk boundaries."""
+        monkeypatch.setattr("src.line_index.CHUNK_SIZE", 3)
+        data = b"ab\ncd\nef\ngh"
+        index = LineIndex.build(io.BytesIO(data), len(data), 0)
+        assert list(index.offsets) == [0, 3, 6, 9]
+        assert index.byte_span(2, 3) == (3, 9)
+
+    def test_cache_invalidated_on_change(self, tmp_path):
+        """A cached index is rebuilt when the file's size or mtime changes."""
+        path = tmp_path / "f.txt"
+        path.write_text("a\nb\n")
+        cache = LineIndexCache()
+        with open(path, 'rb') as f:
+            first = cache.get(str(path), f, os.fstat(f.fileno()))
+        with open(path, 'rb') as f:
+            assert cache.get(str(path), f, os.fstat(f.fileno())) is first
+
+        path.write_text("a\nb\nc\n")
+        with open(path, 'rb') as f:
+            assert cache.get(str(path), f, os.fstat(f.fileno())).total_lines == 3
+
+    def test_line_range(self, file_service):
+        """A line range returns only those lines plus the file totals."""
+        content, status = file_service.get_file_content(
+            [{"path": "big.txt", "start_line": 10, "end_line": 12}])
+        assert status == 200
+        assert content["big.txt"] == {
+            "content": "line 10\nline 11\nline 12\n",
+            "start_line": 10, "end_line": 12,
+            "total_lines": 100, "size": os.path.getsize(
+                os.path.join(file_service.project_path, "big.txt"))}
+
+    def test_line_range_clamped(self, file_service):
+        """Ranges past the end of the file are clamped."""
+        content, _ = file_service.get_file_content(
+            [{"path": "big.txt", "start_line": 99, "end_line": 500},
+             {"path": "utf8.txt", "start_line": 5}])
+        assert content["big.txt"]["content"] == "line 99\nline 100\n"
+        assert content["big.txt"]["end_line"] == 100
+        assert content["utf8.txt"]["content"] == ""
+
+    def test_byte_range(self, file_service):
+        """A byte range returns the decoded bytes, replacing split characters."""
+        content, _ = file_service.get_file_content(
+            [{"path": "big.txt", "offset": 7, "length": 7},
+             {"path": "utf8.txt", "offset": 2, "length": 3}])
+        assert content["big.txt"]["content"] == "line 2\n"
+        assert content["big.txt"]["offset"] == 7
+        assert content["utf8.txt"]["content"] == "�ll"
+        assert content["utf8.txt"]["total_lines"] == 2
+
+    @pytest.mark.parametrize("item", [
+        {"path": "big.txt", "start_line": 1, "offset": 0},
+        {"path": "big.txt", "start_line": 0},
+        {"path": "big.txt", "length": -1},
+        {"path": "big.txt", "end_line": "10"},
+        {"start_line": 1},
+        42,
+    ])
+    def test_invalid_selectors(self, file_service, item):
+        """Malformed entries are rejected."""
+        with pytest.raises(ValueError):
+            file_service.get_file_content([item])
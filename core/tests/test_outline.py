@@ -0,0 +1,140 @@
+import os
+from unittest.mock import patch
+import pytest
+from src.file_service import FileService
+from src.outline import build_outline
+
+PYTHON_SOURCE = '''"""Configuration loading."""
+import os
+
+DEFAULT_PATH = "config.yml"
+
+
+@dataclass
+class Config:
+    """
+    Settings read from disk.
+
+    More details.
+    """
+    path: str = DEFAULT_PATH
+
+    def load(self,
+             path):
+        """Read the file."""
+        with open(path) as file:
+            return file.read()
+
+
+def main():
+    return Config().load(DEFAULT_PATH)
+'''
+
+
+@pytest.fixture
+def project(tmp_path):
+    """Creates a project with a Python module, a TypeScript module and a text file."""
+    (tmp_path / "config.py").write_text(PYTHON_SOURCE)
+    (tmp_path / "user.ts").write_text(
+        "import { api } from './api';\n\n"
+        "// A user of the service\n"
+        "export class User {\n  name: string;\n\n"
+        "  greet(): string {\n    return `hi ${this.name}`;\n  }\n}\n\n"
+        "export function load(id: string) {\n  return api.get(id);\n}\n")
+    (tmp_path / "notes.txt").write_text("plain text\n")
+    (tmp_path / "broken.py").write_text("def broken(:\n")
+    return tmp_path
+
+
+class TestOutline:
+    """Test suite for file outlines."""
+
+    def test_python_outline(self):
+        """Signatures, docstring summaries, imports and assignments are kept."""
+        assert build_outline("config.py", PYTHON_SOURCE) == (
+            " 1: \"\"\"Configuration loading.\"\"\"\n"
+            " 2: import os\n"
+            " 4: DEFAULT_PATH = \"config.yml\"\n"
+            " 7: @dataclass\n"
+            " 8: class Config:\n"
+            " 9:     \"\"\"\n"
+            "10:     Settings read from disk.\n"
+            "        ...\n"
+            "14:     path: str = DEFAULT_PATH\n"
+            "16:     def load(self,\n"
+            "17:              path):\n"
+            "18:         \"\"\"Read the file.\"\"\"\n"
+            "            ...\n"
+            "23: def main():\n"
+            "        ...\n")
+
+    def test_brace_and_markdown_outlines(self, project):
+        """Top-level declarations and class members are kept, bodies elided."""
+        outline = build_outline("user.ts", (project / "user.ts").read_text())
+        assert outline.splitlines() == [
+            " 1: import { api } from './api';",
+            "    ...",
+            " 4: export class User {",
+            " 5:   name: string;",
+            " 7:   greet(): string {",
+            "        ...",
+            "10: }",
+            "12: export function load(id: string) {",
+            "      ...",
+        ]
+        markdown = "# Title\n\ntext\n\n```sh\n# not a heading\n```\n## Usage\n"
+        assert build_outline("README.md", markdown) == "1: # Title\n   ...\n8: ## Usage\n"
+        assert build_outline("notes.txt", "plain text\n") is None
+        assert build_outline("broken.py", "def broken(:\n") is None
+
+    def test_outline_mode(self, project):
+        """Outlined files carry their line count; ranges and other files are read as usual."""
+        service = FileService(str(project), "")
+        content, status = service.get_file_content(
+            ["config.py", "notes.txt", "broken.py", {"path": "user.ts", "start_line": 14}],
+            mode="outline")
+        assert status == 200
+        assert content["config.py"]["outline"] is True
+        assert content["config.py"]["language"] == "python"
+        assert content["config.py"]["total_lines"] == 24
+        assert "with open" not in content["config.py"]["content"]
+        assert content["notes.txt"] == {"content": "plain text\n"}
+        assert content["broken.py"] == {"content": "def broken(:\n"}
+        assert content["user.ts"]["content"] == "}\n"
+        with pytest.raises(ValueError):
+            service.get_file_content(["config.py"], mode="skeleton")
+
+    def test_sources_that_cannot_be_outlined_are_read_whole(self, project):
+        """A parser giving up on a file, in outline mode or within a token budget, falls back to its content."""
+        (project / "nul.py").write_text("x = 1\0\n")
+        service = FileService(str(project), "")
+        with patch("src.file_service.build_outline", side_effect=RecursionError("too deep")):
+            content, status = service.get_file_content(["config.py"], mode="outline")
+            assert status == 200
+            assert content["config.py"] == {"content": PYTHON_SOURCE}
+            content, status = service.get_file_content(["config.py"], max_tokens=50)
+            assert status == 200
+            assert content["config.py"]["packed"] == "head"
+        content, status = service.get_file_content(["nul.py"], mode="outline")
+        assert content["nul.py"] == {"content": "x = 1\0\n"}
+
+    def test_outlines_are_cached_until_the_file_changes(self, project):
+        """Repeated outlines come from the cache until the file's mtime changes."""
+        service = FileService(str(project), "")
+        service.get_file_content(["user.ts"], mode="outline")
+        service.get_file_content(["user.ts"], mode="outline")
+        assert service.outline_cache.stats()["hits"] == 1
+
+        (project / "user.ts").write_text("export const answer = 42;\n")
+        os.utime(project / "user.ts", ns=(0, 10**9))
+        content, _ = service.get_file_content(["user.ts"], mode="outline")
+        assert content["user.ts"]["content"] == "1: export const answer = 42;\n"
+        assert service.outline_cache.stats()["misses"] == 2
+
+    def test_large_outline_sources_are_not_cached(self, project):
+        """Sources above the large file threshold are outlined without filling the content cache."""
+        service = FileService(str(project), "", large_file_threshold=300)
+        content, _ = service.get_file_content(["config.py", "user.ts"], mode="outline")
+        assert content["config.py"]["outline"] is True
+        assert content["user.ts"]["outline"] is True
+        assert service.content_cache.stats()["entries"] == 1  # user.ts only
@@ -0,0 +1,155 @@
+import os
+import sys
+import threading
+from unittest.mock import patch
+import pytest
+from src import search_index
+from src.file_service import FileService
+from src.search_index import TrigramIndex, required_literals
+
+
+@pytest.fixture
+def project(tmp_path):
+    """Creates a small project with text, binary and ignored files."""
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "app.py").write_text(
+        "import os\n\ndef load_config(path):\n    return open(path).read()\n")
+    (tmp_path / "src" / "util.py").write_text("def helper():\n    return 'Config'\n")
+    (tmp_path / "README.md").write_text("Use load_config() to read settings.\n")
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG\0\0load_config")
+    (tmp_path / "build").mkdir()
+    (tmp_path / "build" / "out.py").write_text("load_config = None\n")
+    (tmp_path / ".agentignore").write_text("build/\n")
+    return tmp_path
+
+
+@pytest.fixture
+def service(project):
+    """Provides a FileService over the project, without the tree index."""
+    return FileService(str(project), str(project / ".agentignore"))
+
+
+class TestTrigramIndex:
+    """Test suite for the trigram search index."""
+
+    def test_required_literals(self):
+        """Literal runs of sequences and mandatory parts are required."""
+        assert required_literals(r"def\s+load_(\w+)") == ["def", "load_"]
+        assert required_literals(r"(?:foo)+bar") == ["foo", "bar"]
+        assert required_literals(r"(foo|bar)baz?") == ["ba"]
+        assert required_literals(r"x*") == []
+
+    def test_regex_parser_fallback(self, service):
+        """The private regex parser is found on every supported Python, and is optional."""
+        expected = "re._parser" if sys.version_info >= (3, 11) else "sre_parse"
+        assert search_index.sre_parse.__name__ == expected
+        with patch.object(search_index, "sre_parse", None):
+            assert required_literals(r"def\s+load_(\w+)") == []
+            result = service.search_files({"query": r"def\s+load_(\w+)", "regex": True})
+        assert [m["line"] for m in result["matches"]] == [3]
+        assert result["files_scanned"] == 4  # Every text file, without narrowing
+
+    def test_literal_search(self, service):
+        """Literal queries return path, line, column and a snippet."""
+        result = service.search_files({"query": "load_config", "context_lines": 1})
+        assert [(m["path"], m["line"]) for m in result["matches"]] == [
+            ("README.md", 1), (os.path.join("src", "app.py"), 3)]
+        match = result["matches"][1]
+        assert match["column"] == 5
+        assert match["snippet"] == "\ndef load_config(path):\n    return open(path).read()"
+        assert match["snippet_start_line"] == 2
+        assert result["truncated"] is False
+
+    def test_candidates_are_narrowed(self, service):
+        """Only files holding all trigrams of the query are read."""
+        result = service.search_files({"query": "helper"})
+        assert result["files_scanned"] == 1
+        assert result["files_indexed"] == 4  # Binary and ignored files are skipped
+
+    def test_case_and_regex(self, service):
+        """Case-sensitive and regular expression queries are verified per file."""
+        assert len(service.search_files({"query": "config"})["matches"]) == 3
+        assert len(service.search_files(
+            {"query": "config", "case_sensitive": True})["matches"]) == 2
+        result = service.search_files({"query": r"^def \w+\(", "regex": True,
+                                       "path": "src"})
+        assert [m["line"] for m in result["matches"]] == [3, 1]
+
+    def test_max_results(self, service):
+        """Results are truncated at max_results."""
+        result = service.search_files({"query": "return", "max_results": 1})
+        assert len(result["matches"]) == 1
+        assert result["truncated"] is True
+
+    def test_invalid_requests(self, service):
+        """Malformed queries and unknown paths are rejected."""
+        with pytest.raises(ValueError):
+            service.search_files({"query": ""})
+        with pytest.raises(ValueError):
+            service.search_files({"query": "(", "regex": True})
+        with pytest.raises(ValueError):
+            service.search_files({"query": "x", "max_results": 0})
+        with pytest.raises(FileNotFoundError):
+            service.search_files({"query": "x", "path": "build"})
+
+    def test_incremental_updates(self, project):
+        """File events re-index only the touched files."""
+        files = ["a.txt", "b.txt"]
+        (project / "a.txt").write_text("alpha\n")
+        (project / "b.txt").write_text("beta\n")
+        index = TrigramIndex(str(project), lambda: list(files),
+                             is_excluded=lambda path, is_dir: False)
+        assert index.candidates(["alpha"]) == []
+        index.sync()
+        assert index.candidates(["alpha"]) == ["a.txt"]
+
+        (project / "b.txt").write_text("alphabet\n")
+        os.utime(project / "b.txt", ns=(0, 10**9))
+        index.handle_event('modified', "b.txt", False)
+        os.remove(project / "a.txt")
+        files.remove("a.txt")
+        index.handle_event('deleted', "a.txt", False)
+        index.sync()
+        assert index.candidates(["alpha"]) == ["b.txt"]
+        assert index.candidates(["beta"]) == []
+
+    def test_large_files_are_scanned_or_reported(self, tmp_path):
+        """Text files too large to index are always scanned, or listed as skipped."""
+        (tmp_path / "large.log").write_text("x" * 30 + "\nneedle\n")
+        (tmp_path / "huge.log").write_text("needle\n" * 30)
+        (tmp_path / "blob.bin").write_bytes(b"\0" * 30 + b"needle")
+        index = TrigramIndex(str(tmp_path), lambda: ["blob.bin", "huge.log", "large.log"],
+                             is_excluded=lambda path, is_dir: False,
+                             max_file_size=20, max_scan_size=100)
+        result = index.search("needle")
+        assert [(m["path"], m["line"]) for m in result["matches"]] == [("large.log", 2)]
+        assert result["skipped"] == ["huge.log"]
+        assert result["files_indexed"] == 0
+
+    def test_sync_reads_without_the_lock(self, project):
+        """Files are read outside the index lock, so lookups go on during a sync."""
+        index = TrigramIndex(str(project), lambda: ["README.md"],
+                             is_excluded=lambda path, is_dir: False)
+        index.sync()
+        (project / "README.md").write_text("Use load_settings() instead.\n")
+        os.utime(project / "README.md", ns=(0, 10**9))
+        index.handle_event('modified', "README.md", False)
+
+        reading, release = threading.Event(), threading.Event()
+        read_text = TrigramIndex.read_text
+
+        def slow_read(full_path):
+            reading.set()
+            release.wait(5)
+            return read_text(full_path)
+
+        with patch.object(index, "read_text", slow_read):
+            thread = threading.Thread(target=index.sync)
+            thread.start()
+            assert reading.wait(5)
+            # The old trigrams are served until the new ones are swapped in
+            assert index.candidates(["load_config"]) == ["README.md"]
+            release.set()
+            thread.join(5)
+        assert index.candidates(["load_config"]) == []
+        assert index.candidates(["load_settings"]) == ["README.md"]
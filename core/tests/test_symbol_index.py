@@ -0,0 +1,147 @@
+import os
+import threading
+import pytest
+from src.file_service import FileService
+from src import symbol_index
+from src.symbol_index import SymbolIndex, extract_symbols
+
+
+@pytest.fixture
+def project(tmp_path):
+    """Creates a project with sources in several languages."""
+    (tmp_path / "svc").mkdir()
+    (tmp_path / "svc" / "config.py").write_text(
+        "import os\n\n\n@dataclass\nclass Config:\n    def load(self, path):\n"
+        "        return path\n\n\ndef load_config():\n    return Config()\n")
+    (tmp_path / "web.ts").write_text(
+        "export interface Props {\n  id: string;\n}\n\n"
+        "export const loadUser = async (id: string) => {\n  return fetch(id);\n};\n")
+    (tmp_path / "main.go").write_text(
+        "package main\n\ntype Server struct {\n\taddr string\n}\n\n"
+        "func (s *Server) Load() error {\n\treturn nil\n}\n")
+    (tmp_path / "deploy.sh").write_text("#!/bin/sh\nload_env() {\n  . ./.env\n}\n")
+    return tmp_path
+
+
+@pytest.fixture
+def service(project):
+    """Provides a FileService that parses in-process."""
+    return FileService(str(project), "", grep_workers=1)
+
+
+class TestSymbolIndex:
+    """Test suite for the symbol index."""
+
+    def test_extractors(self, project):
+        """Definitions are found with their kind and line span."""
+        python = extract_symbols("config.py", (project / "svc" / "config.py").read_text())
+        assert python == [("Config", "Config", "class", 4, 7),
+                          ("load", "Config.load", "method", 6, 7),
+                          ("load_config", "load_config", "function", 10, 11)]
+        assert extract_symbols("web.ts", (project / "web.ts").read_text()) == [
+            ("Props", "Props", "interface", 1, 3),
+            ("loadUser", "loadUser", "function", 5, 7)]
+        assert extract_symbols("main.go", (project / "main.go").read_text()) == [
+            ("Server", "Server", "struct", 3, 5),
+            ("Load", "Server.Load", "method", 7, 9)]
+        assert extract_symbols("deploy.sh", (project / "deploy.sh").read_text()) == [
+            ("load_env", "load_env", "function", 2, 4)]
+        assert extract_symbols("broken.py", "def (") == []
+
+    def test_search_ranking(self, service):
+        """Exact matches rank before prefix and substring matches."""
+        names = [s["qualified_name"] for s in service.search_symbols("load")["symbols"]]
+        assert names[:2] == ["Server.Load", "Config.load"]
+        assert set(names[2:]) == {"load_config", "loadUser", "load_env"}
+        result = service.search_symbols("load", kind="function", exact=True)
+        assert result["symbols"] == []
+        result = service.search_symbols("config", path="svc")
+        assert [s["qualified_name"] for s in result["symbols"]] == ["Config", "Config.load",
+                                                                    "load_config"]
+
+    def test_symbol_source(self, service):
+        """Only the lines of the requested definition are returned."""
+        symbol = service.get_symbol_source("Config.load")["symbols"][0]
+        assert symbol["path"] == os.path.join("svc", "config.py")
+        assert symbol["source"] == "    def load(self, path):\n        return path\n"
+        with pytest.raises(FileNotFoundError):
+            service.get_symbol_source("missing")
+
+    def test_symbol_source_of_deleted_file(self, project, service, monkeypatch):
+        """A symbol whose file was deleted after indexing is not found, not an error."""
+        assert service.search_symbols("load_env")["symbols"]
+        # Keep the index stale, as between file system events
+        monkeypatch.setattr(service, "_index_ready", lambda: True)
+        (project / "deploy.sh").unlink()
+        with pytest.raises(FileNotFoundError):
+            service.get_symbol_source("load_env")
+
+    def test_only_changed_files_are_reparsed(self, project, monkeypatch):
+        """A sync re-parses only files whose mtime or size changed."""
+        parsed = []
+        parse_files = symbol_index.parse_files
+
+        def recording_parse_files(root, rel_paths):
+            parsed.extend(rel_paths)
+            return parse_files(root, rel_paths)
+
+        monkeypatch.setattr(symbol_index, "parse_files", recording_parse_files)
+        index = SymbolIndex(str(project), lambda: ["main.go", "deploy.sh"],
+                            is_excluded=lambda path, is_dir: False)
+        index.sync()
+        assert sorted(parsed) == ["deploy.sh", "main.go"]
+
+        parsed.clear()
+        (project / "deploy.sh").write_text("#!/bin/sh\nreload() {\n  :\n}\n")
+        os.utime(project / "deploy.sh", ns=(0, 10**9))
+        index.handle_event('modified', "deploy.sh", False)
+        index.handle_event('modified', "main.go", False)
+        index.sync()
+        assert parsed == ["deploy.sh"]
+        assert [s["name"] for s in index.search("reload")[0]] == ["reload"]
+        assert index.search("load_env")[0] == []
+
+    def test_search_is_not_held_up_by_parsing(self, project, monkeypatch):
+        """Files are parsed outside the index lock, so searches go on meanwhile."""
+        index = SymbolIndex(str(project), lambda: ["main.go", "deploy.sh"],
+                            is_excluded=lambda path, is_dir: False)
+        index.sync()
+        (project / "deploy.sh").write_text("#!/bin/sh\nreload() {\n  :\n}\n")
+        os.utime(project / "deploy.sh", ns=(0, 10**9))
+        index.handle_event('modified', "deploy.sh", False)
+
+        parsing, release = threading.Event(), threading.Event()
+        parse_files = symbol_index.parse_files
+
+        def slow_parse_files(root, rel_paths):
+            parsing.set()
+            release.wait(5)
+            return parse_files(root, rel_paths)
+
+        monkeypatch.setattr(symbol_index, "parse_files", slow_parse_files)
+        thread = threading.Thread(target=index.sync)
+        thread.start()
+        assert parsing.wait(5)
+        # The old symbols are served until the new ones are swapped in
+        assert [s["name"] for s in index.search("load_env")[0]] == ["load_env"]
+        release.set()
+        thread.join(5)
+        assert [s["name"] for s in index.search("reload")[0]] == ["reload"]
+
+    def test_unparsable_files_have_no_symbols(self, project, monkeypatch):
+        """Errors raised while parsing one file leave the others indexed."""
+        (project / "nul.py").write_text("def f():\n    pass\0\n")
+        (project / "deep.py").write_text("def g():\n    pass\n")
+        extract = symbol_index.extract_symbols
+
+        def failing_extract(rel_path, text):
+            if rel_path == "deep.py":
+                raise RecursionError("maximum recursion depth exceeded")
+            return extract(rel_path, text)
+
+        monkeypatch.setattr(symbol_index, "extract_symbols", failing_extract)
+        index = SymbolIndex(str(project), lambda: ["deep.py", "nul.py", "svc/config.py"],
+                            is_excluded=lambda path, is_dir: False)
+        index.sync()
+        assert [s["name"] for s in index.search("load_config")[0]] == ["load_config"]
+        assert index.search("f", exact=True)[0] == []
@@ -0,0 +1,97 @@
+import os
+import pytest
+from src import token_count
+from src.file_service import FileService
+from src.token_count import TokenCountCache, count_tokens, head_within_tokens
+
+
+@pytest.fixture
+def project(tmp_path):
+    """Creates a project with a few files of known token counts."""
+    # Every line is 'x = 1' plus a newline: three tokens
+    (tmp_path / "small.py").write_text("x = 1\n" * 10)
+    (tmp_path / "large.py").write_text(
+        "def run():\n" + "    y = 2\n" * 200)
+    (tmp_path / "notes.txt").write_text("a b c\n" * 20)
+    (tmp_path / ".agentignore").write_text("")
+    return tmp_path
+
+
+class TestTokenCount:
+    """Test suite for token estimates and token-budget packing."""
+
+    def test_estimates(self):
+        """Words count per four characters and punctuation per character."""
+        assert count_tokens("x = 1\n") == 3
+        assert count_tokens("print(value)") == 6
+        assert count_tokens(b"") == 0
+        assert head_within_tokens("x = 1\ny = 2\nz = 3\n", 7) == "x = 1\ny = 2\n"
+        assert head_within_tokens("x = 1\n", 3) == "x = 1\n"
+
+    def test_counts_are_cached_by_mtime(self, project, monkeypatch):
+        """A file is only counted again once its mtime or size changed."""
+        counted = []
+        count_file_tokens = token_count.count_file_tokens
+        monkeypatch.setattr(token_count, "count_file_tokens",
+                            lambda path: counted.append(path) or count_file_tokens(path))
+        cache = TokenCountCache()
+        path = str(project / "small.py")
+        assert cache.get(path) == cache.get(path) == 30
+        assert len(counted) == 1
+        (project / "small.py").write_text("x = 1\n")
+        os.utime(path, ns=(0, 10**9))
+        assert cache.get(path) == 3
+
+    def test_large_files_are_sampled(self, project, monkeypatch):
+        """Files above the scan limit are estimated from their head, not read in full."""
+        monkeypatch.setattr(token_count, "SAMPLE_BYTES", 600)
+        monkeypatch.setattr(token_count, "count_file_tokens",
+                            lambda path: pytest.fail("large file scanned in full"))
+        (project / "big.log").write_text("x = 1\n" * 10000)
+        service = FileService(str(project), str(project / ".agentignore"),
+                              large_file_threshold=1000)
+        content, _ = service.get_file_content(["big.log"], max_tokens=12)
+        assert content["big.log"]["packed"] == "head"
+        assert content["big.log"]["full_tokens"] == 30000
+        assert content["big.log"]["content"] == "x = 1\n" * 4
+
+    def test_preview_tokens_include_the_tail(self, project):
+        """A large file sent as a preview counts the tokens of its head and tail."""
+        service = FileService(str(project), str(project / ".agentignore"),
+                              large_file_threshold=60)
+        content, _ = service.get_file_content(["notes.txt"], max_tokens=1000)
+        notes = content["notes.txt"]
+        assert notes["truncated"] is True and notes["tail"]
+        assert notes["tokens"] == count_tokens(notes["content"]) + count_tokens(notes["tail"])
+
+    def test_packing(self, project):
+        """Files fit whole in priority order, then as outlines, a head, or not at all."""
+        service = FileService(str(project), str(project / ".agentignore"))
+        content, status = service.get_file_content(
+            ["large.py", "small.py", "notes.txt"], max_tokens=50,
+            priority=["small.py"])
+        assert status == 200
+        assert list(content) == ["large.py", "small.py", "notes.txt"]
+        assert content["small.py"]["tokens"] == 30
+        assert "packed" not in content["small.py"]
+
+        large = content["large.py"]
+        assert large["packed"] == "outline" and large["outline"] is True
+        assert large["full_tokens"] > 600
+        notes = content["notes.txt"]
+        assert notes["packed"] == "head" and notes["truncated"] is True
+        assert notes["tokens"] <= 50 - 30 - large["tokens"]
+        assert notes["content"].endswith("\n")
+        assert notes["end_line"] == notes["content"].count("\n")
+
+        # A file that does not fit leaves room for the smaller ones after it
+        content, _ = service.get_file_content(["large.py", "small.py"], max_tokens=50)
+        assert content["large.py"]["packed"] == "outline"
+        assert content["small.py"]["tokens"] == 30 and "packed" not in content["small.py"]
+
+        content, _ = service.get_file_content(["small.py", "notes.txt"], max_tokens=30)
+        assert content["notes.txt"] == {"packed": "omitted", "tokens": 0, "full_tokens": 60}
+        with pytest.raises(ValueError):
+            service.get_file_content(["small.py"], max_tokens=0)
+        with pytest.raises(ValueError):
+            service.get_file_content(["small.py"], max_tokens=10, priority="small.py")
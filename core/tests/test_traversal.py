@@ -0,0 +1,68 @@
+import os
+from unittest.mock import patch
+import pytest
+from src.traversal import walk_tree
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """Creates a tree with an ignorable directory and a symlink cycle."""
+    (tmp_path / "b").mkdir()
+    (tmp_path / "a" / "inner").mkdir(parents=True)
+    (tmp_path / "a" / "inner" / "x.py").write_text("")
+    (tmp_path / "a" / "z.py").write_text("")
+    (tmp_path / "a" / "y.py").write_text("")
+    (tmp_path / "node_modules" / "pkg").mkdir(parents=True)
+    (tmp_path / "root.txt").write_text("")
+    os.symlink(tmp_path / "a", tmp_path / "a" / "inner" / "loop")
+    return tmp_path
+
+
+class TestWalkTree:
+    """Test suite for the scandir-based traversal engine."""
+
+    def test_top_down_sorted(self, tree):
+        """Directories are yielded top-down with sorted entries."""
+        result = list(walk_tree(str(tree)))
+        assert [folder for folder, _, _ in result] == [
+            ".", "a", os.path.join("a", "inner"), "b", os.path.join("node_modules"),
+            os.path.join("node_modules", "pkg")]
+        assert result[0] == (".", ["a", "b", "node_modules"], ["root.txt"])
+        assert result[1][2] == ["y.py", "z.py"]
+
+    def test_excluded_directories_are_pruned(self, tree):
+        """Excluded directories are neither listed nor opened."""
+        seen = []
+
+        def is_excluded(rel_path, is_dir):
+            seen.append(rel_path)
+            return is_dir and os.path.basename(rel_path) == "node_modules"
+
+        folders = [folder for folder, _, _ in walk_tree(
+            str(tree), is_excluded=is_excluded)]
+        assert "node_modules" not in folders
+        assert os.path.join("node_modules", "pkg") not in seen
+
+    def test_no_stat_per_entry(self, tree):
+        """Listing relies on cached DirEntry types instead of stat calls."""
+        with patch("os.stat", side_effect=AssertionError("unexpected stat")), \
+                patch("os.path.isdir", side_effect=AssertionError("unexpected isdir")):
+            assert len(list(walk_tree(str(tree)))) == 6
+
+    def test_symlinked_directories_not_followed_by_default(self, tree):
+        """Like os.walk, links to directories are listed but not entered."""
+        result = dict((folder, dirs) for folder, dirs, _ in walk_tree(str(tree)))
+        assert "loop" in result[os.path.join("a", "inner")]
+        assert os.path.join("a", "inner", "loop") not in result
+
+    def test_symlink_cycles_are_walked_once(self, tree):
+        """Following symlinks terminates on a link back to an ancestor."""
+        folders = [folder for folder, _, _ in walk_tree(
+            str(tree), follow_symlinks=True)]
+        assert os.path.join("a", "inner", "loop") not in folders
+        assert len(folders) == len(set(folders))
+
+    def test_start_below_root(self, tree):
+        """Walks can start from a subdirectory and keep project-relative paths."""
+        folders = [folder for folder, _, _ in walk_tree(str(tree), "a")]
+        assert folders == ["a", os.path.join("a", "inner")]
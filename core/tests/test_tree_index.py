@@ -0,0 +1,203 @@
+import os
+import time
+from unittest.mock import patch
+import pytest
+from src.file_service import FileService
+from src.file_watcher import InotifyWatcher, WatchLimitReached
+
+
+def wait_for(condition, timeout=3.0):
+    """Poll `condition` until it holds or the timeout expires."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+@pytest.fixture
+def file_service(project):
+    """Provides a FileService with a running tree index."""
+    service = FileService(str(project), str(project / ".agentignore"),
+                          rescan_interval=0.1)
+    service.start_index()
+    yield service
+    service.stop_index()
+
+
+def as_sets(structure):
+    return {folder: (set(entry["files"]), set(entry["directories"]))
+            for folder, entry in structure.items()}
+
+
+class TestTreeIndex:
+    """Test suite for the in-memory tree index."""
+
+    def test_index_matches_walk(self, project, file_service):
+        """The indexed structure is identical to a fresh walk."""
+        walked = FileService(str(project), str(project / ".agentignore"))
+        assert as_sets(file_service.get_directory_structure()) == \
+            as_sets(walked.get_directory_structure())
+        assert "venv" not in file_service.get_directory_structure()["."]["directories"]
+
+    @pytest.mark.skipif(not InotifyWatcher.is_supported(), reason="inotify not available")
+    def test_inotify_tracks_changes(self, project, file_service):
+        """Created, deleted and renamed paths are reflected without a rescan."""
+        assert file_service.tree_index.mode == "inotify"
+
+        (project / "src" / "new.py").write_text("")
+        (project / "src" / "debug.log").write_text("")
+        assert wait_for(lambda: "new.py" in file_service.get_directory_structure()[
+            "src"]["files"])
+        assert "debug.log" not in file_service.get_directory_structure()[
+            "src"]["files"]
+
+        (project / "pkg" / "sub").mkdir(parents=True)
+        (project / "pkg" / "sub" / "mod.py").write_text("")
+        assert wait_for(lambda: "mod.py" in file_service.get_directory_structure().get(
+            os.path.join("pkg", "sub"), {}).get("files", []))
+
+        os.rename(project / "pkg", project / "lib")
+        assert wait_for(lambda: os.path.join("lib", "sub")
+                        in file_service.get_directory_structure())
+        assert os.path.join("pkg", "sub") not in file_service.get_directory_structure()
+
+        (project / "src" / "main.py").unlink()
+        assert wait_for(lambda: "main.py" not in file_service.get_directory_structure()[
+            "src"]["files"])
+
+    def test_polling_fallback_on_watch_limit(self, project):
+        """Hitting the inotify watch limit falls back to mtime rescans."""
+        service = FileService(str(project), str(project / ".agentignore"),
+                              rescan_interval=0.1)
+        with patch.object(InotifyWatcher, "add_watch", side_effect=WatchLimitReached(28, "limit")):
+            service.start_index()
+        try:
+            assert service.tree_index.mode == "polling"
+
+            (project / "docs").mkdir()
+            (project / "docs" / "guide.md").write_text("")
+            assert wait_for(lambda: "docs" in service.get_directory_structure())
+
+            (project / "README.md").unlink()
+            assert wait_for(lambda: "README.md" not in service.get_directory_structure()[
+                "."]["files"])
+        finally:
+            service.stop_index()
+
+    def test_changes_during_the_first_walk_are_caught_up(self, project):
+        """A file created while the project is first walked, before any watch exists, is indexed."""
+        service = FileService(str(project), str(project / ".agentignore"), rescan_interval=60)
+        walk = service.walk
+        created = []
+
+        def walk_and_create(rel_dir, max_depth=None):
+            for record in walk(rel_dir, max_depth):
+                yield record
+                if not created:
+                    (project / "late.txt").write_text("")
+                    created.append(True)
+
+        service.walk = walk_and_create
+        with patch.object(InotifyWatcher, "is_supported", return_value=False):
+            service.start_index()
+        try:
+            assert "late.txt" in service.get_directory_structure()["."]["files"]
+        finally:
+            service.stop_index()
+
+    def test_unknown_paths_keep_the_generation(self, project, file_service):
+        """Events on paths the index does not hold change nothing, not even its ETags."""
+        generation = file_service.tree_index.generation
+        file_service.tree_index.handle_event('deleted', 'venv/lib.py', False)
+        file_service.tree_index.handle_event('deleted', 'missing', True)
+        assert file_service.tree_index.generation == generation
+        file_service.tree_index.handle_event('deleted', 'README.md', False)
+        assert file_service.tree_index.generation == generation + 1
+
+    def test_paging_sorts_each_folder_once(self, project):
+        """Pages of a large folder share one sorted listing until the folder changes."""
+        for i in range(30):
+            (project / "src" / f"mod{i:02d}.py").write_text("")
+        file_service = FileService(str(project), str(project / ".agentignore"))
+        file_service.start_index()
+        # Let the background index builds finish their own listing first
+        file_service.search_index.sync()
+        file_service.symbol_index.sync()
+        file_service.tree_index.handle_event('created', 'src/new.py', False)
+        names = []
+        with patch("src.tree_index.sorted", side_effect=sorted, create=True) as sort:
+            page = file_service.get_structure_page("src", limit=7)
+            while True:
+                names += page["structure"]["src"]["files"]
+                if not page["next_cursor"]:
+                    break
+                page = file_service.get_structure_page(
+                    "src", limit=7, cursor=page["next_cursor"])
+        file_service.stop_index()
+        # One sort of the directories and one of the files, for all five pages
+        assert sort.call_count == 2
+        assert names == sorted(os.listdir(project / "src") + ["new.py"])
+
+    def test_rescan_detects_removed_directory(self, project):
+        """A rescan drops directories that disappeared from disk."""
+        service = FileService(str(project), str(project / ".agentignore"),
+                              rescan_interval=60)
+        with patch.object(InotifyWatcher, "is_supported", return_value=False):
+            service.start_index()
+        try:
+            (project / "web" / "user.ts").unlink()
+            (project / "web").rmdir()
+            service.tree_index.rescan()
+            structure = service.get_directory_structure()
+            assert "web" not in structure
+            assert "web" not in structure["."]["directories"]
+        finally:
+            service.stop_index()
+
+    def test_snapshot_restores_index_without_walk(self, project, tmp_path_factory):
+        """A restart loads the snapshot and only re-lists directories that changed."""
+        snapshot_path = str(tmp_path_factory.mktemp("state") / "tree_index.sqlite")
+        service = FileService(str(project), str(project / ".agentignore"),
+                              snapshot_path=snapshot_path)
+        with patch.object(InotifyWatcher, "is_supported", return_value=False):
+            service.start_index()
+        service.stop_index()
+        assert os.path.exists(snapshot_path)
+
+        (project / "src" / "new.py").write_text("")
+        os.utime(project / "src", ns=(0, 10**9))
+        restarted = FileService(str(project), str(project / ".agentignore"),
+                                snapshot_path=snapshot_path)
+        walked = []
+        walk = restarted.walk
+        restarted.walk = lambda rel_dir, max_depth=None: (
+            walked.append(rel_dir) or walk(rel_dir, max_depth))
+        with patch.object(InotifyWatcher, "is_supported", return_value=False):
+            restarted.start_index()
+        try:
+            structure = restarted.get_directory_structure()
+            assert set(structure["src"]["files"]) == {"config.py", "main.py", "new.py", "util.py"}
+            assert walked == ["src"]
+        finally:
+            restarted.stop_index()
+
+    def test_snapshot_ignored_when_ignore_rules_change(self, project, tmp_path_factory):
+        """A snapshot taken with other ignore rules is replaced by a full walk."""
+        snapshot_path = str(tmp_path_factory.mktemp("state") / "tree_index.sqlite")
+        service = FileService(str(project), str(project / ".agentignore"),
+                              snapshot_path=snapshot_path)
+        with patch.object(InotifyWatcher, "is_supported", return_value=False):
+            service.start_index()
+        service.stop_index()
+
+        (project / ".agentignore").write_text("*.log\n")
+        restarted = FileService(str(project), str(project / ".agentignore"),
+                                snapshot_path=snapshot_path)
+        with patch.object(InotifyWatcher, "is_supported", return_value=False):
+            restarted.start_index()
+        try:
+            assert "venv" in restarted.get_directory_structure()
+        finally:
+            restarted.stop_index()
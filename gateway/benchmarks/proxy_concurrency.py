@@ -0,0 +1,120 @@
+"""
+Concurrency benchmark for the Gateway's proxy path.
+
+Drives the Gateway app in-process with many API keys requesting
+/files/content at once. Each key's tunnel points at a local fake Core that
+answers after `--latency` seconds, and S3 is replaced by an in-memory fake
+whose calls block for `--s3-latency` seconds like boto3 does, so the numbers
+reflect how well the event loop overlaps requests to Core and S3.
+With `--blocking`, the fake Core sleeps without yielding and S3 is called on
+the event loop, which is how blocking calls in async handlers used to stall
+every other request.
+
+Usage (from gateway/):
+    python benchmarks/proxy_concurrency.py --keys 50 --requests 20 --latency 0.05 --s3-latency 0.02
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from unittest.mock import MagicMock
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("API_KEYS", "benchmark-key")
+
+from gateway import GatewayAPI  # noqa: E402  pylint: disable=wrong-import-position
+
+
+def fake_core(latency, blocking):
+    """Return a handler answering like Core after `latency` seconds."""
+    body = {"app.py": {"content": "print('hello')\n" * 50}}
+
+    async def handler(request):
+        if blocking:
+            time.sleep(latency)
+        else:
+            await asyncio.sleep(latency)
+        return httpx.Response(200, json=body)
+    return handler
+
+
+def fake_s3_read(latency):
+    """Return a blocking fake of `S3Manager.load_ngrok_url`."""
+    def load_ngrok_url(key):
+        time.sleep(latency)
+        return f"https://{key}.core.local"
+    return load_ngrok_url
+
+
+async def run_on_loop(kind, func, *args):  # pylint: disable=unused-argument
+    """Stand-in for `AsyncS3Manager.run` calling S3 on the event loop."""
+    return func(*args)
+
+
+def build_gateway(keys, latency, s3_latency, blocking):
+    """Create a Gateway whose S3 and Core are local fakes."""
+    gateway = GatewayAPI()
+    key_table = {
+        key: {"expires_at": None,
+              "rate_limit": {"requests_per_minute": 10 ** 6, "current_minute": None,
+                             "minute_requests": 0}}
+        for key in keys}
+    gateway.s3_manager = MagicMock()
+    gateway.s3_manager.load_encrypted_api_keys.return_value = key_table
+    gateway.s3_manager.load_ngrok_url.side_effect = fake_s3_read(s3_latency)
+    if blocking:
+        gateway.async_s3.run = run_on_loop
+    gateway.http_client = httpx.AsyncClient(
+        transport=httpx.MockTransport(fake_core(latency, blocking)))
+    return gateway
+
+
+async def run(args):
+    keys = [f"key-{index}" for index in range(args.keys)]
+    gateway = build_gateway(keys, args.latency, args.s3_latency, args.blocking)
+    latencies = []
+
+    async with httpx.AsyncClient(app=gateway.app, base_url="http://gateway") as client:
+        async def session(key):
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                response = await client.post(
+                    "/files/content", json={"file_paths": ["app.py"]},
+                    headers={"x-api-key": key})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(session(key) for key in keys))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    total = len(latencies)
+    print(f"{args.keys} keys x {args.requests} requests, Core latency "
+          f"{args.latency * 1000:.0f} ms, S3 latency {args.s3_latency * 1000:.0f} ms"
+          f"{' (blocking)' if args.blocking else ''}")
+    print(f"  {total} requests in {elapsed:.2f} s: {total / elapsed:.0f} req/s")
+    print(f"  latency p50 {statistics.median(latencies) * 1000:.1f} ms, "
+          f"p95 {latencies[int(total * 0.95) - 1] * 1000:.1f} ms, "
+          f"p99 {latencies[int(total * 0.99) - 1] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--keys", type=int, default=50, help="simultaneous API keys")
+    parser.add_argument("--requests", type=int, default=20, help="requests per key")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds the fake Core takes to answer")
+    parser.add_argument("--s3-latency", type=float, default=0.02,
+                        help="seconds each fake S3 call blocks")
+    parser.add_argument("--blocking", action="store_true",
+                        help="block the event loop while waiting for Core and S3")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
+import importlib.util
 import logging
 from functools import lru_cache
 import os
+import time
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
-import requests
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import httpx
 from dotenv import load_dotenv
+from src.api_key_store import ApiKeyStore
+from src.async_s3_manager import AsyncS3Manager, S3TimeoutError
+from src.rate_limiter import RateLimiter
 from src.s3_manager import S3Manager
+from src.usage_flusher import UsageFlusher
 import secrets
 import base64
 import datetime
@@ -21,8 +27,14 @@ class GatewayAPI:
     def __init__(self):
         load_dotenv()
         self.ngrok_url_cache = {}
+        # api_key -> time.monotonic() of the last read of its ngrok URL from S3
+        self.ngrok_url_loaded_at = {}
+        self.ngrok_url_ttl = float(os.getenv("NGROK_URL_CACHE_TTL", "30"))
         self.ngrok_url = None
-        self.timeout = 10
+        self.timeout = float(os.getenv("CORE_TIMEOUT", "10"))
+
+        # Pooled async client for requests to Core, opened at startup
+        self.http_client = None
 
         # Initialize logger
         self.logger = logging.getLogger("GatewayAPI")
@@ -36,12 +48,33 @@ class GatewayAPI:
         # Create an S3Manager instance to handle S3 operations
         self.s3_manager = S3Manager()
 
+        # Run its blocking boto3 calls in a thread pool, off the event loop
+        self.async_s3 = AsyncS3Manager(
+            lambda: self.s3_manager,
+            max_workers=int(os.getenv("S3_MAX_WORKERS", "16")),
+            max_reads=int(os.getenv("S3_MAX_CONCURRENT_READS", "16")),
+            max_writes=int(os.getenv("S3_MAX_CONCURRENT_WRITES", "4")),
+            read_timeout=float(os.getenv("S3_READ_TIMEOUT", "5")),
+            write_timeout=float(os.getenv("S3_WRITE_TIMEOUT", "10")))
+
+        # Keep the API key table in memory, refreshed from S3 after a TTL
+        self.api_key_store = ApiKeyStore(
+            lambda: self.s3_manager, ttl=float(os.getenv("API_KEY_CACHE_TTL", "30")))
+
+        # Enforce rate limits in memory and write usage counters to S3 in batches
+        self.rate_limiter = RateLimiter()
+        self.usage_flusher = UsageFlusher(
+            lambda: self.s3_manager,
+            interval=float(os.getenv("USAGE_FLUSH_INTERVAL", "60")),
+            max_pending=int(os.getenv("USAGE_FLUSH_THRESHOLD", "500")))
+
         # Initialize the FastAPI app
         self.app = FastAPI()
 
         # Register routes and middleware
         self.setup_routes()
         self.setup_middleware()
+        self.setup_events()
 
     @lru_cache(maxsize=128)
     def get_cached_ngrok_url(self, api_key):
@@ -63,6 +96,7 @@ class GatewayAPI:
         if ngrok_url:
             # Forcefully update the cache with the latest ngrok URL
             self.ngrok_url_cache[api_key] = ngrok_url
+            self.ngrok_url_loaded_at[api_key] = time.monotonic()
             print(f"DEBUG: Updated ngrok URL cache for {api_key}: {ngrok_url}")
             self.logger.info(
                 "Updated ngrok URL cache for %s: %s", api_key, ngrok_url)
@@ -79,6 +113,83 @@ class GatewayAPI:
                 status_code=404, detail=f"No ngrok URL found for API key {api_key}"
             )
 
+    async def refresh_ngrok_url(self, api_key: str):
+        """Run `update_ngrok_url_from_s3` off the event loop."""
+        await self.async_s3.run("read", self.update_ngrok_url_from_s3, api_key)
+
+    async def load_ngrok_url(self, api_key: str):
+        """
+        Return the ngrok URL of an API key from the cache, reading it from S3
+        when it is not held or older than NGROK_URL_CACHE_TTL seconds.
+        """
+        loaded_at = self.ngrok_url_loaded_at.get(api_key)
+        if api_key not in self.ngrok_url_cache or loaded_at is None \
+                or time.monotonic() - loaded_at >= self.ngrok_url_ttl:
+            await self.refresh_ngrok_url(api_key)
+        return self.ngrok_url_cache.get(api_key)
+
+    async def load_api_key_table(self):
+        """Return the API key table, reading S3 off the event loop when it is not held."""
+        api_keys = self.api_key_store.cached()
+        if api_keys is None:
+            api_keys = await self.async_s3.run("read", self.api_key_store.table)
+        return api_keys
+
+    def create_http_client(self):
+        """
+        Create the async client for requests to Core. Connections to each
+        tunnel are kept alive in its pool, and HTTP/2 is used when the `h2`
+        package is installed and CORE_HTTP2 is not disabled.
+        """
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("CORE_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("CORE_MAX_KEEPALIVE_CONNECTIONS", "20")),
+            keepalive_expiry=float(os.getenv("CORE_KEEPALIVE_EXPIRY", "30")))
+        timeout = httpx.Timeout(
+            self.timeout, connect=float(os.getenv("CORE_CONNECT_TIMEOUT", "5")))
+        http2 = os.getenv("CORE_HTTP2", "true").lower() == "true" \
+            and importlib.util.find_spec("h2") is not None
+        return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+    def get_http_client(self):
+        """Return the shared client for requests to Core, creating it if needed."""
+        if self.http_client is None:
+            self.http_client = self.create_http_client()
+        return self.http_client
+
+    async def open_core_stream(self, method, url, **kwargs):
+        """
+        Send a request to Core on the shared client and return its response
+        with the body not read yet. `timeout` overrides the client's; the
+        other arguments build the request. The caller closes the response.
+        """
+        client = self.get_http_client()
+        send_kwargs = {"timeout": kwargs.pop("timeout")} if "timeout" in kwargs else {}
+        core_request = client.build_request(method, url, **kwargs)
+        return await client.send(core_request, stream=True, **send_kwargs)
+
+    def setup_events(self):
+        """Open the client for Core at startup; close it and write pending usage at shutdown."""
+        @self.app.on_event("startup")
+        async def open_http_client():
+            self.get_http_client()
+
+        @self.app.on_event("shutdown")
+        async def close_http_client():
+            if self.http_client is not None:
+                await self.http_client.aclose()
+                self.http_client = None
+
+        @self.app.on_event("shutdown")
+        async def flush_usage():
+            # The last flush is a conditional write of the key table, so it runs
+            # off the event loop within the limits of the other S3 writes
+            try:
+                await self.async_s3.run("write", self.usage_flusher.stop)
+            except S3TimeoutError:
+                self.logger.error("Pending API key usage was not written before shutdown")
+            self.async_s3.shutdown()
+
     def setup_middleware(self):
         """Configure the middleware for API key validation."""
         @self.app.middleware("http")
@@ -95,8 +206,8 @@ class GatewayAPI:
                 return JSONResponse(status_code=401, content={"detail": "Missing API Key"})
 
             try:
-                # First check in S3 for faster validation
-                api_keys = self.s3_manager.load_encrypted_api_keys() or {}
+                # Validate against the in-memory copy of the key table
+                api_keys = await self.load_api_key_table()
                 if api_key not in api_keys:
                     return JSONResponse(status_code=401, content={"detail": "Invalid API Key"})
 
@@ -125,50 +236,40 @@ class GatewayAPI:
                     try:
                         current_minute = current_time.strftime(
                             "%Y-%m-%d %H:%M")
-                        if current_minute != rate_limit.get("current_minute"):
-                            # Reset counter for new minute
-                            rate_limit["current_minute"] = current_minute
-                            rate_limit["minute_requests"] = 0
-
-                        if rate_limit["minute_requests"] >= rate_limit.get("requests_per_minute", 60):
-                            next_minute = datetime.datetime.strptime(
-                                current_minute, "%Y-%m-%d %H:%M") + datetime.timedelta(minutes=1)
+                        requests_per_minute = rate_limit.get(
+                            "requests_per_minute", 60)
+                        # Requests already persisted for this minute count
+                        # against a bucket created after a restart
+                        used = rate_limit.get("minute_requests", 0) \
+                            if rate_limit.get("current_minute") == current_minute else 0
+                        retry_after = self.rate_limiter.acquire(
+                            api_key, requests_per_minute, used)
+                        if retry_after is not None:
+                            reset_at = current_time + \
+                                datetime.timedelta(seconds=retry_after)
                             return JSONResponse(
                                 status_code=429,
                                 content={
                                     "detail": "Rate limit exceeded. Please try again in the next minute.",
-                                    "limit": rate_limit["requests_per_minute"],
-                                    "reset_at": next_minute.isoformat()
+                                    "limit": requests_per_minute,
+                                    "reset_at": reset_at.isoformat()
                                 }
                             )
-
-                        # Update rate limit counters
-                        rate_limit["minute_requests"] += 1
-                        key_data["total_requests"] = key_data.get(
-                            "total_requests", 0) + 1
-                        key_data["last_used"] = current_time.isoformat()
-
-                        # Store updated key data
-                        try:
-                            self.s3_manager.store_encrypted_api_keys(api_keys)
-                        except Exception as e:
-                            self.logger.error(
-                                f"Error storing updated key data: {str(e)}")
-                            # Continue processing even if storage fails
                     except Exception as e:
                         self.logger.error(
                             f"Error checking rate limit: {str(e)}")
                         return JSONResponse(status_code=500, content={"detail": "Error checking rate limit"})
 
+                # Usage counters are written to S3 in batches
+                self.usage_flusher.record(api_key, current_time)
+
                 # Skip ngrok URL validation for /ngrok-urls/ endpoints
                 if request.url.path.startswith("/ngrok-urls/"):
                     return await call_next(request)
 
                 # Use ngrok URL cache for each request dynamically based on the API key
                 try:
-                    self.update_ngrok_url_from_s3(api_key)
-                    # Retrieve the ngrok URL after updating
-                    ngrok_url = self.ngrok_url_cache.get(api_key)
+                    ngrok_url = await self.load_ngrok_url(api_key)
 
                     # Debug log for inspecting the ngrok URL
                     self.logger.info(
@@ -189,19 +290,112 @@ class GatewayAPI:
                         return JSONResponse(status_code=500, content={"detail": "Invalid ngrok URL"})
                 except HTTPException as e:
                     return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
+                except S3TimeoutError:
+                    return JSONResponse(status_code=503, content={"detail": "Storage timed out"})
                 except Exception as e:
                     self.logger.error(f"Error updating ngrok URL: {str(e)}")
                     return JSONResponse(status_code=500, content={"detail": "Error updating ngrok URL"})
 
+            except S3TimeoutError:
+                return JSONResponse(status_code=503, content={"detail": "Storage timed out"})
             except Exception as e:
                 self.logger.error(f"Error in middleware: {str(e)}")
                 return JSONResponse(status_code=500, content={"detail": "Internal server error"})
 
+    @staticmethod
+    def conditional_headers(request: Request) -> dict:
+        """
+        Return the client's conditional and Accept-Encoding request headers to
+        forward to Core, so Core compresses for what the client accepts -
+        and not at all when the client did not say.
+        """
+        headers = {"Accept-Encoding": "identity"}
+        for name in ("If-None-Match", "Accept-Encoding"):
+            value = request.headers.get(name)
+            if value:
+                headers[name] = value
+        return headers
+
+    def stream_response(self, request: Request, response):
+        """
+        Relay a Core response to the client chunk by chunk, without parsing
+        it, so memory per request stays bounded by the chunk size. The body
+        is passed on as received, compressed or not, with its Content-Type,
+        Content-Encoding and ETag; it is only decompressed for a client that
+        did not negotiate an encoding.
+        """
+        headers = self.etag_headers(response)
+        encoding = response.headers.get("Content-Encoding")
+        if encoding and not request.headers.get("Accept-Encoding"):
+            chunks = response.aiter_bytes()
+        else:
+            chunks = response.aiter_raw()
+            if encoding:
+                headers.update({"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+            if response.headers.get("Content-Length"):
+                headers["Content-Length"] = response.headers["Content-Length"]
+
+        async def relay():
+            try:
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                await response.aclose()
+
+        return StreamingResponse(relay(), status_code=response.status_code, headers=headers,
+                                 media_type=response.headers.get("Content-Type"))
+
+    @staticmethod
+    def etag_headers(response) -> dict:
+        """Return the ETag of a Core response as headers for the client."""
+        etag = response.headers.get("ETag")
+        return {"ETag": etag} if etag else {}
+
+    async def proxy_to_core(self, request: Request, method: str, url: str, error: str, **kwargs):
+        """
+        Send a request to Core with the client's conditional headers and
+        stream its answer back. Core's 200, 400 and 404 are relayed as is and
+        its 304 with the ETag; anything else, or Core being unreachable,
+        raises a 500 whose detail starts with `error`.
+        """
+        try:
+            response = await self.open_core_stream(
+                method, url, headers=self.conditional_headers(request), **kwargs)
+        except httpx.HTTPError as e:
+            self.logger.error("Failed request to %s with exception: %s", url, e)
+            if isinstance(e, httpx.TransportError):
+                # The tunnel may have moved, so the next request reads its URL again
+                self.invalidate_ngrok_cache(request.headers.get("x-api-key"))
+            raise HTTPException(status_code=500, detail=f"{error}: {str(e)}") from e
+
+        if response.status_code in (200, 400, 404):
+            return self.stream_response(request, response)
+        await response.aclose()
+        if response.status_code == 304:
+            return Response(status_code=304, headers=self.etag_headers(response))
+        self.logger.error("Core answered %s to %s", response.status_code, url)
+        raise HTTPException(
+            status_code=500, detail=f"{error}: Core answered {response.status_code}")
+
+    async def forward_get(self, request: Request, path: str):
+        """Forward a GET request with its query parameters to Core and relay the answer."""
+        api_key = request.headers.get("x-api-key")
+        if not api_key:
+            raise HTTPException(status_code=401, detail="API Key missing")
+        ngrok_url = self.ngrok_url_cache.get(api_key)
+        if not ngrok_url:
+            raise HTTPException(
+                status_code=404, detail=f"No ngrok URL found for API key {api_key}")
+        return await self.proxy_to_core(
+            request, "GET", f"{ngrok_url}{path}", f"Error requesting {path}",
+            params=dict(request.query_params))
+
     def invalidate_ngrok_cache(self, api_key: str):
         """Forcefully invalidate the in-memory cache for the given API key."""
         if api_key in self.ngrok_url_cache:
             print(f"DEBUG: Invalidating cache for API key: {api_key}")
             del self.ngrok_url_cache[api_key]
+        self.ngrok_url_loaded_at.pop(api_key, None)
 
     def setup_routes(self):
         """Define all the routes for the gateway."""
@@ -231,7 +425,7 @@ class GatewayAPI:
 
             if not ngrok_url or not ngrok_url.startswith("https://"):
                 # If invalid, force a refresh from S3
-                self.update_ngrok_url_from_s3(api_key)
+                await self.refresh_ngrok_url(api_key)
                 ngrok_url = self.ngrok_url_cache.get(api_key)
                 self.logger.info(
                     "After forced refresh, ngrok URL for %s is: %s", api_key, ngrok_url)
@@ -243,26 +437,10 @@ class GatewayAPI:
             print(
                 f"DEBUG: Making request to {ngrok_url}/files/structure with API key: {api_key}")
 
-            # Use the ngrok URL dynamically updated by the middleware
-            try:
-                response = requests.get(
-                    f"{ngrok_url}/files/structure", timeout=self.timeout)
-
-                # Check if response is None or has no content
-                if not response or response.status_code != 200:
-                    raise HTTPException(
-                        status_code=500, detail="Error retrieving file structure. Response is invalid or empty."
-                    )
-
-                response.raise_for_status()
-                return response.json()
-            except requests.exceptions.RequestException as e:
-                # Add additional logging to capture the full error
-                self.logger.error(
-                    "Failed request to %s/files/structure with exception: %s", ngrok_url, e)
-                raise HTTPException(
-                    status_code=500, detail=f"Error retrieving file structure: {str(e)}"
-                ) from e
+            # Forward subtree, depth and pagination parameters to Core
+            return await self.proxy_to_core(
+                request, "GET", f"{ngrok_url}/files/structure", "Error retrieving file structure",
+                params=dict(request.query_params))
 
         @self.app.post("/files/content")
         async def get_file_content(request: Request, request_data: dict):
@@ -282,16 +460,78 @@ class GatewayAPI:
             print(f"DEBUG: Retrieved ngrok URL for {api_key}: {ngrok_url}")
             print(f"DEBUG: Current ngrok URL Cache: {self.ngrok_url_cache}")
 
-            # Use the ngrok URL dynamically updated by the middleware
-            try:
-                response = requests.post(
-                    f"{ngrok_url}/files/content", json=request_data, timeout=self.timeout)
-                response.raise_for_status()
-                return response.json()
-            except requests.exceptions.RequestException as e:
+            return await self.proxy_to_core(
+                request, "POST", f"{ngrok_url}/files/content", "Error retrieving file content",
+                json=request_data)
+
+        @self.app.post("/files/search")
+        async def search_files(request: Request, request_data: dict):
+            """
+            Search the text of the project's files through the Codebase Query API.
+            """
+            api_key = request.headers.get("x-api-key")
+            if not api_key:
+                raise HTTPException(status_code=401, detail="API Key missing")
+
+            ngrok_url = self.ngrok_url_cache.get(api_key)
+            if not ngrok_url:
                 raise HTTPException(
-                    status_code=500, detail=f"Error retrieving file content: {str(e)}"
-                ) from e
+                    status_code=404, detail=f"No ngrok URL found for API key {api_key}")
+
+            return await self.proxy_to_core(
+                request, "POST", f"{ngrok_url}/files/search", "Error searching files",
+                json=request_data)
+
+        @self.app.post("/files/grep")
+        async def grep_files(request: Request, request_data: dict):
+            """
+            Grep the project's files through the Codebase Query API, relaying
+            its NDJSON records.
+            """
+            api_key = request.headers.get("x-api-key")
+            if not api_key:
+                raise HTTPException(status_code=401, detail="API Key missing")
+
+            ngrok_url = self.ngrok_url_cache.get(api_key)
+            if not ngrok_url:
+                raise HTTPException(
+                    status_code=404, detail=f"No ngrok URL found for API key {api_key}")
+
+            # Allow for Core's own deadline on top of the usual timeout
+            deadline_ms = request_data.get("deadline_ms", 10000)
+            if not isinstance(deadline_ms, int):
+                deadline_ms = 10000
+            return await self.proxy_to_core(
+                request, "POST", f"{ngrok_url}/files/grep", "Error searching files",
+                json=request_data, timeout=self.timeout + deadline_ms / 1000)
+
+        @self.app.get("/files/manifest")
+        async def get_file_manifest(request: Request):
+            """
+            List the project's files with their content hashes from the Codebase Query API.
+            """
+            return await self.forward_get(request, "/files/manifest")
+
+        @self.app.get("/files/changes")
+        async def get_file_changes(request: Request):
+            """
+            Retrieve the paths changed since a cursor from the Codebase Query API.
+            """
+            return await self.forward_get(request, "/files/changes")
+
+        @self.app.get("/symbols/search")
+        async def search_symbols(request: Request):
+            """
+            Find class, function and type definitions through the Codebase Query API.
+            """
+            return await self.forward_get(request, "/symbols/search")
+
+        @self.app.get("/symbols/source")
+        async def get_symbol_source(request: Request):
+            """
+            Retrieve the source of a definition from the Codebase Query API.
+            """
+            return await self.forward_get(request, "/symbols/source")
 
         @self.app.post("/ngrok-urls/")
         async def update_ngrok_url_endpoint(request: Request):
@@ -307,7 +547,7 @@ class GatewayAPI:
                     )
 
                 # Use the S3Manager instance to update the ngrok URL
-                update_response = self.s3_manager.update_ngrok_url(
+                update_response = await self.async_s3.update_ngrok_url(
                     api_key, ngrok_url)
 
                 # Invalidate the in-memory cache for the updated API key
@@ -336,17 +576,16 @@ class GatewayAPI:
                 api_key = unquote_plus(api_key)
 
                 # First check if the key exists in the API keys file
-                api_keys = self.s3_manager.load_encrypted_api_keys() or {}
-                if api_key not in api_keys:
+                if (await self.load_api_key_table()).get(api_key) is None:
                     raise HTTPException(
                         status_code=404, detail=f"API key {api_key} not found")
 
                 # Then get the ngrok URL (which may be null)
-                ngrok_url = self.s3_manager.load_ngrok_url(api_key)
+                ngrok_url = await self.async_s3.load_ngrok_url(api_key)
 
                 # If the key doesn't exist in the ngrok URLs file, initialize it with null
                 if ngrok_url is False:
-                    self.s3_manager.update_ngrok_url(api_key, None)
+                    await self.async_s3.update_ngrok_url(api_key, None)
                     ngrok_url = None
 
                 # Return the URL (which may be None)
@@ -383,34 +622,33 @@ class GatewayAPI:
                 expires_at = (created_at + datetime.timedelta(days=expiration_days)
                               ).isoformat() if expiration_days else None
 
-                # Load existing API keys
-                api_keys = self.s3_manager.load_encrypted_api_keys() or {}
-
-                # Add the new key with settings
-                api_keys[new_api_key] = {
-                    "created_at": created_at.isoformat(),
-                    "last_used": None,
-                    "expires_at": expires_at,
-                    "rate_limit": {
-                        "requests_per_minute": requests_per_minute,
-                        "current_minute": None,
-                        "minute_requests": 0
-                    },
-                    "total_requests": 0
-                }
+                def add_key(api_keys):
+                    # Add the new key with settings
+                    api_keys[new_api_key] = {
+                        "created_at": created_at.isoformat(),
+                        "last_used": None,
+                        "expires_at": expires_at,
+                        "rate_limit": {
+                            "requests_per_minute": requests_per_minute,
+                            "current_minute": None,
+                            "minute_requests": 0
+                        },
+                        "total_requests": 0
+                    }
 
-                # Store updated keys
+                # Store the key with a conditional write shared by every writer of the table
                 try:
-                    self.s3_manager.store_encrypted_api_keys(api_keys)
+                    await self.async_s3.update_encrypted_api_keys(add_key)
                 except Exception as e:
                     self.logger.error(f"Error storing API key: {str(e)}")
                     raise HTTPException(
                         status_code=500,
                         detail="Failed to store API key. Please try again later."
                     )
+                self.api_key_store.invalidate()
 
                 # Initialize an empty entry in ngrok_urls.json for this API key
-                self.s3_manager.update_ngrok_url(new_api_key, None)
+                await self.async_s3.update_ngrok_url(new_api_key, None)
 
                 # Update the in-memory cache
                 self.api_keys[new_api_key] = f"User{len(self.api_keys) + 1}"
@@ -447,42 +685,41 @@ class GatewayAPI:
                 # Get the admin key from environment variables
                 admin_key = os.getenv("ADMIN_API_KEY")
 
-                # Load current API keys
-                api_keys = self.s3_manager.load_encrypted_api_keys() or {}
-
-                # Check if the key exists
-                if api_key not in api_keys:
-                    raise HTTPException(
-                        status_code=404,
-                        detail=f"API key {api_key} not found"
-                    )
-
-                # Check authorization:
-                # 1. Admin can purge any key except admin key
-                # 2. Users can only purge their own key
-                if request_api_key != admin_key and request_api_key != api_key:
-                    raise HTTPException(
-                        status_code=401,
-                        detail="Unauthorized. You can only purge your own API key."
-                    )
-
-                # Check if trying to delete admin key
-                if api_key == admin_key:
-                    raise HTTPException(
-                        status_code=403,
-                        detail="Cannot purge admin API key"
-                    )
-
-                # Store key data for audit log
-                purged_key_data = api_keys[api_key]
-
-                # Remove the key from api_keys.json
-                del api_keys[api_key]
-                self.s3_manager.store_encrypted_api_keys(api_keys)
+                def remove_key(api_keys):
+                    # Check if the key exists
+                    if api_key not in api_keys:
+                        raise HTTPException(
+                            status_code=404,
+                            detail=f"API key {api_key} not found"
+                        )
+
+                    # Check authorization:
+                    # 1. Admin can purge any key except admin key
+                    # 2. Users can only purge their own key
+                    if request_api_key != admin_key and request_api_key != api_key:
+                        raise HTTPException(
+                            status_code=401,
+                            detail="Unauthorized. You can only purge your own API key."
+                        )
+
+                    # Check if trying to delete admin key
+                    if api_key == admin_key:
+                        raise HTTPException(
+                            status_code=403,
+                            detail="Cannot purge admin API key"
+                        )
+
+                    # Remove the key, returning its data for the audit log
+                    return api_keys.pop(api_key)
+
+                # Remove the key from api_keys.json with a conditional write
+                purged_key_data = await self.async_s3.update_encrypted_api_keys(remove_key)
+                self.api_key_store.invalidate()
+                self.rate_limiter.reset(api_key)
 
                 # Remove the key from ngrok_urls.json
                 try:
-                    self.s3_manager.update_ngrok_url(api_key, None)
+                    await self.async_s3.update_ngrok_url(api_key, None)
                 except Exception as e:
                     self.logger.error(
                         f"Error removing ngrok URL for {api_key}: {str(e)}")
@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+
+
+class ApiKeyStore:
+    """
+    In-memory copy of the API key table, so validating a key is a dict
+    lookup instead of an S3 read per request.
+
+    The table is loaded from S3 on first use. Once it is older than `ttl`
+    seconds, the next lookup still answers from memory and starts a refresh
+    in the background, a conditional GET that only downloads the table when
+    its ETag changed. `invalidate` drops the copy after the Gateway itself
+    rewrote the table, so the next lookup reads it again.
+
+    The S3Manager is looked up through `s3_manager_provider` on every load,
+    so the one in use can be swapped out.
+    """
+
+    def __init__(self, s3_manager_provider, ttl=30.0):
+        self.s3_manager_provider = s3_manager_provider
+        self.ttl = ttl
+        self.logger = logging.getLogger("ApiKeyStore")
+        self._table = None
+        self._etag = None
+        self._loaded_at = 0.0
+        # Bumped by invalidate, so a load started before it is discarded
+        self._generation = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def table(self):
+        """
+        Return the {api_key: key_data} table, loading it from S3 if it is not
+        held yet. Raises the S3Manager's errors for that first load.
+        """
+        table = self.cached()
+        return self._load() if table is None else table
+
+    def cached(self):
+        """
+        Return the table held in memory without reading S3, or None when it
+        is not loaded. Like `table`, starts a refresh once it is stale.
+        """
+        with self._lock:
+            table, loaded_at = self._table, self._loaded_at
+        if table is not None and time.monotonic() - loaded_at >= self.ttl:
+            self._refresh_in_background()
+        return table
+
+    def get(self, api_key):
+        """Return the data of an API key, or None for an unknown key."""
+        return self.table().get(api_key)
+
+    def invalidate(self):
+        """Drop the table, so the next lookup loads it from S3."""
+        with self._lock:
+            self._table = None
+            self._etag = None
+            self._generation += 1
+
+    def _load(self):
+        with self._lock:
+            generation = self._generation
+        table = self.s3_manager_provider().load_encrypted_api_keys() or {}
+        with self._lock:
+            if generation == self._generation:
+                self._table = table
+                self._etag = None
+                self._loaded_at = time.monotonic()
+        return table
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name="ApiKeyStoreRefresh", daemon=True).start()
+
+    def _refresh(self):
+        with self._lock:
+            generation, etag = self._generation, self._etag
+        try:
+            result = self.s3_manager_provider().load_encrypted_api_keys_if_modified(etag)
+            with self._lock:
+                if generation == self._generation:
+                    if result is not None:
+                        table, self._etag = result
+                        self._table = table or {}
+                    self._loaded_at = time.monotonic()
+            self.logger.debug("API keys %s", "reloaded" if result is not None else "unchanged")
+        except Exception as e:
+            # Keep serving the table held; the next lookup after the TTL retries
+            self.logger.error("Error refreshing API keys: %s", str(e))
+            with self._lock:
+                self._loaded_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._refreshing = False
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+
+class S3TimeoutError(TimeoutError):
+    """Raised when an S3 operation takes longer than its timeout."""
+
+
+class AsyncS3Manager:
+    """
+    Async facade over S3Manager. Its boto3 calls block, so they run in a
+    bounded thread pool instead of on the event loop, and a slow S3 only
+    delays the requests waiting for it.
+
+    Reads and writes have their own concurrency limit and timeout. A call
+    that times out raises S3TimeoutError to its caller, but keeps its slot
+    until the boto3 call really returns, so stuck calls cannot pile up
+    beyond the limit.
+
+    The S3Manager is looked up through `s3_manager_provider` on every call,
+    so the one in use can be swapped out.
+    """
+
+    def __init__(self, s3_manager_provider, max_workers=16, max_reads=16, max_writes=4,
+                 read_timeout=5.0, write_timeout=10.0):
+        self.s3_manager_provider = s3_manager_provider
+        self.logger = logging.getLogger("AsyncS3Manager")
+        self.limits = {"read": max_reads, "write": max_writes}
+        self.timeouts = {"read": read_timeout, "write": write_timeout}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="S3")
+        # kind -> (event loop, semaphore); semaphores belong to one loop
+        self._semaphores = {}
+
+    def _semaphore(self, kind):
+        loop = asyncio.get_running_loop()
+        held = self._semaphores.get(kind)
+        if held is None or held[0] is not loop:
+            held = self._semaphores[kind] = (loop, asyncio.Semaphore(self.limits[kind]))
+        return held[1]
+
+    async def run(self, kind, func, *args):
+        """
+        Run the blocking `func(*args)` in the thread pool within the limits
+        of `kind` ("read" or "write") and return its result. Raises
+        S3TimeoutError when waiting for a slot and the call together take
+        longer than the timeout of `kind`.
+        """
+        loop = asyncio.get_running_loop()
+        timeout = self.timeouts[kind]
+        deadline = loop.time() + timeout
+        semaphore = self._semaphore(kind)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out(kind, func) from None
+        try:
+            future = loop.run_in_executor(self._executor, func, *args)
+        except BaseException:
+            semaphore.release()
+            raise
+        future.add_done_callback(lambda _: semaphore.release())
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            raise self._timed_out(kind, func) from None
+
+    def _timed_out(self, kind, func):
+        name = getattr(func, "__name__", repr(func))
+        self.logger.error("S3 %s %s timed out after %ss", kind, name, self.timeouts[kind])
+        return S3TimeoutError(f"S3 {kind} timed out after {self.timeouts[kind]}s")
+
+    async def _call(self, kind, method, *args):
+        return await self.run(kind, getattr(self.s3_manager_provider(), method), *args)
+
+    async def load_encrypted_api_keys(self):
+        """Async `S3Manager.load_encrypted_api_keys`."""
+        return await self._call("read", "load_encrypted_api_keys")
+
+    async def store_encrypted_api_keys(self, api_keys):
+        """Async `S3Manager.store_encrypted_api_keys`."""
+        return await self._call("write", "store_encrypted_api_keys", api_keys)
+
+    async def update_encrypted_api_keys(self, update):
+        """Async `S3Manager.update_encrypted_api_keys`."""
+        return await self._call("write", "update_encrypted_api_keys", update)
+
+    async def load_ngrok_url(self, api_key):
+        """Async `S3Manager.load_ngrok_url`."""
+        return await self._call("read", "load_ngrok_url", api_key)
+
+    async def update_ngrok_url(self, api_key, new_ngrok_url):
+        """Async `S3Manager.update_ngrok_url`."""
+        return await self._call("write", "update_ngrok_url", api_key, new_ngrok_url)
+
+    def shutdown(self):
+        """Stop the thread pool; calls in progress still finish in the background."""
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,50 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Per-key token buckets kept in memory. A bucket holds up to
+    `requests_per_minute` tokens and refills at that rate, so bursts up to
+    the limit pass while the sustained rate stays within it. Concurrent
+    requests take tokens under a lock, so none of them are lost.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        # api_key -> [capacity, tokens, updated]
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, api_key, requests_per_minute, used=0):
+        """
+        Take a token from the key's bucket. A new bucket starts with `used`
+        tokens already spent, like the requests persisted for the current
+        minute. Returns None if the request may proceed, or the seconds
+        until the next token otherwise.
+        """
+        now = self.clock()
+        capacity = float(requests_per_minute)
+        rate = capacity / 60.0
+        with self._lock:
+            bucket = self._buckets.get(api_key)
+            if bucket is None or bucket[0] != capacity:
+                tokens = capacity - used if bucket is None else min(bucket[1], capacity)
+                bucket = self._buckets[api_key] = [capacity, max(tokens, 0.0), now]
+            else:
+                bucket[1] = min(capacity, bucket[1] + (now - bucket[2]) * rate)
+                bucket[2] = now
+            if bucket[1] >= 1:
+                bucket[1] -= 1
+                return None
+            if rate <= 0:
+                return 60.0
+            return (1 - bucket[1]) / rate
+
+    def reset(self, api_key=None):
+        """Forget the bucket of a key, or of every key."""
+        with self._lock:
+            if api_key is None:
+                self._buckets.clear()
+            else:
+                self._buckets.pop(api_key, None)
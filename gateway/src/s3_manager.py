@@ -1,9 +1,18 @@
 import json
 import logging
 import os
+import threading
 import boto3
 from botocore.exceptions import ClientError
 
+# Conditional writes of the API key table retried before giving up
+API_KEYS_WRITE_ATTEMPTS = 5
+_WRITE_CONFLICT_CODES = ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409')
+
+
+class ApiKeysConflictError(Exception):
+    """Raised when the API key table kept changing while it was being updated."""
+
 
 class S3Manager:
     """
@@ -15,6 +24,8 @@ class S3Manager:
         self.s3_client = self.get_s3_client()
         self.kms_client = self.get_kms_client()
         self.bucket_name, self.object_key = self.get_s3_bucket_and_key()
+        # Serializes this process's updates of the API key table
+        self._api_keys_lock = threading.Lock()
 
     def get_s3_client(self):
         """Initialize and return a new S3 client."""
@@ -42,40 +53,7 @@ class S3Manager:
                 Bucket=self.bucket_name, Key='api_keys.json'
             )
             # S3 automatically decrypts the data when using SSE-KMS
-            raw_data = response['Body'].read().decode('utf-8')
-            api_keys = json.loads(raw_data)
-
-            # Convert legacy format if needed
-            if api_keys and isinstance(next(iter(api_keys.values())), str):
-                updated_keys = {}
-                for key, value in api_keys.items():
-                    updated_keys[key] = {
-                        "created_at": None,  # Legacy keys don't have creation time
-                        "last_used": None,
-                        "expires_at": None,  # No expiration for legacy keys
-                        "rate_limit": {
-                            "requests_per_minute": 60,  # Default rate limit
-                            "current_minute": None,
-                            "minute_requests": 0
-                        },
-                        "total_requests": 0
-                    }
-                api_keys = updated_keys
-            elif api_keys:
-                # Update existing keys with new fields if they don't exist
-                for key in api_keys:
-                    if "expires_at" not in api_keys[key]:
-                        api_keys[key]["expires_at"] = None
-                    if "rate_limit" not in api_keys[key]:
-                        api_keys[key]["rate_limit"] = {
-                            "requests_per_minute": 60,
-                            "current_minute": None,
-                            "minute_requests": 0
-                        }
-                    if "total_requests" not in api_keys[key]:
-                        api_keys[key]["total_requests"] = 0
-
-            return api_keys
+            return self.decode_api_keys(response['Body'].read())
 
         except ClientError as e:
             if e.response['Error']['Code'] == 'NoSuchKey':
@@ -88,30 +66,119 @@ class S3Manager:
             self.logger.error("Error decoding JSON data: %s", str(e))
             return None
 
+    def load_encrypted_api_keys_if_modified(self, etag=None):
+        """
+        Load API keys like `load_encrypted_api_keys`, with a conditional GET
+        when the ETag of the copy already held is given.
+        Returns (api_keys, etag), or None if the object still has that ETag.
+        """
+        request = {"Bucket": self.bucket_name, "Key": 'api_keys.json'}
+        if etag:
+            request["IfNoneMatch"] = etag
+        try:
+            response = self.s3_client.get_object(**request)
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code in ('304', 'NotModified'):
+                return None
+            if code == 'NoSuchKey':
+                self.logger.warning("API keys file not found in S3.")
+                return None, None
+            self.logger.error("ClientError while accessing S3: %s", str(e))
+            raise e
+        return self.decode_api_keys(response['Body'].read()), response.get('ETag')
+
+    @staticmethod
+    def decode_api_keys(raw_data):
+        """Parse the stored API keys, adding the fields missing from older formats."""
+        api_keys = json.loads(raw_data.decode('utf-8'))
+
+        # Convert legacy format if needed
+        if api_keys and isinstance(next(iter(api_keys.values())), str):
+            updated_keys = {}
+            for key, value in api_keys.items():
+                updated_keys[key] = {
+                    "created_at": None,  # Legacy keys don't have creation time
+                    "last_used": None,
+                    "expires_at": None,  # No expiration for legacy keys
+                    "rate_limit": {
+                        "requests_per_minute": 60,  # Default rate limit
+                        "current_minute": None,
+                        "minute_requests": 0
+                    },
+                    "total_requests": 0
+                }
+            api_keys = updated_keys
+        elif api_keys:
+            # Update existing keys with new fields if they don't exist
+            for key in api_keys:
+                if "expires_at" not in api_keys[key]:
+                    api_keys[key]["expires_at"] = None
+                if "rate_limit" not in api_keys[key]:
+                    api_keys[key]["rate_limit"] = {
+                        "requests_per_minute": 60,
+                        "current_minute": None,
+                        "minute_requests": 0
+                    }
+                if "total_requests" not in api_keys[key]:
+                    api_keys[key]["total_requests"] = 0
+
+        return api_keys
+
     def store_encrypted_api_keys(self, api_keys):
         """
         Store API keys in the S3 bucket using server-side encryption with KMS.
         """
         try:
-            # Convert API keys dictionary to JSON
-            # Handle datetime serialization
-            raw_data = json.dumps(api_keys, default=str)
-
-            # Store the data in S3 with server-side encryption
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key='api_keys.json',
-                Body=raw_data,
-                ServerSideEncryption='aws:kms',
-                SSEKMSKeyId=os.getenv('KMS_KEY_ID'),
-                ContentType='application/json'
-            )
+            self._put_api_keys(api_keys)
             return {"status": "success", "message": "API keys stored securely in S3"}
 
         except ClientError as e:
             self.logger.error("Error storing API keys in S3: %s", str(e))
             raise e
 
+    def update_encrypted_api_keys(self, update):
+        """
+        Apply `update` to the stored API keys and write them back only if
+        nobody else wrote the table in between: `update(api_keys)` changes
+        the table in place, and the write is conditional on the ETag it was
+        read with. On a conflict, the table is read and updated again.
+        Returns what the last call of `update` returned; exceptions it
+        raises abort the update. Raises ApiKeysConflictError after
+        API_KEYS_WRITE_ATTEMPTS conflicts.
+        """
+        with self._api_keys_lock:
+            for _ in range(API_KEYS_WRITE_ATTEMPTS):
+                api_keys, etag = self.load_encrypted_api_keys_if_modified()
+                api_keys = api_keys or {}
+                result = update(api_keys)
+                # A table that does not exist yet must still not exist
+                condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+                try:
+                    self._put_api_keys(api_keys, **condition)
+                    return result
+                except ClientError as e:
+                    if e.response['Error']['Code'] not in _WRITE_CONFLICT_CODES:
+                        self.logger.error("Error storing API keys in S3: %s", str(e))
+                        raise e
+                    self.logger.info("API keys changed while updating them, retrying")
+        raise ApiKeysConflictError("API keys kept changing while updating them")
+
+    def _put_api_keys(self, api_keys, **condition):
+        # Handle datetime serialization
+        raw_data = json.dumps(api_keys, default=str)
+
+        # Store the data in S3 with server-side encryption
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key='api_keys.json',
+            Body=raw_data,
+            ServerSideEncryption='aws:kms',
+            SSEKMSKeyId=os.getenv('KMS_KEY_ID'),
+            ContentType='application/json',
+            **condition
+        )
+
     def load_ngrok_url(self, api_key):
         """
         Load the ngrok URL for a given API key from the S3 bucket.
@@ -0,0 +1,116 @@
+import logging
+import threading
+
+
+class UsageFlusher:
+    """
+    Aggregates the usage counters of API keys (`total_requests`,
+    `last_used` and the requests of the current minute) in memory and
+    writes them to the key table in S3 in batches: every `interval`
+    seconds, or as soon as `max_pending` requests are waiting.
+
+    A flush adds the pending counts to the table with
+    `S3Manager.update_encrypted_api_keys`, a conditional write shared with
+    every other writer of the table, so usage recorded by other Gateway
+    instances and keys generated or purged meanwhile are kept. Counts that
+    could not be written are kept for the next flush.
+    """
+
+    def __init__(self, s3_manager_provider, interval=60.0, max_pending=500):
+        self.s3_manager_provider = s3_manager_provider
+        self.interval = interval
+        self.max_pending = max_pending
+        self.logger = logging.getLogger("UsageFlusher")
+        # api_key -> {"count", "last_used", "minute", "minute_requests"}
+        self._pending = {}
+        self._pending_requests = 0
+        self._lock = threading.Lock()
+        # Serializes flushes, so two of them never rewrite the table at once
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def record(self, api_key, when):
+        """Count a request made with `api_key` at the datetime `when`."""
+        minute = when.strftime("%Y-%m-%d %H:%M")
+        with self._lock:
+            usage = self._pending.setdefault(
+                api_key, {"count": 0, "last_used": None, "minute": minute, "minute_requests": 0})
+            usage["count"] += 1
+            usage["last_used"] = when.isoformat()
+            if usage["minute"] != minute:
+                usage["minute"], usage["minute_requests"] = minute, 0
+            usage["minute_requests"] += 1
+            self._pending_requests += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="UsageFlusher", daemon=True)
+                self._thread.start()
+            if self._pending_requests >= self.max_pending:
+                self._wake.set()
+
+    def flush(self):
+        """Write the pending counters to S3. Returns the number of requests written."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                flushed, self._pending_requests = self._pending_requests, 0
+            if not pending:
+                return 0
+            def add_usage(api_keys):
+                for api_key, usage in pending.items():
+                    if api_key in api_keys:  # Purged keys are not written back
+                        self._apply(api_keys[api_key], usage)
+
+            try:
+                self.s3_manager_provider().update_encrypted_api_keys(add_usage)
+            except Exception as e:
+                self.logger.error("Error flushing API key usage: %s", str(e))
+                self._restore(pending, flushed)
+                return 0
+        self.logger.debug("Flushed usage of %d requests for %d API keys", flushed, len(pending))
+        return flushed
+
+    def stop(self):
+        """Stop the background flushes and write what is still pending."""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    @staticmethod
+    def _apply(key_data, usage):
+        key_data["total_requests"] = key_data.get("total_requests", 0) + usage["count"]
+        if not key_data.get("last_used") or key_data["last_used"] < usage["last_used"]:
+            key_data["last_used"] = usage["last_used"]
+        rate_limit = key_data.setdefault(
+            "rate_limit", {"requests_per_minute": 60, "current_minute": None, "minute_requests": 0})
+        if rate_limit.get("current_minute") == usage["minute"]:
+            rate_limit["minute_requests"] = rate_limit.get(
+                "minute_requests", 0) + usage["minute_requests"]
+        elif not rate_limit.get("current_minute") or rate_limit["current_minute"] < usage["minute"]:
+            rate_limit["current_minute"] = usage["minute"]
+            rate_limit["minute_requests"] = usage["minute_requests"]
+
+    def _restore(self, pending, requests):
+        """Merge counters that failed to flush back into the pending ones."""
+        with self._lock:
+            for api_key, usage in pending.items():
+                newer = self._pending.get(api_key)
+                if newer is None:
+                    self._pending[api_key] = usage
+                    continue
+                newer["count"] += usage["count"]
+                newer["last_used"] = max(newer["last_used"], usage["last_used"])
+                if newer["minute"] == usage["minute"]:
+                    newer["minute_requests"] += usage["minute_requests"]
+            self._pending_requests += requests
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if not self._stopped.is_set():
+                self.flush()
@@ -0,0 +1,66 @@
+import threading
+import unittest
+from unittest.mock import MagicMock
+from src.api_key_store import ApiKeyStore
+
+
+class TestApiKeyStore(unittest.TestCase):
+    """Test suite for the in-memory API key store."""
+
+    def setUp(self):
+        self.s3_manager = MagicMock()
+        self.s3_manager.load_encrypted_api_keys.return_value = {"test-key": {"total_requests": 0}}
+        self.store = ApiKeyStore(lambda: self.s3_manager, ttl=60)
+
+    def wait_for_refresh(self):
+        for thread in threading.enumerate():
+            if thread.name == "ApiKeyStoreRefresh":
+                thread.join(timeout=5)
+
+    def test_lookups_are_served_from_memory(self):
+        """The table is read from S3 once, then answered from memory."""
+        self.assertEqual(self.store.get("test-key"), {"total_requests": 0})
+        self.assertIsNone(self.store.get("unknown-key"))
+        self.assertEqual(self.s3_manager.load_encrypted_api_keys.call_count, 1)
+        self.s3_manager.load_encrypted_api_keys_if_modified.assert_not_called()
+
+    def test_refresh_after_ttl(self):
+        """An expired table is revalidated in the background with the last ETag."""
+        self.store.ttl = 0
+        self.s3_manager.load_encrypted_api_keys_if_modified.return_value = (
+            {"new-key": {}}, '"v2"')
+        self.store.get("test-key")
+        self.assertIsNotNone(self.store.get("test-key"))  # Served while refreshing
+        self.wait_for_refresh()
+        self.assertIsNotNone(self.store.get("new-key"))
+        self.wait_for_refresh()
+        self.assertEqual(
+            self.s3_manager.load_encrypted_api_keys_if_modified.call_args.args, ('"v2"',))
+
+        # Not modified, or S3 failing, keeps the table held
+        self.s3_manager.load_encrypted_api_keys_if_modified.return_value = None
+        self.store.table()
+        self.wait_for_refresh()
+        self.s3_manager.load_encrypted_api_keys_if_modified.side_effect = Exception("S3 down")
+        self.store.table()
+        self.wait_for_refresh()
+        self.assertIsNotNone(self.store.get("new-key"))
+
+    def test_invalidate(self):
+        """An invalidated table is loaded again on the next lookup."""
+        self.store.get("test-key")
+        self.s3_manager.load_encrypted_api_keys.return_value = None
+        self.store.invalidate()
+        self.assertIsNone(self.store.get("test-key"))
+        self.assertEqual(self.s3_manager.load_encrypted_api_keys.call_count, 2)
+
+    def test_cached_never_reads_s3(self):
+        """`cached` answers None until the table is loaded, without loading it."""
+        self.assertIsNone(self.store.cached())
+        self.s3_manager.load_encrypted_api_keys.assert_not_called()
+        self.store.table()
+        self.assertIn("test-key", self.store.cached())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+from src.async_s3_manager import AsyncS3Manager, S3TimeoutError
+
+
+class TestAsyncS3Manager(unittest.TestCase):
+    """Test suite for the async facade over S3Manager."""
+
+    def setUp(self):
+        self.s3_manager = MagicMock()
+        self.manager = AsyncS3Manager(lambda: self.s3_manager, max_workers=8,
+                                      max_reads=4, max_writes=1,
+                                      read_timeout=1, write_timeout=1)
+
+    def tearDown(self):
+        self.manager.shutdown()
+
+    def test_calls_the_current_s3_manager(self):
+        """Calls go to the S3Manager returned by the provider, off the event loop."""
+        threads = []
+        self.s3_manager.load_ngrok_url.side_effect = lambda key: threads.append(
+            threading.current_thread()) or f"https://{key}.ngrok.io"
+        url = asyncio.run(self.manager.load_ngrok_url("test-key"))
+        self.assertEqual(url, "https://test-key.ngrok.io")
+        self.assertIsNot(threads[0], threading.main_thread())
+
+        self.s3_manager = MagicMock()
+        asyncio.run(self.manager.update_ngrok_url("test-key", None))
+        self.s3_manager.update_ngrok_url.assert_called_once_with("test-key", None)
+
+    def test_errors_propagate(self):
+        """Exceptions raised by S3Manager reach the caller."""
+        self.s3_manager.load_encrypted_api_keys.side_effect = ValueError("boom")
+        with self.assertRaises(ValueError):
+            asyncio.run(self.manager.load_encrypted_api_keys())
+
+    def test_slow_calls_overlap(self):
+        """Reads run side by side, up to the read limit."""
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def slow_read(key):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.1)
+            with lock:
+                active[0] -= 1
+            return key
+
+        self.s3_manager.load_ngrok_url.side_effect = slow_read
+
+        async def read_all():
+            return await asyncio.gather(
+                *(self.manager.load_ngrok_url(str(index)) for index in range(8)))
+
+        start = time.monotonic()
+        self.assertEqual(asyncio.run(read_all()), [str(index) for index in range(8)])
+        self.assertLess(time.monotonic() - start, 0.6)
+        self.assertEqual(peak[0], 4)
+
+    def test_timeout_keeps_the_slot(self):
+        """A timed-out write raises S3TimeoutError and holds its slot until it returns."""
+        self.manager.timeouts["write"] = 0.05
+        release = threading.Event()
+        self.s3_manager.store_encrypted_api_keys.side_effect = lambda keys: release.wait(5)
+
+        async def scenario():
+            with self.assertRaises(S3TimeoutError):
+                await self.manager.store_encrypted_api_keys({})
+            # The single write slot is still taken by the stuck call
+            with self.assertRaises(S3TimeoutError):
+                await self.manager.update_ngrok_url("test-key", None)
+            self.s3_manager.update_ngrok_url.assert_not_called()
+            release.set()
+            self.manager.timeouts["write"] = 1
+            await self.manager.update_ngrok_url("test-key", None)
+            self.s3_manager.update_ngrok_url.assert_called_once_with("test-key", None)
+
+        asyncio.run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
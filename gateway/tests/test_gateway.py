@@ -1,9 +1,13 @@
 import unittest
+import gzip
+import json
 from unittest.mock import patch, MagicMock
+from fastapi.responses import JSONResponse
 from fastapi.testclient import TestClient
 from gateway import GatewayAPI
 import datetime
-import requests
+import threading
+import httpx
 
 
 class TestGatewayAPI(unittest.TestCase):
@@ -53,9 +57,43 @@ class TestGatewayAPI(unittest.TestCase):
         # Set up S3 manager mock
         patcher = patch.object(self.gateway_instance, 's3_manager')
         self.mock_s3_manager = patcher.start()
-        self.mock_s3_manager.load_encrypted_api_keys.return_value = self.mock_s3_data
         self.mock_s3_manager.load_ngrok_url.side_effect = self.mock_ngrok_urls.get
+        self.use_key_table(self.mock_s3_manager, self.mock_s3_data)
         self.addCleanup(patcher.stop)
+        # Every test starts without the API key table or rate limits of the previous one
+        self.gateway_instance.api_key_store.invalidate()
+        self.gateway_instance.ngrok_url_cache.clear()
+        self.gateway_instance.ngrok_url_loaded_at.clear()
+        self.gateway_instance.rate_limiter.reset()
+
+        # Fake Core answering the Gateway's HTTP client
+        self.core_requests = []
+        self.core_reply = (200, {"json": {}})
+        self.core_error = None
+        self.install_fake_core(self.gateway_instance)
+
+    @staticmethod
+    def use_key_table(mock_s3_manager, table):
+        """Serve `table` as the stored API keys, applying table updates to it."""
+        mock_s3_manager.load_encrypted_api_keys.return_value = table
+        mock_s3_manager.update_encrypted_api_keys.side_effect = lambda update: update(table)
+
+    def install_fake_core(self, gateway_instance):
+        """Route the Gateway's requests to Core to a fake answering with `core_reply`."""
+        def handler(request):
+            self.core_requests.append(request)
+            if self.core_error is not None:
+                raise self.core_error
+            status_code, kwargs = self.core_reply
+            return httpx.Response(status_code, **kwargs)
+        gateway_instance.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    def reply(self, status_code=200, **kwargs):
+        """Set the response of the fake Core."""
+        self.core_reply = (status_code, kwargs)
+
+    def last_core_request(self):
+        return self.core_requests[-1]
 
     def test_health_check(self):
         """Test the root health check endpoint."""
@@ -63,14 +101,9 @@ class TestGatewayAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json(), {"message": "FastAPI is running"})
 
-    @patch('gateway.requests.get')
-    def test_get_file_structure(self, mock_get):
+    def test_get_file_structure(self):
         """Test the /files/structure endpoint."""
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
-            "structure": ["file1.py", "file2.py"]}
-        mock_get.return_value = mock_response
+        self.reply(json={"structure": ["file1.py", "file2.py"]})
 
         headers = {"x-api-key": "test-key"}
 
@@ -84,13 +117,155 @@ class TestGatewayAPI(unittest.TestCase):
         self.assertEqual(response.json(), {
                          "structure": ["file1.py", "file2.py"]})
 
-    @patch('gateway.requests.post')
-    def test_get_file_content(self, mock_post):
+    def test_get_file_structure_forwards_query_params(self):
+        """Test that subtree, depth and pagination parameters reach Core."""
+        self.reply(json={
+            "structure": {"src": {"files": ["app.py"], "directories": []}},
+            "next_cursor": None})
+
+        headers = {"x-api-key": "test-key"}
+        response = self.client.get(
+            "/files/structure?path=src&depth=2&limit=50&cursor=abc", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["next_cursor"], None)
+        self.assertEqual(dict(self.last_core_request().url.params), {
+            "path": "src", "depth": "2", "limit": "50", "cursor": "abc"})
+
+    def test_get_file_structure_passes_through_not_found(self):
+        """Test that Core's 404 for an unknown subtree is returned as is."""
+        self.reply(404, json={"error": "Directory not found: missing"})
+
+        headers = {"x-api-key": "test-key"}
+        response = self.client.get(
+            "/files/structure?path=missing", headers=headers)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {
+                         "error": "Directory not found: missing"})
+
+    def test_get_file_structure_not_modified(self):
+        """Test that If-None-Match reaches Core and its 304 is passed through."""
+        self.reply(304, headers={"ETag": '"abc"'})
+
+        headers = {"x-api-key": "test-key", "If-None-Match": '"abc"'}
+        response = self.client.get("/files/structure", headers=headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], '"abc"')
+        self.assertEqual(self.last_core_request().headers["If-None-Match"], '"abc"')
+
+    def test_get_file_content_etag(self):
+        """Test that Core's ETag is returned and its 304 is passed through."""
+        self.reply(json={"file1.py": {"content": "x = 1"}}, headers={"ETag": '"abc"'})
+
+        headers = {"x-api-key": "test-key"}
+        body = {"file_paths": ["file1.py"]}
+        response = self.client.post("/files/content", json=body, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["ETag"], '"abc"')
+
+        self.reply(304, headers={"ETag": '"abc"'})
+        headers["If-None-Match"] = '"abc"'
+        response = self.client.post("/files/content", json=body, headers=headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.last_core_request().headers["If-None-Match"], '"abc"')
+
+    def test_get_file_content_compressed_passthrough(self):
+        """Test that Core's gzip body reaches the client without being decoded."""
+        body = gzip.compress(b'{"file1.py": {"content": "x = 1"}}')
+        self.reply(content=body, headers={"Content-Encoding": "gzip",
+                                          "Content-Type": "application/json"})
+
+        headers = {"x-api-key": "test-key", "Accept-Encoding": "gzip"}
+        with patch('gateway.JSONResponse', wraps=JSONResponse) as json_response:
+            response = self.client.post(
+                "/files/content", json={"file_paths": ["file1.py"]}, headers=headers)
+            json_response.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.json(), {"file1.py": {"content": "x = 1"}})
+        self.assertEqual(self.last_core_request().headers["Accept-Encoding"], "gzip")
+
+    def test_search_files(self):
+        """Test that /files/search is proxied to Core, including its 400s."""
+        self.reply(json={"matches": [{"path": "app.py", "line": 3}], "truncated": False})
+
+        headers = {"x-api-key": "test-key"}
+        response = self.client.post(
+            "/files/search", json={"query": "load_config"}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["matches"][0]["line"], 3)
+        core_request = self.last_core_request()
+        self.assertTrue(core_request.url.path.endswith("/files/search"))
+        self.assertEqual(json.loads(core_request.content), {"query": "load_config"})
+
+        self.reply(400, json={"error": "'query' must be a non-empty string"})
+        response = self.client.post("/files/search", json={}, headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_grep_files(self):
+        """Test that /files/grep relays Core's NDJSON records."""
+        body = (b'{"type": "match", "path": "app.py", "line": 3}\n'
+                b'{"type": "summary", "files_scanned": 1}\n')
+        self.reply(content=body, headers={"Content-Type": "application/x-ndjson"})
+
+        headers = {"x-api-key": "test-key"}
+        with patch.object(self.gateway_instance, 'open_core_stream',
+                          wraps=self.gateway_instance.open_core_stream) as open_core_stream:
+            response = self.client.post(
+                "/files/grep", json={"query": "load_", "deadline_ms": 5000}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, body)
+        self.assertTrue(response.headers["content-type"].startswith("application/x-ndjson"))
+        _, kwargs = open_core_stream.call_args
+        self.assertEqual(kwargs["timeout"], self.gateway_instance.timeout + 5)
+
+    def test_symbol_endpoints(self):
+        """Test that the /symbols endpoints are forwarded to Core."""
+        self.reply(json={"symbols": [{"name": "load", "start_line": 6}]})
+
+        headers = {"x-api-key": "test-key"}
+        response = self.client.get("/symbols/search?query=load&kind=method", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["symbols"][0]["name"], "load")
+        core_request = self.last_core_request()
+        self.assertTrue(core_request.url.path.endswith("/symbols/search"))
+        self.assertEqual(dict(core_request.url.params), {"query": "load", "kind": "method"})
+
+        self.reply(404, json={"error": "Symbol not found: nope"})
+        response = self.client.get("/symbols/source?name=nope", headers=headers)
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(self.last_core_request().url.path.endswith("/symbols/source"))
+
+    def test_file_manifest(self):
+        """Test that /files/manifest is forwarded to Core with its path."""
+        self.reply(json={
+            "algorithm": "sha256",
+            "files": [{"path": "src/app.py", "size": 12, "mtime": 1.5, "hash": "ab12"}]})
+
+        response = self.client.get("/files/manifest?path=src",
+                                   headers={"x-api-key": "test-key"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["files"][0]["hash"], "ab12")
+        core_request = self.last_core_request()
+        self.assertTrue(core_request.url.path.endswith("/files/manifest"))
+        self.assertEqual(dict(core_request.url.params), {"path": "src"})
+
+    def test_file_changes(self):
+        """Test that /files/changes is forwarded to Core with its cursor."""
+        self.reply(json={
+            "changes": [{"seq": 11, "kind": "modified", "path": "src/app.py", "is_dir": False}],
+            "cursor": 11, "resync_required": False, "has_more": False})
+
+        response = self.client.get("/files/changes?since=10",
+                                   headers={"x-api-key": "test-key"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["cursor"], 11)
+        core_request = self.last_core_request()
+        self.assertTrue(core_request.url.path.endswith("/files/changes"))
+        self.assertEqual(dict(core_request.url.params), {"since": "10"})
+
+    def test_get_file_content(self):
         """Test the /files/content endpoint."""
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {"file1.py": "print('Hello World')"}
-        mock_post.return_value = mock_response
+        self.reply(json={"file1.py": "print('Hello World')"})
 
         headers = {"x-api-key": "test-key"}
         response = self.client.post(
@@ -198,16 +373,11 @@ class TestGatewayAPI(unittest.TestCase):
                 updated_url, self.gateway_instance.ngrok_url_cache.get("test-key", ""))
 
     @patch('gateway.GatewayAPI.update_ngrok_url_from_s3')
-    @patch('gateway.requests.get')
     @patch.dict('os.environ', {'API_KEYS': 'test-key,other-valid-key'})
-    def test_api_key_validator_middleware(self, mock_requests_get, mock_update_ngrok_urls):
+    def test_api_key_validator_middleware(self, mock_update_ngrok_urls):
         """Test the API key validator middleware using ngrok URL cache validation."""
-        # Set up a reusable mock response for requests.get to simulate the /files/structure endpoint
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
-            "structure": ["file1.py", "file2.py"]}
-        mock_requests_get.return_value = mock_response
+        # Answer the /files/structure requests from the fake Core
+        self.reply(json={"structure": ["file1.py", "file2.py"]})
 
         # Prevent the real method from updating URLs during the test
         mock_update_ngrok_urls.return_value = None
@@ -215,6 +385,7 @@ class TestGatewayAPI(unittest.TestCase):
         # Re-initialize the gateway instance after setting environment variables
         self.gateway_instance = GatewayAPI()
         self.client = TestClient(self.gateway_instance.app)
+        self.install_fake_core(self.gateway_instance)
 
         # Set up S3 manager mock for this test
         patcher = patch.object(self.gateway_instance, 's3_manager')
@@ -261,15 +432,19 @@ class TestGatewayAPI(unittest.TestCase):
 
             self.assertEqual(response.status_code, expected_status)
 
-    @patch('gateway.S3Manager.store_encrypted_api_keys')
-    @patch('gateway.S3Manager.load_encrypted_api_keys')
+        # The key table is read from S3 once and then validated in memory
+        mock_s3_manager.load_encrypted_api_keys.assert_called_once()
+        # Usage counters are flushed in batches, not per request
+        mock_s3_manager.update_encrypted_api_keys.assert_not_called()
+
+    @patch('gateway.S3Manager.update_encrypted_api_keys')
     @patch('gateway.S3Manager.update_ngrok_url')
-    def test_generate_api_key_initializes_ngrok_url(self, mock_update_ngrok_url, mock_load_keys, mock_store_keys):
+    def test_generate_api_key_initializes_ngrok_url(self, mock_update_ngrok_url, mock_update_keys):
         """Test that generating a new API key initializes an empty ngrok URL entry."""
         # Set up S3 manager mock for this test
         patcher = patch.object(self.gateway_instance, 's3_manager')
         mock_s3_manager = patcher.start()
-        mock_s3_manager.load_encrypted_api_keys.return_value = {
+        stored_keys = {
             "test-key": {
                 "created_at": "2024-02-14T10:00:00",
                 "last_used": None,
@@ -282,8 +457,7 @@ class TestGatewayAPI(unittest.TestCase):
                 "total_requests": 0
             }
         }
-        mock_s3_manager.store_encrypted_api_keys.return_value = {
-            "status": "success", "message": "API keys stored securely in S3"}
+        self.use_key_table(mock_s3_manager, stored_keys)
         mock_s3_manager.update_ngrok_url.return_value = {
             "status": "success", "message": "ngrok URL initialized for API key"}
         self.addCleanup(patcher.stop)
@@ -299,6 +473,8 @@ class TestGatewayAPI(unittest.TestCase):
         # Verify that update_ngrok_url was called with None
         new_key = response_data["api_key"]
         mock_s3_manager.update_ngrok_url.assert_called_once_with(new_key, None)
+        # The new key is added to the table without dropping the others
+        self.assertEqual(set(stored_keys), {"test-key", new_key})
 
     @patch('gateway.S3Manager.load_encrypted_api_keys')
     def test_key_expiration(self, mock_load_keys):
@@ -442,102 +618,101 @@ class TestGatewayAPI(unittest.TestCase):
     def test_s3_storage_error(self):
         """Test handling of S3 storage errors."""
         # Mock S3 storage to raise an exception
-        self.mock_s3_manager.store_encrypted_api_keys.side_effect = Exception(
+        self.mock_s3_manager.update_encrypted_api_keys.side_effect = Exception(
             "S3 error")
 
-        # Mock requests.get to return an error
-        with patch('requests.get') as mock_get:
-            mock_get.side_effect = requests.exceptions.RequestException(
-                "Connection error")
+        # Make Core unreachable
+        self.core_error = httpx.ConnectError("Connection error")
 
-            # Set up the test key with rate limit data
-            test_key = "test-key"
-            current_minute = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M")
-            self.mock_s3_data[test_key]["rate_limit"] = {
-                "requests_per_minute": 60,
-                "current_minute": current_minute,
-                "minute_requests": 30
-            }
+        # Set up the test key with rate limit data
+        test_key = "test-key"
+        current_minute = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M")
+        self.mock_s3_data[test_key]["rate_limit"] = {
+            "requests_per_minute": 60,
+            "current_minute": current_minute,
+            "minute_requests": 30
+        }
 
-            headers = {"x-api-key": test_key}
-            response = self.client.get("/files/structure", headers=headers)
-            self.assertEqual(response.status_code, 500)
-            self.assertEqual(response.json(), {
-                             "detail": "Error retrieving file structure: Connection error"})
+        headers = {"x-api-key": test_key}
+        response = self.client.get("/files/structure", headers=headers)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json(), {
+                         "detail": "Error retrieving file structure: Connection error"})
 
     def test_file_structure_request_error(self):
         """Test handling of errors in file structure requests."""
         headers = {"x-api-key": "test-key"}
-        with patch('requests.get') as mock_get:
-            mock_get.side_effect = requests.exceptions.RequestException(
-                "Connection error")
-            response = self.client.get("/files/structure", headers=headers)
-            self.assertEqual(response.status_code, 500)
-            self.assertEqual(response.json(), {
-                             "detail": "Error retrieving file structure: Connection error"})
+        self.core_error = httpx.ConnectError("Connection error")
+        response = self.client.get("/files/structure", headers=headers)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json(), {
+                         "detail": "Error retrieving file structure: Connection error"})
 
     def test_file_structure_invalid_response(self):
-        """Test handling of invalid response from file structure endpoint."""
+        """Test that Core's body is relayed without being parsed."""
         headers = {"x-api-key": "test-key"}
-        with patch('requests.get') as mock_get:
-            mock_response = MagicMock()
-            mock_response.status_code = 200
-            mock_response.json.side_effect = ValueError("Invalid JSON")
-            mock_get.return_value = mock_response
+        self.reply(content=b"Invalid JSON", headers={"Content-Type": "application/json"})
+        with patch('gateway.JSONResponse', wraps=JSONResponse) as json_response:
             response = self.client.get("/files/structure", headers=headers)
-            self.assertEqual(response.status_code, 500)
-            self.assertEqual(response.json(), {
-                             "detail": "Error updating ngrok URL"})
+            json_response.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"Invalid JSON")
+        self.assertEqual(response.headers["content-type"], "application/json")
 
     def test_file_content_invalid_response(self):
-        """Test handling of invalid response from file content endpoint."""
+        """Test handling of an error status from the file content endpoint."""
         headers = {"x-api-key": "test-key"}
-        with patch('requests.post') as mock_post:
-            mock_response = MagicMock()
-            mock_response.status_code = 200
-            mock_response.json.side_effect = ValueError("Invalid JSON")
-            mock_post.return_value = mock_response
-            response = self.client.post(
-                "/files/content",
-                json={"file_paths": ["test.py"]},
-                headers=headers
-            )
-            self.assertEqual(response.status_code, 500)
-            self.assertEqual(response.json(), {
-                             "detail": "Error updating ngrok URL"})
+        self.reply(502, content=b"Bad gateway")
+        response = self.client.post(
+            "/files/content",
+            json={"file_paths": ["test.py"]},
+            headers=headers
+        )
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json(), {
+                         "detail": "Error retrieving file content: Core answered 502"})
+
+    def test_file_content_decoded_for_plain_clients(self):
+        """A client without Accept-Encoding asks Core for identity and gets plain bytes."""
+        self.client.headers.pop("Accept-Encoding", None)
+        self.addCleanup(self.client.headers.update, {"Accept-Encoding": "gzip, deflate"})
+        self.reply(content=gzip.compress(b'{"file1.py": {"content": "x = 1"}}'),
+                   headers={"Content-Encoding": "gzip", "Content-Type": "application/json"})
+        response = self.client.post(
+            "/files/content", json={"file_paths": ["file1.py"]},
+            headers={"x-api-key": "test-key"})
+        self.assertEqual(self.last_core_request().headers["Accept-Encoding"], "identity")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.json(), {"file1.py": {"content": "x = 1"}})
 
     def test_file_content_missing_paths(self):
         """Test handling of missing file paths in content request."""
         headers = {"x-api-key": "test-key"}
         # Mock the update_ngrok_url_from_s3 method to avoid S3 calls
         with patch.object(self.gateway_instance, 'update_ngrok_url_from_s3') as mock_update:
-            with patch('requests.post') as mock_post:
-                # Set up the mock response
-                mock_response = MagicMock()
-                mock_response.status_code = 404
-                mock_response.text = "Not Found"
-                mock_response.json.return_value = {
-                    "detail": "No file paths provided"}
-                mock_post.return_value = mock_response
-
-                # Set up the mock update method
-                mock_update.return_value = None
-                self.gateway_instance.ngrok_url_cache["test-key"] = "https://example.ngrok.io"
-
-                # Make the request
-                response = self.client.post(
-                    "/files/content", json={}, headers=headers)
-                # Gateway passes through the response
-                self.assertEqual(response.status_code, 200)
-                self.assertEqual(response.json(), {
-                                 "detail": "No file paths provided"})
-
-                # Verify the mock was called correctly
-                mock_post.assert_called_once_with(
-                    "https://example.ngrok.io/files/content",
-                    json={},  # Empty JSON object is passed through
-                    timeout=self.gateway_instance.timeout
-                )
+            # Core rejects the request
+            self.reply(400, json={"error": "No file paths provided"})
+
+            # Set up the mock update method
+            mock_update.return_value = None
+            self.gateway_instance.ngrok_url_cache["test-key"] = "https://example.ngrok.io"
+
+            # Make the request
+            response = self.client.post(
+                "/files/content", json={}, headers=headers)
+            # Gateway passes through the response
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {
+                             "error": "No file paths provided"})
+
+            # Verify Core was called correctly
+            self.assertEqual(len(self.core_requests), 1)
+            core_request = self.last_core_request()
+            self.assertEqual(str(core_request.url), "https://example.ngrok.io/files/content")
+            # Empty JSON object is passed through
+            self.assertEqual(json.loads(core_request.content), {})
+            self.assertEqual(core_request.headers["Accept-Encoding"], "gzip, deflate")
 
     def test_ngrok_url_update_missing_data(self):
         """Test handling of missing data in ngrok URL update request."""
@@ -563,19 +738,43 @@ class TestGatewayAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 500)
         self.assertEqual(response.json(), {"detail": "Internal server error"})
 
+    def test_middleware_s3_timeout(self):
+        """A slow S3 answers 503 instead of holding the request."""
+        release = threading.Event()
+        self.mock_s3_manager.load_ngrok_url.side_effect = lambda key: release.wait(5)
+        timeouts = self.gateway_instance.async_s3.timeouts
+        with patch.dict(timeouts, {"read": 0.05}):
+            response = self.client.get("/files/structure", headers={"x-api-key": "test-key"})
+        release.set()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {"detail": "Storage timed out"})
+        self.assertEqual(self.core_requests, [])
+
+    def test_usage_flushed_off_the_event_loop_at_shutdown(self):
+        """The last usage flush at shutdown runs in the S3 thread pool."""
+        with patch.dict('os.environ', {'API_KEYS': 'test-key'}):
+            gateway_instance = GatewayAPI()
+        writers = []
+        with patch.object(gateway_instance, 's3_manager') as mock_s3_manager:
+            mock_s3_manager.update_encrypted_api_keys.side_effect = \
+                lambda update: writers.append(threading.current_thread().name)
+            with TestClient(gateway_instance.app):
+                gateway_instance.usage_flusher.record(
+                    "test-key", datetime.datetime(2024, 2, 14, 10, 1))
+        self.assertEqual(len(writers), 1)
+        self.assertTrue(writers[0].startswith("S3"))
+
     def test_file_content_request_error(self):
         """Test handling of errors in file content requests."""
         headers = {"x-api-key": "test-key"}
-        with patch('requests.post') as mock_post:
-            mock_post.side_effect = requests.exceptions.RequestException(
-                "Connection error")
-            response = self.client.post(
-                "/files/content",
-                json={"file_paths": ["test.py"]},
-                headers=headers
-            )
-            self.assertEqual(response.status_code, 500)
-            self.assertIn("error", response.json()["detail"].lower())
+        self.core_error = httpx.ConnectError("Connection error")
+        response = self.client.post(
+            "/files/content",
+            json={"file_paths": ["test.py"]},
+            headers=headers
+        )
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("error", response.json()["detail"].lower())
 
     def test_api_key_generation(self):
         """Test API key generation endpoint."""
@@ -585,6 +784,33 @@ class TestGatewayAPI(unittest.TestCase):
         generated_key = response.json()["api_key"]
         self.assertTrue(len(generated_key) > 0)
 
+    def test_ngrok_url_cached_until_ttl(self):
+        """The ngrok URL is read from S3 once per TTL, not on every request."""
+        headers = {"x-api-key": "test-key"}
+        for _ in range(3):
+            self.assertEqual(self.client.get("/files/structure", headers=headers).status_code, 200)
+        self.mock_s3_manager.load_ngrok_url.assert_called_once_with("test-key")
+
+        self.mock_ngrok_urls["test-key"] = "https://moved.ngrok.io"
+        with patch.object(self.gateway_instance, 'ngrok_url_ttl', 0):
+            self.client.get("/files/structure", headers=headers)
+        self.assertEqual(self.mock_s3_manager.load_ngrok_url.call_count, 2)
+        self.assertEqual(self.last_core_request().url.host, "moved.ngrok.io")
+
+    def test_ngrok_url_reloaded_after_connection_error(self):
+        """A tunnel that cannot be reached makes the next request read its URL again."""
+        headers = {"x-api-key": "test-key"}
+        self.client.get("/files/structure", headers=headers)
+        self.core_error = httpx.ConnectError("Connection refused")
+        self.assertEqual(self.client.get("/files/structure", headers=headers).status_code, 500)
+        self.assertEqual(self.mock_s3_manager.load_ngrok_url.call_count, 1)
+
+        self.core_error = None
+        self.mock_ngrok_urls["test-key"] = "https://moved.ngrok.io"
+        self.assertEqual(self.client.get("/files/structure", headers=headers).status_code, 200)
+        self.assertEqual(self.mock_s3_manager.load_ngrok_url.call_count, 2)
+        self.assertEqual(self.last_core_request().url.host, "moved.ngrok.io")
+
     def test_ngrok_url_cache_invalidation(self):
         """Test ngrok URL cache invalidation."""
         # Set up initial cache state
@@ -663,7 +889,7 @@ class TestGatewayAPI(unittest.TestCase):
         # Set up S3 manager mock
         patcher = patch.object(self.gateway_instance, 's3_manager')
         mock_s3_manager = patcher.start()
-        mock_s3_manager.load_encrypted_api_keys.return_value = {
+        self.use_key_table(mock_s3_manager, {
             test_key: test_key_data,
             "admin-key": {
                 "created_at": "2024-02-14T10:00:00",
@@ -676,7 +902,7 @@ class TestGatewayAPI(unittest.TestCase):
                 },
                 "total_requests": 0
             }
-        }
+        })
         self.addCleanup(patcher.stop)
 
         # Test successful self-purge by user
@@ -688,13 +914,13 @@ class TestGatewayAPI(unittest.TestCase):
         self.assertEqual(response_data["purged_data"]["total_requests"], 10)
 
         # Verify S3 manager calls for self-purge
-        mock_s3_manager.store_encrypted_api_keys.assert_called()
+        mock_s3_manager.update_encrypted_api_keys.assert_called()
         mock_s3_manager.update_ngrok_url.assert_called_with(test_key, None)
 
         # Reset call counts and mock data
-        mock_s3_manager.store_encrypted_api_keys.reset_mock()
+        mock_s3_manager.update_encrypted_api_keys.reset_mock()
         mock_s3_manager.update_ngrok_url.reset_mock()
-        mock_s3_manager.load_encrypted_api_keys.return_value = {
+        self.use_key_table(mock_s3_manager, {
             test_key: test_key_data,
             "admin-key": {
                 "created_at": "2024-02-14T10:00:00",
@@ -707,7 +933,7 @@ class TestGatewayAPI(unittest.TestCase):
                 },
                 "total_requests": 0
             }
-        }
+        })
 
         # Test successful purge by admin
         headers = {"x-api-key": "admin-key"}
@@ -718,7 +944,7 @@ class TestGatewayAPI(unittest.TestCase):
         self.assertEqual(response_data["purged_data"]["total_requests"], 10)
 
         # Verify S3 manager calls
-        mock_s3_manager.store_encrypted_api_keys.assert_called()
+        mock_s3_manager.update_encrypted_api_keys.assert_called()
         mock_s3_manager.update_ngrok_url.assert_called_with(test_key, None)
 
     @patch.dict('os.environ', {'ADMIN_API_KEY': 'admin-key'})
@@ -742,10 +968,10 @@ class TestGatewayAPI(unittest.TestCase):
         # Set up S3 manager mock
         patcher = patch.object(self.gateway_instance, 's3_manager')
         mock_s3_manager = patcher.start()
-        mock_s3_manager.load_encrypted_api_keys.return_value = {
+        self.use_key_table(mock_s3_manager, {
             test_key: test_key_data,
             other_key: test_key_data
-        }
+        })
         self.addCleanup(patcher.stop)
 
         # Test with another user's key (not admin, not self)
@@ -766,7 +992,7 @@ class TestGatewayAPI(unittest.TestCase):
         # Set up S3 manager mock
         patcher = patch.object(self.gateway_instance, 's3_manager')
         mock_s3_manager = patcher.start()
-        mock_s3_manager.load_encrypted_api_keys.return_value = {
+        self.use_key_table(mock_s3_manager, {
             "admin-key": {
                 "created_at": "2024-02-14T10:00:00",
                 "last_used": None,
@@ -778,7 +1004,7 @@ class TestGatewayAPI(unittest.TestCase):
                 },
                 "total_requests": 0
             }
-        }
+        })
         self.addCleanup(patcher.stop)
 
         # Test attempt to purge admin key
@@ -794,7 +1020,7 @@ class TestGatewayAPI(unittest.TestCase):
         # Set up S3 manager mock
         patcher = patch.object(self.gateway_instance, 's3_manager')
         mock_s3_manager = patcher.start()
-        mock_s3_manager.load_encrypted_api_keys.return_value = {}
+        self.use_key_table(mock_s3_manager, {})
         self.addCleanup(patcher.stop)
 
         # Test purge of non-existent key
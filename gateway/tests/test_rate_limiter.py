@@ -0,0 +1,95 @@
+import copy
+import datetime
+import unittest
+from unittest.mock import MagicMock
+from src.rate_limiter import RateLimiter
+from src.usage_flusher import UsageFlusher
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test suite for the token-bucket rate limiter."""
+
+    def test_bucket_refills_at_the_limit_rate(self):
+        """A full bucket allows a burst up to the limit, then one request per refill."""
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock)
+        for _ in range(3):
+            self.assertIsNone(limiter.acquire("key", 3))
+        self.assertAlmostEqual(limiter.acquire("key", 3), 20.0)
+        clock.now = 20.0
+        self.assertIsNone(limiter.acquire("key", 3))
+        self.assertIsNotNone(limiter.acquire("key", 3))
+
+    def test_bucket_seeded_from_persisted_usage(self):
+        """Requests already made this minute are taken from a new bucket."""
+        limiter = RateLimiter(clock=FakeClock())
+        self.assertIsNone(limiter.acquire("key", 2, used=1))
+        self.assertIsNotNone(limiter.acquire("key", 2, used=1))
+        limiter.reset("key")
+        self.assertIsNotNone(limiter.acquire("key", 2, used=2))
+
+
+class TestUsageFlusher(unittest.TestCase):
+    """Test suite for the batched usage counters."""
+
+    def setUp(self):
+        self.s3_manager = MagicMock()
+        stored = {"key": {"total_requests": 5, "last_used": None,
+                          "rate_limit": {"requests_per_minute": 60,
+                                         "current_minute": "2024-02-14 10:00",
+                                         "minute_requests": 3}}}
+        self.written = []
+        self.write_error = None
+
+        def update(apply):
+            # Every update starts from a fresh copy of the table, like S3
+            if self.write_error is not None:
+                raise self.write_error
+            table = copy.deepcopy(stored)
+            apply(table)
+            self.written.append(table)
+
+        self.s3_manager.update_encrypted_api_keys.side_effect = update
+        self.flusher = UsageFlusher(lambda: self.s3_manager, interval=3600)
+
+    def test_flush_aggregates_counters(self):
+        """Pending requests are added to the stored counters in one write."""
+        when = datetime.datetime(2024, 2, 14, 10, 0, 30)
+        for _ in range(4):
+            self.flusher.record("key", when)
+        self.flusher.record("purged-key", when)
+        self.assertEqual(self.written, [])
+
+        self.assertEqual(self.flusher.flush(), 5)
+        stored = self.written[-1]
+        self.assertEqual(stored["key"]["total_requests"], 9)
+        self.assertEqual(stored["key"]["last_used"], when.isoformat())
+        self.assertEqual(stored["key"]["rate_limit"]["minute_requests"], 7)
+        self.assertNotIn("purged-key", stored)
+        self.assertEqual(self.flusher.flush(), 0)
+        self.flusher.stop()
+
+    def test_failed_flush_is_retried(self):
+        """Counters that could not be written are kept for the next flush."""
+        self.flusher.record("key", datetime.datetime(2024, 2, 14, 10, 1))
+        self.write_error = Exception("S3 down")
+        self.assertEqual(self.flusher.flush(), 0)
+        self.write_error = None
+        self.flusher.record("key", datetime.datetime(2024, 2, 14, 10, 1))
+        self.assertEqual(self.flusher.flush(), 2)
+        stored = self.written[-1]
+        self.assertEqual(stored["key"]["rate_limit"]["current_minute"], "2024-02-14 10:01")
+        self.assertEqual(stored["key"]["rate_limit"]["minute_requests"], 2)
+        self.flusher.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
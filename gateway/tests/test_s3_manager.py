@@ -125,6 +125,58 @@ class TestS3Manager(unittest.TestCase):
             with self.assertRaises(ClientError):
                 self.s3_manager.load_encrypted_api_keys()
 
+    def test_load_encrypted_api_keys_if_modified(self):
+        """Test conditional loading of the API keys with the object's ETag."""
+        with patch.object(self.s3_manager, 's3_client', new_callable=MagicMock) as mock_s3_client:
+            body = MagicMock()
+            body.read.return_value = b'{"test-key": "legacy-value"}'
+            mock_s3_client.get_object.return_value = {'Body': body, 'ETag': '"v1"'}
+
+            api_keys, etag = self.s3_manager.load_encrypted_api_keys_if_modified()
+            self.assertEqual(etag, '"v1"')
+            self.assertEqual(api_keys['test-key']['total_requests'], 0)
+            self.assertNotIn('IfNoneMatch', mock_s3_client.get_object.call_args.kwargs)
+
+            # An unchanged object is not downloaded again
+            mock_s3_client.get_object.side_effect = ClientError(
+                {'Error': {'Code': '304', 'Message': 'Not Modified'}}, 'GetObject')
+            self.assertIsNone(self.s3_manager.load_encrypted_api_keys_if_modified('"v1"'))
+            self.assertEqual(mock_s3_client.get_object.call_args.kwargs['IfNoneMatch'], '"v1"')
+
+    def test_update_encrypted_api_keys(self):
+        """Test that table updates are conditional writes, retried on conflicts."""
+        with patch.object(self.s3_manager, 's3_client', new_callable=MagicMock) as mock_s3_client:
+            versions = iter([(b'{"old-key": {}}', '"v1"'), (b'{"other-key": {}}', '"v2"')])
+
+            def get_object(**kwargs):
+                raw, etag = next(versions)
+                body = MagicMock()
+                body.read.return_value = raw
+                return {'Body': body, 'ETag': etag}
+
+            mock_s3_client.get_object.side_effect = get_object
+            # Another writer changes the table between the first read and write
+            mock_s3_client.put_object.side_effect = [ClientError(
+                {'Error': {'Code': 'PreconditionFailed', 'Message': 'At least one of the '
+                           'pre-conditions you specified did not hold'}}, 'PutObject'), {}]
+
+            def add_key(api_keys):
+                api_keys['new-key'] = {}
+                return len(api_keys)
+
+            self.assertEqual(self.s3_manager.update_encrypted_api_keys(add_key), 2)
+            first, second = mock_s3_client.put_object.call_args_list
+            self.assertEqual(first.kwargs['IfMatch'], '"v1"')
+            self.assertEqual(second.kwargs['IfMatch'], '"v2"')
+            self.assertEqual(set(json.loads(second.kwargs['Body'])), {'other-key', 'new-key'})
+
+            # A table that does not exist yet is only created if still missing
+            mock_s3_client.get_object.side_effect = ClientError(
+                {'Error': {'Code': 'NoSuchKey', 'Message': 'Not found'}}, 'GetObject')
+            mock_s3_client.put_object.side_effect = None
+            self.s3_manager.update_encrypted_api_keys(add_key)
+            self.assertEqual(mock_s3_client.put_object.call_args.kwargs['IfNoneMatch'], '*')
+
     def test_store_encrypted_api_keys(self):
         """Test storing encrypted API keys in S3."""
         with patch.object(self.s3_manager, 's3_client', new_callable=MagicMock) as mock_s3_client: